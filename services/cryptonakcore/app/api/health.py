@@ -2,6 +2,7 @@
 
 from fastapi import APIRouter
 from app.core.config import settings
+from app.db.session import sqlite_pragmas
 
 router = APIRouter()
 
@@ -22,5 +23,12 @@ async def health():
         "broker_mode": settings.BROKER_MODE,
         "oms_enabled": settings.OMS_ENABLED,
         "database_url": settings.DATABASE_URL,
+        "db_engine_profile": settings.DB_ENGINE_PROFILE,
+        "db_sqlite_pragmas": (
+            sqlite_pragmas()
+            if settings.DB_ENGINE_PROFILE == "production"
+            and settings.DATABASE_URL.startswith("sqlite")
+            else None
+        ),
         "audit_log_path": settings.AUDIT_LOG_PATH,
     }
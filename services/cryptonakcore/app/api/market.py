@@ -1,13 +1,13 @@
 from fastapi import APIRouter
-from app.services.market import set_market_price, get_market_price
+from app.services.market import DEFAULT_SYMBOL, set_market_price, get_market_price
 
 router = APIRouter()
 
 @router.post("/price/{value}")
-def update_price(value: float):
-    set_market_price(value)
-    return {"new_market_price": value}
+def update_price(value: float, symbol: str = DEFAULT_SYMBOL):
+    set_market_price(value, symbol)
+    return {"symbol": symbol, "new_market_price": value}
 
 @router.get("/price")
-def read_price():
-    return {"market_price": get_market_price()}
+def read_price(symbol: str = DEFAULT_SYMBOL):
+    return {"symbol": symbol, "market_price": get_market_price(symbol)}
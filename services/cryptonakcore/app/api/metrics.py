@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Response
+
+from app.core.metrics import CONTENT_TYPE, registry
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+def read_metrics():
+    """
+    Metriche in formato testo Prometheus: latenze (richieste HTTP, tick del
+    watcher, commit DB, scritture audit), contatori di segnali, blocchi di
+    rischio, aperture/chiusure e posizioni aperte.
+    """
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from app.db.session import SessionLocal
-from app.db.models import Order as OrderModel, Position as PositionModel
+from app.api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_page
+from app.db.session import get_db
+from app.db.models import Order as OrderModel
+from app.services.export import MEDIA_TYPES, stream_table
+from app.services.oms import create_order_with_position
 
 router = APIRouter()
 
@@ -19,6 +25,11 @@ class OrderRequest(BaseModel):
     sl_price: float | None = None  # Stop Loss
     order_type: str = "market"
 
+    # Contesto opzionale (come BounceSignal), salvato su ordine e posizione
+    exchange: str | None = None
+    timeframe_min: int | None = None
+    strategy: str | None = None
+
 
 
 class OrderResponse(BaseModel):
@@ -30,67 +41,119 @@ class OrderResponse(BaseModel):
     tp_price: float | None
     sl_price: float | None
     status: str
+    exchange: str | None = None
+    timeframe_min: int | None = None
+    strategy: str | None = None
 
     class Config:
         from_attributes = True
 
 
-# ---------- Dependency DB ----------
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # ---------- Endpoints ----------
 
 @router.post("/", response_model=OrderResponse)
-async def create_order(order: OrderRequest, db: Session = Depends(get_db)):
+def create_order(order: OrderRequest, db: Session = Depends(get_db)):
     """
     Crea un ordine 'paper' nel DB
     e apre una posizione con lo stesso simbolo/side/qty/entry_price,
-    propagando TP/SL.
+    propagando TP/SL (stessa transazione, posizione collegata all'ordine).
     """
-
-    # 1) salva l'ordine con TP/SL
-    db_order = OrderModel(
+    opened = create_order_with_position(
+        db,
         symbol=order.symbol,
         side=order.side,
         qty=order.qty,
-        order_type=order.order_type,
+        entry_price=order.entry_price,
         tp_price=order.tp_price,
         sl_price=order.sl_price,
-        status="created",
+        order_type=order.order_type,
+        exchange=order.exchange,
+        timeframe_min=order.timeframe_min,
+        strategy=order.strategy,
     )
-    db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
 
-    # 2) crea anche una posizione aperta con TP/SL
-    db_position = PositionModel(
+    # risposta dai dati già noti: nessuna SELECT dopo il commit
+    return OrderResponse(
+        id=opened.order_id,
         symbol=order.symbol,
         side=order.side,
         qty=order.qty,
-        entry_price=order.entry_price,
+        order_type=order.order_type,
         tp_price=order.tp_price,
         sl_price=order.sl_price,
-        status="open",
+        status="created",
+        exchange=order.exchange,
+        timeframe_min=order.timeframe_min,
+        strategy=order.strategy,
     )
-    db.add(db_position)
-    db.commit()
-
-    return db_order
 
 
 
 
 @router.get("/", response_model=list[OrderResponse])
-async def list_orders(db: Session = Depends(get_db)):
+def list_orders(
+    response: Response,
+    status: str | None = None,
+    symbol: str | None = None,
+    side: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    cursor: int | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    all_rows: bool = Query(False, alias="all"),
+    db: Session = Depends(get_db),
+):
     """
-    Restituisce tutti gli ordini (più recenti per primi).
+    Restituisce gli ordini (più recenti per primi) con filtri e paginazione
+    keyset sull'id (vedi GET /positions per cursor / X-Next-Cursor).
+
+    - filtri: status, symbol, side, since/until su created_at
+    - all=true: lista completa senza paginazione (comportamento storico)
+    """
+    q = db.query(OrderModel)
+
+    if status is not None:
+        q = q.filter(OrderModel.status == status)
+    if symbol is not None:
+        q = q.filter(OrderModel.symbol == symbol)
+    if side is not None:
+        q = q.filter(OrderModel.side == side)
+    if since is not None:
+        q = q.filter(OrderModel.created_at >= since)
+    if until is not None:
+        q = q.filter(OrderModel.created_at < until)
+
+    if all_rows:
+        return q.order_by(OrderModel.id.desc()).all()
+
+    return keyset_page(q, OrderModel.id, response, cursor, limit, order)
+
+
+@router.get("/export")
+def export_orders(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    status: str | None = None,
+    symbol: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+):
     """
-    orders = db.query(OrderModel).order_by(OrderModel.id.desc()).all()
-    return orders
+    Export in streaming di tutti gli ordini (NDJSON o CSV), ordinati per id.
+    """
+    table = OrderModel.__table__
+    filters = []
+    if status is not None:
+        filters.append(table.c.status == status)
+    if symbol is not None:
+        filters.append(table.c.symbol == symbol)
+    if since is not None:
+        filters.append(table.c.created_at >= since)
+    if until is not None:
+        filters.append(table.c.created_at < until)
+
+    return StreamingResponse(
+        stream_table(table, format, filters),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="orders.{format}"'},
+    )
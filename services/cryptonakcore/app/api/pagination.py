@@ -0,0 +1,39 @@
+from fastapi import Response
+from sqlalchemy.orm import Query
+
+# Header con il cursore per la pagina successiva (assente sull'ultima pagina)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def keyset_page(
+    query: Query,
+    id_column,
+    response: Response,
+    cursor: int | None,
+    limit: int,
+    order: str = "desc",
+) -> list:
+    """
+    Paginazione keyset sull'id: ritorna al massimo `limit` righe dopo `cursor`
+    (id escluso) nell'ordine richiesto e, se ci sono altre righe, mette l'id
+    dell'ultima riga nell'header X-Next-Cursor.
+    """
+    if order == "asc":
+        if cursor is not None:
+            query = query.filter(id_column > cursor)
+        query = query.order_by(id_column.asc())
+    else:
+        if cursor is not None:
+            query = query.filter(id_column < cursor)
+        query = query.order_by(id_column.desc())
+
+    rows = query.limit(limit + 1).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = str(rows[-1].id)
+
+    return rows
@@ -1,12 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 
-from app.db.session import SessionLocal
+from app.api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_page
+from app.core.metrics import DB_COMMIT_SECONDS
+from app.db.session import get_db
 from app.db.models import Position as PositionModel
 from datetime import datetime
 
-from app.services.market_simulator import MarketSimulator
+from app.services.export import MEDIA_TYPES, stream_table
+from app.services.market import get_close_price
+from app.services.oms import register_closed_position
+from app.services.pnl_rollups import record_closes
+from app.services.position_events import position_events
+from app.services.watcher_lease import lease_coordination
 
 
 router = APIRouter()
@@ -24,6 +33,10 @@ class PositionResponse(BaseModel):
     sl_price: float | None
     status: str
 
+    order_id: int | None = None  # ordine che ha aperto la posizione
+    exchange: str | None = None
+    timeframe_min: int | None = None
+    strategy: str | None = None
     created_at: datetime | None = None
     closed_at: datetime | None = None
     close_price: float | None = None
@@ -34,28 +47,86 @@ class PositionResponse(BaseModel):
         from_attributes = True
 
 
-# ------------ Dependency DB ------------
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # ------------ Endpoints ------------
 
 @router.get("/", response_model=list[PositionResponse])
-async def list_positions(db: Session = Depends(get_db)):
+def list_positions(
+    response: Response,
+    status: str | None = None,
+    symbol: str | None = None,
+    side: str | None = None,
+    close_reason: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    cursor: int | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    all_rows: bool = Query(False, alias="all"),
+    db: Session = Depends(get_db),
+):
+    """
+    Lista posizioni (aperte + chiuse) con filtri e paginazione keyset sull'id.
+
+    - filtri: status, symbol, side, close_reason (auto_close_reason),
+      since/until su created_at
+    - pagina: `limit` righe dopo `cursor`; l'header X-Next-Cursor contiene
+      il cursore della pagina successiva (assente sull'ultima)
+    - all=true: lista completa senza paginazione (comportamento storico)
+    """
+    q = db.query(PositionModel)
+
+    if status is not None:
+        q = q.filter(PositionModel.status == status)
+    if symbol is not None:
+        q = q.filter(PositionModel.symbol == symbol)
+    if side is not None:
+        q = q.filter(PositionModel.side == side)
+    if close_reason is not None:
+        q = q.filter(PositionModel.auto_close_reason == close_reason)
+    if since is not None:
+        q = q.filter(PositionModel.created_at >= since)
+    if until is not None:
+        q = q.filter(PositionModel.created_at < until)
+
+    if all_rows:
+        return q.all()
+
+    return keyset_page(q, PositionModel.id, response, cursor, limit, order)
+
+
+@router.get("/export")
+def export_positions(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    status: str | None = None,
+    symbol: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+):
     """
-    Lista tutte le posizioni aperte (per ora lista completa).
+    Export in streaming di tutte le posizioni (NDJSON o CSV), ordinate per id.
+    Le righe vengono lette dal DB a batch e inviate man mano: la memoria
+    resta costante qualunque sia la dimensione dello storico.
     """
-    positions = db.query(PositionModel).all()
-    return positions
+    table = PositionModel.__table__
+    filters = []
+    if status is not None:
+        filters.append(table.c.status == status)
+    if symbol is not None:
+        filters.append(table.c.symbol == symbol)
+    if since is not None:
+        filters.append(table.c.created_at >= since)
+    if until is not None:
+        filters.append(table.c.created_at < until)
+
+    return StreamingResponse(
+        stream_table(table, format, filters),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="positions.{format}"'},
+    )
+
 
 @router.post("/{position_id}/close", response_model=PositionResponse)
-async def close_position(position_id: int, db: Session = Depends(get_db)):
+def close_position(position_id: int, db: Session = Depends(get_db)):
     """
     Chiude una posizione manualmente:
     - status -> 'closed'
@@ -71,9 +142,8 @@ async def close_position(position_id: int, db: Session = Depends(get_db)):
         # è già chiusa, restituiamo comunque l'oggetto
         return position
 
-    # Prezzo corrente dal market simulator
-    price = MarketSimulator.get_price(position.symbol)
-    current_price = float(price)
+    # Prezzo corrente: lo stesso visto dal watcher nel tick
+    current_price = get_close_price(position.symbol)
 
     # Calcolo PnL
     entry = float(position.entry_price)
@@ -89,17 +159,41 @@ async def close_position(position_id: int, db: Session = Depends(get_db)):
         is_long = True
 
     if is_long:
-        position.pnl = (current_price - entry) * qty
+        pnl = (current_price - entry) * qty
     else:
-        position.pnl = (entry - current_price) * qty
+        pnl = (entry - current_price) * qty
+
+    closed_at = datetime.utcnow()
+
+    # UPDATE condizionale: se il watcher l'ha chiusa nel frattempo (TP/SL)
+    # la sua chiusura resta quella valida e qui non si registra nulla
+    table = PositionModel.__table__
+    result = db.execute(
+        update(table)
+        .where(table.c.id == position_id, table.c.status == "open")
+        .values(
+            status="closed",
+            closed_at=closed_at,
+            close_price=current_price,
+            pnl=pnl,
+            auto_close_reason="manual",
+        )
+    )
+    if result.rowcount != 1:
+        db.rollback()
+        db.refresh(position)
+        return position
 
-    # Aggiorniamo stato e metadati di chiusura
-    position.status = "closed"
-    position.closed_at = datetime.utcnow()
-    position.close_price = current_price
-    position.auto_close_reason = "manual"
+    record_closes(
+        db,
+        [(closed_at, position.symbol, "long" if is_long else "short", pnl)],
+    )
+    if lease_coordination():
+        position_events.add_closes(db, [(position.id, position.symbol, pnl, "manual")])
 
-    db.commit()
+    with DB_COMMIT_SECONDS.time("manual_close"):
+        db.commit()
     db.refresh(position)
+    register_closed_position(position.id, position.symbol, pnl, "manual")
     return position
 
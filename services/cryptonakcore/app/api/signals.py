@@ -1,15 +1,34 @@
+from dataclasses import dataclass
 from datetime import datetime
 import logging
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from app.db.session import SessionLocal
-from app.db.models import Order as OrderModel, Position as PositionModel
-from app.services.audit import log_bounce_signal
+from app.core.metrics import DB_COMMIT_SECONDS, SIGNALS_RECEIVED
+from app.db.session import get_db
+from app.services.audit import LOG_PATH, log_bounce_signal
+from app.services.export import MEDIA_TYPES, stream_audit
 from app.core.config import settings
-from app.services.oms import _normalize_side, check_risk_limits
+from app.services.oms import (
+    OpenedOrder,
+    _normalize_side,
+    add_order_with_position,
+    check_risk_limits,
+    compute_tp_sl,
+    register_opened_position,
+)
+from app.services.risk_counters import open_position_counters
+from app.services.signal_dedup import (
+    find_responses,
+    new_receipt,
+    signal_key,
+    signal_key_locks,
+    signal_response_cache,
+)
 
 
 router = APIRouter()
@@ -36,33 +55,39 @@ class BounceSignal(BaseModel):
     tp_pct: float | None = None
     sl_pct: float | None = None
 
+    # Id univoco del segnale lato mittente (opzionale): se presente è la
+    # chiave di idempotenza, altrimenti si usano symbol/side/timestamp/...
+    signal_id: str | None = None
 
-# --------- Dependency DB ---------
 
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# --------- Pipeline segnale ---------
 
 
-# --------- Endpoint ---------
+@dataclass
+class _OpenPlan:
+    """Segnale accettato (rischio ok, slot prenotato): cosa aprire."""
+    symbol: str
+    side: str
+    qty: float
+    entry_price: float
+    tp_price: float | None
+    sl_price: float | None
+    notional_usdt: float
+    exchange: str
+    timeframe_min: int
+    strategy: str
 
 
-@router.post("/bounce")
-async def receive_bounce_signal(
-    signal: BounceSignal,
-    db: Session = Depends(get_db),
-):
+def _evaluate_signal(signal: BounceSignal) -> tuple[_OpenPlan | None, dict | None]:
     """
-    Riceve un segnale Bounce:
-    - lo logga su file JSONL
-    - se OMS_ENABLED=True e i limiti di rischio lo permettono,
-      crea un ordine + posizione paper
+    Passi 1-5 di /signals/bounce: audit, controlli OMS/side/rischio, TP/SL.
+
+    Ritorna (plan, None) se il segnale va aperto (slot di rischio prenotato),
+    oppure (None, response) con la risposta da restituire così com'è.
     """
 
+    SIGNALS_RECEIVED.inc()
+
     # 1) Log su audit (sempre)
     payload = signal.model_dump(mode="json")
     log_bounce_signal(payload)
@@ -87,7 +112,7 @@ async def receive_bounce_signal(
                 "side": signal.side,
             }
         )
-        return {
+        return None, {
             "received": True,
             "oms_enabled": False,
             "risk_ok": False,
@@ -107,7 +132,7 @@ async def receive_bounce_signal(
                 "raw_side": signal.side,
             }
         )
-        return {
+        return None, {
             "received": True,
             "oms_enabled": True,
             "risk_ok": False,
@@ -118,8 +143,8 @@ async def receive_bounce_signal(
     notional_usdt = entry_price * qty
 
     # 4) Controllo limiti di rischio base (numero posizioni aperte + size per posizione)
+    #    (se ok, uno slot per il simbolo resta prenotato fino a confirm/release)
     risk_ok, risk_reason = check_risk_limits(
-        db,
         symbol=signal.symbol,
         entry_price=entry_price,
         qty=qty,
@@ -137,7 +162,7 @@ async def receive_bounce_signal(
                 "notional_usdt": notional_usdt,
             }
         )
-        return {
+        return None, {
             "received": True,
             "oms_enabled": True,
             "risk_ok": False,
@@ -148,18 +173,12 @@ async def receive_bounce_signal(
     tp_pct = signal.tp_pct if signal.tp_pct is not None else DEFAULT_TP_PCT
     sl_pct = signal.sl_pct if signal.sl_pct is not None else DEFAULT_SL_PCT
 
-    tp_price: float | None
-    sl_price: float | None
-
-    if side == "long":
-        tp_price = entry_price * (1.0 + tp_pct / 100.0)
-        sl_price = entry_price * (1.0 - sl_pct / 100.0) if sl_pct is not None else None
-    elif side == "short":
-        tp_price = entry_price * (1.0 - tp_pct / 100.0)
-        sl_price = entry_price * (1.0 + sl_pct / 100.0) if sl_pct is not None else None
+    if side in ("long", "short"):
+        tp_price, sl_price = compute_tp_sl(side, entry_price, tp_pct, sl_pct)
     else:
         # Questo blocco dovrebbe essere teoricamente irraggiungibile perché filtriamo sopra,
         # ma lo lasciamo per sicurezza.
+        open_position_counters.release(signal.symbol)
         logger.info(
             {
                 "event": "bounce_invalid_side_post_tp_sl",
@@ -167,62 +186,283 @@ async def receive_bounce_signal(
                 "raw_side": signal.side,
             }
         )
-        return {
+        return None, {
             "received": True,
             "oms_enabled": True,
             "risk_ok": False,
             "error": "invalid_side",
         }
 
-    # 6) Crea ordine paper
-    db_order = OrderModel(
-        symbol=signal.symbol,
-        side=side,
-        qty=qty,
-        order_type="market",
-        tp_price=tp_price,
-        sl_price=sl_price,
-        status="created",
+    return (
+        _OpenPlan(
+            symbol=signal.symbol,
+            side=side,
+            qty=qty,
+            entry_price=entry_price,
+            tp_price=tp_price,
+            sl_price=sl_price,
+            notional_usdt=notional_usdt,
+            exchange=signal.exchange,
+            timeframe_min=signal.timeframe_min,
+            strategy=signal.strategy,
+        ),
+        None,
     )
-    db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
 
-    # 7) Crea posizione paper associata
-    db_position = PositionModel(
+
+def _idempotency_key(signal: BounceSignal) -> str | None:
+    if not settings.SIGNAL_IDEMPOTENCY_ENABLED:
+        return None
+    return signal_key(
         symbol=signal.symbol,
-        side=side,
-        qty=qty,
-        entry_price=entry_price,
-        tp_price=tp_price,
-        sl_price=sl_price,
-        status="open",
+        side=signal.side,
+        timestamp=signal.timestamp,
+        strategy=signal.strategy,
+        exchange=signal.exchange,
+        timeframe_min=signal.timeframe_min,
+        signal_id=signal.signal_id,
     )
-    db.add(db_position)
-    db.commit()
-    db.refresh(db_position)
 
+
+def _log_duplicate(signal: BounceSignal) -> None:
     logger.info(
         {
-            "event": "bounce_order_created",
+            "event": "bounce_duplicate",
             "symbol": signal.symbol,
-            "side": side,
-            "order_id": db_order.id,
-            "position_id": db_position.id,
-            "tp_price": tp_price,
-            "sl_price": sl_price,
-            "entry_price": entry_price,
-            "qty": qty,
-            "notional_usdt": notional_usdt,
+            "side": signal.side,
+            "signal_id": signal.signal_id,
         }
     )
 
+
+def _created_payload(opened: OpenedOrder, plan: _OpenPlan) -> dict:
     return {
         "received": True,
         "oms_enabled": True,
         "risk_ok": True,
-        "order_id": db_order.id,
-        "position_id": db_position.id,
-        "tp_price": tp_price,
-        "sl_price": sl_price,
+        "order_id": opened.order_id,
+        "position_id": opened.position_id,
+        "tp_price": plan.tp_price,
+        "sl_price": plan.sl_price,
     }
+
+
+def _order_created_response(plan: _OpenPlan, opened: OpenedOrder) -> dict:
+    """Log + risposta per un ordine/posizione appena committati."""
+    logger.info(
+        {
+            "event": "bounce_order_created",
+            "symbol": plan.symbol,
+            "side": plan.side,
+            "order_id": opened.order_id,
+            "position_id": opened.position_id,
+            "tp_price": plan.tp_price,
+            "sl_price": plan.sl_price,
+            "entry_price": plan.entry_price,
+            "qty": plan.qty,
+            "notional_usdt": plan.notional_usdt,
+        }
+    )
+
+    return _created_payload(opened, plan)
+
+
+def _add_order_with_position(db: Session, plan: _OpenPlan) -> OpenedOrder:
+    return add_order_with_position(
+        db,
+        symbol=plan.symbol,
+        side=plan.side,
+        qty=plan.qty,
+        entry_price=plan.entry_price,
+        tp_price=plan.tp_price,
+        sl_price=plan.sl_price,
+        exchange=plan.exchange,
+        timeframe_min=plan.timeframe_min,
+        strategy=plan.strategy,
+    )
+
+
+def _receive_signal(signal: BounceSignal, key: str | None, db: Session) -> dict:
+    """Passi 1-8 di /signals/bounce per un segnale non trovato in cache."""
+    plan, response = _evaluate_signal(signal)
+    if plan is None:
+        if key is not None:
+            # niente da inserire: un ripetuto (es. uscito dalla cache) si
+            # riconosce solo dalla ricevuta del primo invio
+            previous = find_responses(db, [key]).get(key)
+            if previous is not None:
+                _log_duplicate(signal)
+                return previous
+            signal_response_cache.put(key, response)
+        return response
+
+    try:
+        # 6-7) Ordine paper + posizione collegata (un flush)
+        opened = _add_order_with_position(db, plan)
+
+        # 8) Ricevuta del segnale nella stessa transazione (chiave unica)
+        if key is not None:
+            db.add(new_receipt(key, _created_payload(opened, plan)))
+
+        with DB_COMMIT_SECONDS.time("signal"):
+            db.commit()
+    except IntegrityError:
+        db.rollback()
+        open_position_counters.release(plan.symbol)
+        # stesso segnale committato da una richiesta concorrente
+        previous = find_responses(db, [key]).get(key) if key is not None else None
+        if previous is None:
+            raise
+        _log_duplicate(signal)
+        return previous
+    except Exception:
+        db.rollback()
+        open_position_counters.release(plan.symbol)
+        raise
+
+    register_opened_position(opened.entry, reserved=True)
+
+    response = _order_created_response(plan, opened)
+    if key is not None:
+        signal_response_cache.put(key, response)
+    return response
+
+
+# --------- Endpoint ---------
+
+
+@router.post("/bounce")
+def receive_bounce_signal(
+    signal: BounceSignal,
+    db: Session = Depends(get_db),
+):
+    """
+    Riceve un segnale Bounce:
+    - lo logga su file JSONL
+    - se OMS_ENABLED=True e i limiti di rischio lo permettono,
+      crea un ordine + posizione paper
+
+    Idempotente: se lo stesso segnale (signal_id, oppure stessi symbol/side/
+    timestamp/strategy/exchange/timeframe_min) è già arrivato, ritorna la
+    risposta originale senza riaprire nulla (dalla cache, senza DB).
+    Se non è in cache si inserisce direttamente: la chiave unica della
+    ricevuta fa fallire il commit di un ripetuto (IntegrityError).
+    Nello stesso processo i ripetuti concorrenti aspettano il primo invio.
+    """
+
+    key = _idempotency_key(signal)
+    if key is None:
+        return _receive_signal(signal, None, db)
+
+    previous = signal_response_cache.get(key)
+    if previous is not None:
+        _log_duplicate(signal)
+        return previous
+
+    with signal_key_locks.hold(key):
+        # mentre aspettavamo il primo invio potrebbe averla messa in cache
+        previous = signal_response_cache.get(key)
+        if previous is not None:
+            _log_duplicate(signal)
+            return previous
+        return _receive_signal(signal, key, db)
+
+
+@router.post("/bounce/batch")
+def receive_bounce_signals_batch(
+    signals: list[BounceSignal],
+    db: Session = Depends(get_db),
+):
+    """
+    Riceve una lista di segnali Bounce (es. tutti quelli di una candela 5m).
+
+    I segnali vengono valutati in ordine con le stesse regole di
+    /signals/bounce (i limiti di rischio vedono anche quelli accettati
+    prima nel batch); ordini e posizioni accettati vengono creati in
+    un'unica transazione. Ritorna una risposta per segnale, identica a
+    quella che si otterrebbe inviandoli uno alla volta (anche per i
+    segnali ripetuti, nel batch o già ricevuti prima).
+    """
+
+    keys = [_idempotency_key(signal) for signal in signals]
+    known = find_responses(db, [k for k in keys if k is not None])
+
+    results: list[dict | None] = []
+    accepted: list[tuple[int, _OpenPlan, OpenedOrder]] = []
+    reserved: list[_OpenPlan] = []
+    # chiave -> indice della prima risposta nel batch; (indice, indice originale)
+    first_in_batch: dict[str, int] = {}
+    repeats: list[tuple[int, int]] = []
+
+    try:
+        for signal, key in zip(signals, keys):
+            if key is not None:
+                if key in known:
+                    _log_duplicate(signal)
+                    results.append(known[key])
+                    continue
+                if key in first_in_batch:
+                    _log_duplicate(signal)
+                    repeats.append((len(results), first_in_batch[key]))
+                    results.append(None)
+                    continue
+                first_in_batch[key] = len(results)
+
+            plan, response = _evaluate_signal(signal)
+            if plan is None:
+                results.append(response)
+                continue
+
+            reserved.append(plan)
+
+            # flush per avere gli id nello stesso ordine dell'invio singolo
+            opened = _add_order_with_position(db, plan)
+
+            if key is not None:
+                db.add(new_receipt(key, _created_payload(opened, plan)))
+
+            accepted.append((len(results), plan, opened))
+            results.append(None)
+
+        with DB_COMMIT_SECONDS.time("signal_batch"):
+            db.commit()
+    except Exception as exc:
+        db.rollback()
+        for plan in reserved:
+            open_position_counters.release(plan.symbol)
+        if isinstance(exc, IntegrityError):
+            # un segnale del batch è stato committato nel frattempo da un'altra
+            # richiesta: rinviando il batch si ottengono le risposte originali
+            raise HTTPException(
+                status_code=409,
+                detail="duplicate signal committed concurrently, retry the batch",
+            ) from exc
+        raise
+
+    for idx, plan, opened in accepted:
+        register_opened_position(opened.entry, reserved=True)
+        results[idx] = _order_created_response(plan, opened)
+
+    for idx, original in repeats:
+        results[idx] = results[original]
+
+    for key, idx in first_in_batch.items():
+        signal_response_cache.put(key, results[idx])
+
+    return results
+
+
+@router.get("/export")
+def export_signals(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    since: datetime | None = None,
+):
+    """
+    Export in streaming dei segnali salvati nel file audit JSONL
+    (file corrente + file ruotati, anche compressi), filtrabili per `since`.
+    """
+    return StreamingResponse(
+        stream_audit(LOG_PATH, format, since),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="bounce_signals.{format}"'},
+    )
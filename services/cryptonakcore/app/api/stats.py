@@ -1,22 +1,22 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime
+import logging
+import math
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
-from app.db.session import SessionLocal
-from app.db.models import Position as PositionModel
+from app.db.session import get_db
+from app.services.oms import _normalize_side
+from app.services.pnl_rollups import timeseries
+from app.services.stats_aggregator import (
+    BREAKDOWN_DIMENSIONS,
+    stats_accumulator,
+    stats_breakdown_cache,
+)
 
 router = APIRouter()
-
-
-# ---------- Dependency DB ----------
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+logger = logging.getLogger("stats")
 
 
 # ---------- Pydantic models ----------
@@ -38,94 +38,114 @@ class StatsResponse(BaseModel):
     avg_pnl_loss: float | None = None   # PnL medio delle perdenti
 
 
+class BreakdownGroup(StatsResponse):
+    # valori delle dimensioni del gruppo, es. {"symbol": "BTCUSDT", "strategy": "..."}
+    group: dict[str, str | int | None]
+
+
+class BreakdownResponse(BaseModel):
+    by: list[str]
+    groups: list[BreakdownGroup]
+
+
+class TimeseriesPoint(BaseModel):
+    bucket_start: datetime   # inizio del bucket (UTC)
+    trades: int              # trade chiusi nel bucket
+    wins: int
+    losses: int
+    pnl: float               # PnL realizzato nel bucket
+    winrate: float           # percentuale tra 0 e 100
+    equity: float            # PnL realizzato cumulativo a fine bucket
+
+
+class TimeseriesResponse(BaseModel):
+    bucket: str
+    symbol: str | None
+    side: str | None
+    points: list[TimeseriesPoint]
+
+
 
 # ---------- Endpoint ----------
 
 @router.get("/", response_model=StatsResponse)
-async def get_stats(db: Session = Depends(get_db)):
+def get_stats(
+    recompute: bool = False,
+    db: Session = Depends(get_db),
+):
     """
     Statistiche base sulle posizioni paper.
+
+    Di default legge l'aggregato in memoria (O(1), aggiornato ad ogni
+    apertura/chiusura). Con ?recompute=true ricalcola tutto dal DB,
+    riallinea l'aggregato e logga l'eventuale differenza.
     """
 
-    total_positions = db.query(PositionModel).count()
-
-    open_positions = (
-        db.query(PositionModel)
-        .filter(PositionModel.status == "open")
-        .count()
-    )
-
-    closed_positions = (
-        db.query(PositionModel)
-        .filter(PositionModel.status == "closed")
-        .count()
-    )
-
-    # Somma PnL (se None, trattiamo come 0)
-    total_pnl = db.query(func.coalesce(func.sum(PositionModel.pnl), 0.0)).scalar() or 0.0
-
-    # Trade chiusi vincenti / perdenti (pnl > 0 / pnl < 0)
-    winning_trades = (
-        db.query(PositionModel)
-        .filter(PositionModel.status == "closed", PositionModel.pnl > 0)
-        .count()
-    )
-
-    losing_trades = (
-        db.query(PositionModel)
-        .filter(PositionModel.status == "closed", PositionModel.pnl < 0)
-        .count()
-    )
-
-    # Conteggio chiusure per TP/SL
-    tp_count = (
-        db.query(PositionModel)
-        .filter(PositionModel.auto_close_reason == "tp")
-        .count()
-    )
-
-    sl_count = (
-        db.query(PositionModel)
-        .filter(PositionModel.auto_close_reason == "sl")
-        .count()
-    )
-
-    # ------- Metriche derivate -------
-
-    # Winrate in percentuale (solo sui trade chiusi)
-    if closed_positions > 0:
-        winrate = (winning_trades / closed_positions) * 100.0
-        avg_pnl_per_trade = total_pnl / closed_positions
-    else:
-        winrate = 0.0
-        avg_pnl_per_trade = 0.0
-
-    # PnL medio delle vincenti
-    avg_pnl_win = (
-        db.query(func.avg(PositionModel.pnl))
-        .filter(PositionModel.status == "closed", PositionModel.pnl > 0)
-        .scalar()
-    )
-
-    # PnL medio delle perdenti
-    avg_pnl_loss = (
-        db.query(func.avg(PositionModel.pnl))
-        .filter(PositionModel.status == "closed", PositionModel.pnl < 0)
-        .scalar()
-    )
-
-    return StatsResponse(
-        total_positions=total_positions,
-        open_positions=open_positions,
-        closed_positions=closed_positions,
-        total_pnl=float(total_pnl),
-        winning_trades=winning_trades,
-        losing_trades=losing_trades,
-        tp_count=tp_count,
-        sl_count=sl_count,
-        winrate=winrate,
-        avg_pnl_per_trade=avg_pnl_per_trade,
-        avg_pnl_win=float(avg_pnl_win) if avg_pnl_win is not None else None,
-        avg_pnl_loss=float(avg_pnl_loss) if avg_pnl_loss is not None else None,
-    )
+    if not recompute:
+        return StatsResponse(**stats_accumulator.snapshot())
+
+    before = stats_accumulator.snapshot()
+    after = stats_accumulator.rebuild(db)
+
+    drift = {
+        key: (before[key], after[key])
+        for key in after
+        if not _same_value(before[key], after[key])
+    }
+    if drift:
+        logger.warning({"event": "stats_drift", "drift": drift})
+
+    return StatsResponse(**after)
+
+
+@router.get("/breakdown", response_model=BreakdownResponse)
+def get_stats_breakdown(
+    by: str = "symbol",
+    db: Session = Depends(get_db),
+):
+    """
+    Statistiche di /stats per gruppo, es. ?by=symbol,strategy,exchange
+    (dimensioni: symbol, side, strategy, exchange, timeframe_min).
+
+    Tutti i gruppi vengono calcolati con una sola query GROUP BY; il
+    risultato resta in cache fino alla prossima apertura/chiusura.
+    """
+    dims = tuple(dict.fromkeys(d.strip() for d in by.split(",") if d.strip()))
+    unknown = [d for d in dims if d not in BREAKDOWN_DIMENSIONS]
+    if not dims or unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"invalid 'by': use a comma-separated subset of {', '.join(BREAKDOWN_DIMENSIONS)}",
+        )
+
+    groups = stats_breakdown_cache.get(db, dims)
+    return BreakdownResponse(by=list(dims), groups=groups)
+
+
+@router.get("/timeseries", response_model=TimeseriesResponse)
+def get_stats_timeseries(
+    bucket: str = Query("1d", pattern="^(1h|1d)$"),
+    symbol: str | None = None,
+    side: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    db: Session = Depends(get_db),
+):
+    """
+    PnL realizzato, numero di trade, winrate ed equity cumulativa per bucket
+    (1h / 1d) sulle chiusure, filtrabili per symbol, side e since/until.
+
+    Letto dai rollup aggiornati ad ogni chiusura (tabella pnl_rollups),
+    non dalla tabella positions: il costo non cresce con lo storico trade.
+    """
+    if side is not None:
+        side = _normalize_side(side)
+
+    points = timeseries(db, bucket, symbol=symbol, side=side, since=since, until=until)
+    return TimeseriesResponse(bucket=bucket, symbol=symbol, side=side, points=points)
+
 
+def _same_value(a, b) -> bool:
+    if isinstance(a, float) and isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+    return a == b
@@ -9,6 +9,21 @@ BASE_DIR = Path(__file__).resolve().parents[2]
 
 class Settings(BaseSettings):
     DATABASE_URL: str = "sqlite:///./cryptonakcore_loms.db"
+
+    # Profilo engine DB:
+    #   - "default"    = engine base (come in origine)
+    #   - "production" = pool dimensionato + PRAGMA SQLite qui sotto (WAL, ecc.)
+    DB_ENGINE_PROFILE: str = "default"
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT_SEC: float = 30.0
+
+    # PRAGMA SQLite (solo profilo "production")
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"          # con WAL è sicuro contro crash dell'app
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
     JWT_SECRET: str = "dev-secret"
 
     # Ambiente logico del servizio: dev / paper / live (per ora usiamo dev/paper)
@@ -26,9 +41,86 @@ class Settings(BaseSettings):
     MAX_OPEN_POSITIONS_PER_SYMBOL: int = 3    # per singolo symbol
     MAX_SIZE_PER_POSITION_USDT: float = 10.0  # size massima per posizione (paper)
 
+    # Position watcher (auto-close TP/SL):
+    #   - "poll" = loop che ricontrolla tutto ogni POSITION_WATCHER_INTERVAL_SEC
+    #   - "push" = tick di prezzo su coda asyncio, valutati appena arrivano
+    #   - "sharded" = simboli partizionati (hash) su WATCHER_SHARDS processi,
+    #     ognuno con le sue posizioni e il suo feed prezzi; le chiusure tornano
+    #     su una coda a un solo writer DB nel processo API, con i prezzi del
+    #     tick (usati anche dalle chiusure manuali e da /market/price)
+    POSITION_WATCHER_MODE: str = "poll"
+    POSITION_WATCHER_INTERVAL_SEC: float = 1.0
+    WATCHER_SHARDS: int = 0  # 0 = un processo per core
+
+    # Valutazione TP/SL nel tick:
+    #   - "book"     = soglie ordinate per (symbol, side), simbolo per simbolo
+    #   - "columnar" = tutto il book in array NumPy, poche operazioni vettoriali
+    AUTO_CLOSE_EVALUATOR: str = "book"
+
+    # In modalità "push" / "sharded" (paper) il feed simulato produce un tick
+    # per simbolo ogni PRICE_FEED_INTERVAL_SEC
+    PRICE_FEED_INTERVAL_SEC: float = 0.25
+
+    # Validità (secondi) dello snapshot prezzi per simbolo: nella finestra
+    # watcher e chiusure manuali vedono lo stesso prezzo (0 = nuovo fetch ad ogni tick)
+    PRICE_SNAPSHOT_TTL_SEC: float = 1.0
+
+    # Simulatore di mercato paper (un processo per simbolo):
+    #   - MARKET_SIM_MODEL: "gbm" o "random_walk"
+    #   - volatilità / drift per tick (0.005 = 0.5%)
+    #   - MARKET_SIM_SEED: seed per sequenze riproducibili (None = casuale)
+    #   - tick generati in anticipo a blocchi NumPy di MARKET_SIM_BLOCK_SIZE
+    MARKET_SIM_MODEL: str = "gbm"
+    MARKET_SIM_INITIAL_PRICE: float = 100.0
+    MARKET_SIM_VOLATILITY: float = 0.005
+    MARKET_SIM_DRIFT: float = 0.0
+    MARKET_SIM_SEED: int | None = None
+    MARKET_SIM_BLOCK_SIZE: int = 4096
+
+    # Coordinamento del watcher con più worker uvicorn sullo stesso DB:
+    #   - "none"  = un solo worker: il processo avvia il proprio watcher
+    #   - "lease" = da usare solo con --workers > 1: esegue l'auto-close solo il
+    #     worker che detiene il lease su DB (rinnovo ogni WATCHER_LEASE_RENEW_SEC,
+    #     failover dopo WATCHER_LEASE_TTL_SEC) e le sue chiusure committano solo
+    #     se il lease è ancora suo; aperture/chiusure vengono scritte anche in
+    #     position_events e ogni WATCHER_BOOK_SYNC_SEC ogni worker applica quelle
+    #     degli altri a book, contatori di rischio e /stats (i limiti
+    #     MAX_OPEN_POSITIONS* valgono per worker fino al giro successivo)
+    WATCHER_COORDINATION: str = "none"
+    WATCHER_LEASE_TTL_SEC: float = 10.0
+    WATCHER_LEASE_RENEW_SEC: float = 3.0
+    WATCHER_BOOK_SYNC_SEC: float = 1.0
+    WATCHER_EVENTS_RETENTION_SEC: float = 3600.0
+
+    # Ogni quanti secondi i contatori di rischio in memoria vengono
+    # riallineati con il DB (0 = solo allo startup)
+    RISK_RECONCILE_INTERVAL_SEC: float = 60.0
+
+    # Idempotenza di /signals/bounce: un segnale ripetuto (stesso signal_id,
+    # oppure stessi symbol/side/timestamp/strategy/exchange/timeframe_min)
+    # riceve la risposta originale. Cache LRU in memoria + indice unico su DB.
+    SIGNAL_IDEMPOTENCY_ENABLED: bool = True
+    SIGNAL_DEDUP_CACHE_SIZE: int = 10000
+    SIGNAL_DEDUP_TTL_SEC: float = 3600.0
+    # Le ricevute su DB più vecchie di SIGNAL_RECEIPT_RETENTION_SEC vengono
+    # cancellate ogni SIGNAL_RECEIPT_PURGE_INTERVAL_SEC (0 = mai): dopo, un
+    # segnale ripetuto viene trattato come nuovo
+    SIGNAL_RECEIPT_RETENTION_SEC: float = 7 * 24 * 3600.0
+    SIGNAL_RECEIPT_PURGE_INTERVAL_SEC: float = 3600.0
+
     # file dove salviamo i segnali di bounce in formato JSON Lines
     AUDIT_LOG_PATH: str = str(BASE_DIR / "data" / "bounce_signals.jsonl")
 
+    # Writer audit in background: coda bounded, flush/fsync periodici
+    AUDIT_QUEUE_MAX_SIZE: int = 10000
+    AUDIT_FLUSH_INTERVAL_SEC: float = 0.2
+    AUDIT_FSYNC_INTERVAL_SEC: float = 1.0    # 0 = fsync ad ogni flush
+
+    # Rotazione del file audit: "none" / "size" / "daily"
+    AUDIT_ROTATE: str = "none"
+    AUDIT_ROTATE_MAX_BYTES: int = 50 * 1024 * 1024
+    AUDIT_ROTATE_COMPRESS: bool = False       # gzip dei file ruotati
+
     class Config:
         env_file = ".env"
 
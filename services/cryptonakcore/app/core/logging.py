@@ -1,18 +1,112 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import queue
 import sys
-import json
+
+try:  # encoder veloce opzionale
+    import orjson
+except ImportError:  # pragma: no cover - fallback su json della stdlib
+    orjson = None
+
+
+def _dumps(obj: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, default=str).decode("utf-8")
+    return json.dumps(obj, default=str)
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Una riga JSON per record. Se il messaggio è un dict (es.
+    logger.info({"event": ..., ...})) i suoi campi diventano campi
+    della riga, invece di finire stringificati dentro "message".
+    """
+
+    def format(self, record):
+        log = {
+            "level": record.levelname,
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "logger": record.name,
+        }
+
+        if isinstance(record.msg, dict):
+            for key, value in record.msg.items():
+                # level/time/logger restano quelli del record
+                log.setdefault(key, value)
+        else:
+            log["message"] = record.getMessage()
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            log["exc_info"] = record.exc_text
+
+        return _dumps(log)
+
+
+class _DictQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler che NON formatta nel thread chiamante: il dict del messaggio
+    viaggia così com'è e formattazione + encoding JSON avvengono nel thread
+    del QueueListener. Qui si risolvono solo args e traceback (non picklabili
+    / legati al frame corrente).
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if not isinstance(record.msg, dict):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: logging.handlers.QueueListener | None = None
+
 
 def setup_logging():
-    class JSONFormatter(logging.Formatter):
-        def format(self, record):
-            log = {
-                "level": record.levelname,
-                "message": record.getMessage(),
-                "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
-                "logger": record.name,
-            }
-            return json.dumps(log)
+    """
+    Logging JSON non bloccante: i logger dell'app accodano i record su una
+    coda in memoria (unbounded, nessuna riga scartata) e un QueueListener
+    in un thread dedicato li scrive su stdout. stop_logging() svuota la coda.
+    """
+    global _listener
+    if _listener is not None:
+        return
 
     handler = logging.StreamHandler(sys.stdout)
     handler.setFormatter(JSONFormatter())
-    logging.basicConfig(level=logging.INFO, handlers=[handler])
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    logging.basicConfig(level=logging.INFO, handlers=[_DictQueueHandler(log_queue)], force=True)
+
+
+def stop_logging():
+    """
+    Scrive tutti i record ancora in coda e ferma il listener (shutdown);
+    da qui in poi il root logger scrive in modo sincrono.
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+
+    # eventuali log successivi (es. fine shutdown) vanno scritti direttamente
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        if isinstance(h, _DictQueueHandler):
+            root.removeHandler(h)
+    for h in _listener.handlers:
+        root.addHandler(h)
+        h.flush()
+
+    _listener = None
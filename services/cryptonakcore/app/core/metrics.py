@@ -0,0 +1,259 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import threading
+import time
+from typing import Callable, Optional
+
+# Bucket di default per le latenze (secondi): da 0.1 ms a 10 s
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    ]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    """Contatore monotono, opzionalmente con label (valori posizionali)."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, value: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + value
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labelnames:
+            items = [((), 0.0)]
+        for labels, value in items:
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            )
+        return lines
+
+
+class Gauge(_Metric):
+    """Valore istantaneo letto al momento dello scrape da una callback."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], float]) -> None:
+        super().__init__(name, help_text)
+        self._callback = callback
+
+    def render(self) -> list[str]:
+        return self._header() + [f"{self.name} {_format_value(self._callback())}"]
+
+
+class Histogram(_Metric):
+    """
+    Istogramma a bucket fissi. observe() costa una bisect e qualche
+    incremento sotto lock (ordine del microsecondo); i bucket cumulativi
+    vengono calcolati solo allo scrape.
+    """
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [conteggi per bucket (+Inf in coda), somma, conteggio]
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[labels] = series
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        """Misura la durata del blocco `with`."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        with self._lock:
+            items = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items())
+        for labels, (counts, total, n) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+                )
+            lbl = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{lbl} {_format_value(total)}")
+            lines.append(f"{self.name}_count{lbl} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Tutte le metriche nel formato testo di Prometheus (0.0.4)."""
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ---------- metriche del LOMS ----------
+
+HTTP_REQUEST_SECONDS = registry.register(
+    Histogram(
+        "loms_http_request_duration_seconds",
+        "Durata delle richieste HTTP per route",
+        ("method", "route", "status"),
+    )
+)
+WATCHER_TICK_SECONDS = registry.register(
+    Histogram("loms_watcher_tick_duration_seconds", "Durata di un tick di auto-close TP/SL")
+)
+DB_COMMIT_SECONDS = registry.register(
+    Histogram("loms_db_commit_duration_seconds", "Durata dei commit DB per operazione", ("op",))
+)
+AUDIT_WRITE_SECONDS = registry.register(
+    Histogram("loms_audit_write_duration_seconds", "Durata della scrittura di un batch audit JSONL")
+)
+
+SIGNALS_RECEIVED = registry.register(
+    Counter("loms_signals_received_total", "Segnali bounce ricevuti")
+)
+RISK_BLOCKS = registry.register(
+    Counter("loms_risk_blocks_total", "Segnali bloccati dai limiti di rischio", ("scope",))
+)
+POSITIONS_OPENED = registry.register(
+    Counter("loms_positions_opened_total", "Posizioni aperte")
+)
+POSITIONS_CLOSED = registry.register(
+    Counter("loms_positions_closed_total", "Posizioni chiuse per motivo", ("reason",))
+)
+AUDIT_ENTRIES_DROPPED = registry.register(
+    Counter("loms_audit_entries_dropped_total", "Righe audit JSONL perse per motivo", ("reason",))
+)
+
+
+def register_open_positions_gauge(callback: Callable[[], float]) -> None:
+    registry.register(Gauge("loms_open_positions", "Posizioni aperte in questo momento", callback))
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI che misura la durata di ogni richiesta HTTP.
+    La route è il template (es. /positions/{position_id}/close), non il path
+    effettivo, così la cardinalità delle label resta bassa.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status: Optional[int] = None
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                _route_template(scope),
+                str(status or 500),
+            )
+
+
+def _route_template(scope) -> str:
+    """
+    Template completo della route (prefisso del router incluso).
+
+    A seconda della versione di FastAPI, scope["route"] può avere il path
+    relativo al router incluso: il prefisso si ricava dalla parte iniziale
+    del path effettivo che precede il match della route.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    regex = getattr(route, "path_regex", None)
+    if template is None or regex is None:
+        return "unmatched"
+
+    path = scope.get("path", "")
+    i = 0
+    while i != -1:
+        if regex.match(path[i:]):
+            return path[:i] + template
+        i = path.find("/", i + 1)
+    return template
@@ -1,24 +1,273 @@
 import asyncio
+from datetime import datetime, timedelta
+import logging
+import os
+import time
+
 from fastapi import FastAPI
 from sqlalchemy.orm import Session
+
+from app.core.config import settings
 from app.db.session import SessionLocal
-from app.services.oms import auto_close_positions
+from app.services.oms import (
+    apply_shard_closes,
+    auto_close_positions,
+    close_triggered_positions,
+    sync_in_memory_state,
+)
+from app.services.position_book import position_book
+from app.services.position_events import position_events
+from app.services.price_feed import price_tick_bus
+from app.services.price_snapshot import price_snapshot
+from app.services.risk_counters import open_position_counters
+from app.services.shard_watcher import sharded_watcher
+from app.services.signal_dedup import purge_receipts
+from app.services.watcher_lease import watcher_lease
+
+logger = logging.getLogger("scheduler")
+
+
+def _run_with_session(fn, *args):
+    """Esegue fn(db, *args) con una Session dedicata (chiamato in un thread)."""
+    db: Session = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
 
 
 async def position_watcher():
-    """Loop infinito per controllare le posizioni ogni 1 secondo."""
+    """Loop infinito per controllare le posizioni ogni POSITION_WATCHER_INTERVAL_SEC."""
+    while True:
+        # il lavoro sul DB gira in un thread: l'event loop resta libero
+        try:
+            await asyncio.to_thread(_run_with_session, auto_close_positions)
+        except Exception:
+            # es. "database is locked": le posizioni restano nel book e
+            # vengono rivalutate al prossimo giro, il task non deve morire
+            logger.exception({"event": "watcher_tick_failed", "mode": "poll"})
+
+        await asyncio.sleep(settings.POSITION_WATCHER_INTERVAL_SEC)
+
+
+async def tick_watcher():
+    """
+    Consumer dei tick di prezzo (modalità "push"):
+    appena arriva un tick valuta solo le posizioni aperte di quel simbolo.
+    """
+    while True:
+        prices = await price_tick_bus.next_batch()
+        if not prices:
+            continue
+
+        try:
+            await asyncio.to_thread(_run_with_session, close_triggered_positions, prices)
+        except Exception:
+            # le posizioni restano nel book: le rivaluta il prossimo tick del simbolo
+            logger.exception(
+                {"event": "watcher_tick_failed", "mode": "push", "symbols": len(prices)}
+            )
+
+
+async def simulated_price_feed():
+    """
+    Feed di prezzi paper per la modalità "push": pubblica sul bus un tick
+    dallo snapshot prezzi per ogni simbolo con posizioni aperte.
+    Con un broker reale questo task sarà sostituito dallo stream dell'exchange.
+    """
     while True:
-        db: Session = SessionLocal()
+        prices = price_snapshot.get_many(position_book.symbols())
+        for symbol, price in prices.items():
+            price_tick_bus.publish(symbol, price)
+
+        await asyncio.sleep(settings.PRICE_FEED_INTERVAL_SEC)
+
+
+async def shard_close_writer():
+    """
+    Modalità "sharded": avvia i processi shard e fa da unico writer DB
+    per le chiusure che arrivano dalla loro coda. Se il task viene
+    cancellato (es. lease perso) gli shard vengono fermati.
+    """
+    n_shards = settings.WATCHER_SHARDS or os.cpu_count() or 1
+    await asyncio.to_thread(
+        sharded_watcher.start, position_book, n_shards, settings.PRICE_FEED_INTERVAL_SEC
+    )
+    try:
+        while True:
+            closes = await asyncio.to_thread(sharded_watcher.collect, 0.5)
+            if closes:
+                try:
+                    await asyncio.to_thread(_run_with_session, apply_shard_closes, closes)
+                except Exception:
+                    # gli shard le hanno già tolte dal loro book: vanno
+                    # restituite, altrimenti non verrebbero più valutate
+                    logger.exception({"event": "shard_closes_failed", "closes": len(closes)})
+                    sharded_watcher.requeue([c["pos_id"] for c in closes])
+            try:
+                await asyncio.to_thread(sharded_watcher.ensure_alive)
+            except Exception:
+                logger.exception({"event": "shard_restart_failed"})
+    finally:
+        # join dei processi in un thread: l'event loop continua a servire HTTP
+        await asyncio.to_thread(sharded_watcher.stop)
+
+
+async def risk_reconciler():
+    """Riallinea periodicamente i contatori di rischio in memoria con il DB."""
+    while True:
+        await asyncio.sleep(settings.RISK_RECONCILE_INTERVAL_SEC)
+
         try:
-            auto_close_positions(db)
-        finally:
-            db.close()
+            drift = await asyncio.to_thread(_run_with_session, open_position_counters.reconcile)
+        except Exception:
+            # es. "database is locked": si riprova al prossimo giro
+            logger.exception({"event": "risk_reconcile_failed"})
+            continue
+
+        if drift:
+            logger.warning({"event": "risk_counters_drift", "drift": drift})
 
-        await asyncio.sleep(1)  # 1 secondo
+
+async def receipt_purger():
+    """Cancella periodicamente le ricevute dei segnali oltre la retention."""
+    while True:
+        await asyncio.sleep(settings.SIGNAL_RECEIPT_PURGE_INTERVAL_SEC)
+
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.SIGNAL_RECEIPT_RETENTION_SEC)
+        try:
+            purged = await asyncio.to_thread(_run_with_session, purge_receipts, cutoff)
+        except Exception:
+            logger.exception({"event": "signal_receipts_purge_failed"})
+            continue
+
+        if purged:
+            logger.info({"event": "signal_receipts_purged", "purged": purged})
+
+
+async def state_syncer():
+    """
+    Con WATCHER_COORDINATION="lease", su ogni worker: ogni WATCHER_BOOK_SYNC_SEC
+    applica a book, contatori di rischio e /stats le aperture/chiusure degli
+    altri worker (position_events). Ogni WATCHER_EVENTS_RETENTION_SEC / 2
+    cancella gli eventi più vecchi della retention.
+    """
+    purge_every = settings.WATCHER_EVENTS_RETENTION_SEC / 2
+    last_purge = time.monotonic()
+
+    while True:
+        await asyncio.sleep(settings.WATCHER_BOOK_SYNC_SEC)
+
+        try:
+            changes = await asyncio.to_thread(_run_with_session, sync_in_memory_state)
+            if changes:
+                logger.info({"event": "state_synced", **changes})
+
+            if time.monotonic() - last_purge >= purge_every:
+                last_purge = time.monotonic()
+                cutoff = datetime.utcnow() - timedelta(seconds=settings.WATCHER_EVENTS_RETENTION_SEC)
+                await asyncio.to_thread(_run_with_session, position_events.purge, cutoff)
+        except Exception:
+            logger.exception({"event": "state_sync_failed"})
+
+
+def _start_watcher_tasks(mode: str) -> list[asyncio.Task]:
+    if mode == "push":
+        price_tick_bus.bind(asyncio.get_running_loop())
+        return [
+            asyncio.create_task(tick_watcher()),
+            asyncio.create_task(simulated_price_feed()),
+        ]
+    if mode == "sharded":
+        return [asyncio.create_task(shard_close_writer())]
+    return [asyncio.create_task(position_watcher())]
+
+
+async def watcher_coordinator(mode: str):
+    """
+    Con WATCHER_COORDINATION="lease" (più worker uvicorn sullo stesso DB):
+    prova a prendere/rinnovare il lease ogni WATCHER_LEASE_RENEW_SEC.
+    Chi lo ottiene avvia il watcher; gli altri servono solo HTTP e
+    subentrano se il proprietario smette di rinnovarlo (failover).
+    """
+    tasks: list[asyncio.Task] = []
+
+    while True:
+        try:
+            leader = await asyncio.to_thread(_run_with_session, watcher_lease.try_acquire)
+        except Exception as exc:
+            # senza DB non possiamo sapere se il lease è ancora nostro: ci fermiamo
+            logger.warning({"event": "watcher_lease_error", "error": str(exc)})
+            leader = False
+
+        if leader and not tasks:
+            try:
+                # il book di questo worker non ha le posizioni aperte dagli altri
+                await asyncio.to_thread(_run_with_session, position_book.sync)
+            except Exception:
+                logger.exception({"event": "watcher_start_failed", "owner": watcher_lease.owner})
+                # senza book allineato niente watcher: il lease torna libero
+                # (altrimenti resta nostro fino al TTL) e si riprova al prossimo giro
+                try:
+                    await asyncio.to_thread(_run_with_session, watcher_lease.release)
+                except Exception as exc:
+                    logger.warning({"event": "watcher_lease_error", "error": str(exc)})
+            else:
+                tasks = _start_watcher_tasks(mode)
+                logger.info(
+                    {"event": "watcher_lease_acquired", "owner": watcher_lease.owner, "mode": mode}
+                )
+        elif not leader and tasks:
+            for task in tasks:
+                task.cancel()
+            tasks = []
+            logger.warning({"event": "watcher_lease_lost", "owner": watcher_lease.owner})
+
+        await asyncio.sleep(settings.WATCHER_LEASE_RENEW_SEC)
 
 
 def start_scheduler(app: FastAPI):
 
     @app.on_event("startup")
     async def start_background_tasks():
-        asyncio.create_task(position_watcher())
+        mode = settings.POSITION_WATCHER_MODE.lower()
+
+        if mode not in ("poll", "push", "sharded"):
+            logger.warning(
+                {
+                    "event": "watcher_mode_unknown",
+                    "mode": settings.POSITION_WATCHER_MODE,
+                    "fallback": "poll",
+                }
+            )
+            mode = "poll"
+
+        coordination = settings.WATCHER_COORDINATION.lower()
+        if coordination == "lease":
+            asyncio.create_task(watcher_coordinator(mode))
+            asyncio.create_task(state_syncer())
+        else:
+            if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1:
+                # un watcher per processo sullo stesso DB: chiusure doppie
+                logger.warning(
+                    {"event": "watcher_coordination_needed", "hint": "WATCHER_COORDINATION=lease"}
+                )
+            _start_watcher_tasks(mode)
+
+        if settings.RISK_RECONCILE_INTERVAL_SEC > 0:
+            asyncio.create_task(risk_reconciler())
+
+        if settings.SIGNAL_RECEIPT_PURGE_INTERVAL_SEC > 0:
+            asyncio.create_task(receipt_purger())
+
+        logger.info({"event": "watcher_started", "mode": mode, "coordination": coordination})
+
+    @app.on_event("shutdown")
+    async def stop_shard_workers():
+        await asyncio.to_thread(sharded_watcher.stop)
+
+    @app.on_event("shutdown")
+    def release_watcher_lease():
+        # shutdown pulito: un altro worker può subentrare subito
+        if settings.WATCHER_COORDINATION.lower() == "lease":
+            _run_with_session(watcher_lease.release)
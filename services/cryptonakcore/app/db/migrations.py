@@ -0,0 +1,119 @@
+from collections import defaultdict
+import logging
+import time
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from app.db.session import Base
+
+logger = logging.getLogger("db")
+
+
+def upgrade_schema(engine: Engine) -> None:
+    """
+    Allinea lo schema del DB ai modelli (chiamato allo startup).
+
+    Non abbiamo Alembic: create_all crea solo le tabelle mancanti, quindi
+    qui aggiungiamo anche le colonne nullable e gli indici introdotti dopo
+    la creazione di un DB esistente (es. loms_paper.db sul server).
+
+    Le colonne aggiunte così non hanno vincoli (es. positions.order_id
+    arriva senza FOREIGN KEY): se serve, i valori per le righe esistenti
+    vengono ricostruiti subito dopo l'ALTER TABLE (_BACKFILLS).
+
+    Con più worker uvicorn l'upgrade parte in parallelo in ogni processo:
+    se un altro worker crea la stessa tabella/colonna/indice nel frattempo
+    ("already exists") si riprova, e al giro successivo non resta nulla da fare.
+    """
+    for attempt in range(3):
+        try:
+            _upgrade_once(engine)
+            return
+        except OperationalError:
+            if attempt == 2:
+                raise
+            time.sleep(0.2)
+
+
+def _upgrade_once(engine: Engine) -> None:
+    Base.metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+
+    for table in Base.metadata.sorted_tables:
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+
+        for column in table.columns:
+            if column.name in existing:
+                continue
+
+            col_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(
+                    text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}')
+                )
+            logger.info(
+                {"event": "schema_column_added", "table": table.name, "column": column.name}
+            )
+
+            backfill = _BACKFILLS.get((table.name, column.name))
+            if backfill is not None:
+                # solo il worker che ha aggiunto la colonna: una volta sola
+                with engine.begin() as conn:
+                    rows = backfill(conn)
+                logger.info(
+                    {
+                        "event": "schema_column_backfilled",
+                        "table": table.name,
+                        "column": column.name,
+                        "rows": rows,
+                    }
+                )
+
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _backfill_position_order_id(conn) -> int:
+    """
+    Collega le posizioni esistenti all'ordine che le ha aperte. Prima del
+    legame ordine e posizione venivano committati uno dopo l'altro con gli
+    stessi symbol/side/qty/tp/sl: ogni posizione prende l'ordine più recente
+    ancora libero con gli stessi campi e creato non dopo di lei (un ordine
+    rimasto senza posizione viene così saltato). Ritorna le righe aggiornate.
+    """
+    fields = "id, symbol, side, qty, tp_price, sl_price, created_at"
+    orders = conn.execute(
+        text(f"SELECT {fields} FROM orders ORDER BY created_at, id")
+    ).all()
+    positions = conn.execute(
+        text(f"SELECT {fields} FROM positions WHERE order_id IS NULL ORDER BY created_at, id")
+    ).all()
+
+    def key(row):
+        return (row.symbol, row.side, row.qty, row.tp_price, row.sl_price)
+
+    free: dict[tuple, list[int]] = defaultdict(list)
+    updates = []
+    i = 0
+    for pos in positions:
+        while i < len(orders) and orders[i].created_at <= pos.created_at:
+            free[key(orders[i])].append(orders[i].id)
+            i += 1
+        candidates = free.get(key(pos))
+        if candidates:
+            updates.append({"order_id": candidates.pop(), "position_id": pos.id})
+
+    if updates:
+        conn.execute(
+            text("UPDATE positions SET order_id = :order_id WHERE id = :position_id"), updates
+        )
+    return len(updates)
+
+
+# (tabella, colonna) -> ricostruzione dei valori dopo l'ALTER TABLE
+_BACKFILLS = {
+    ("positions", "order_id"): _backfill_position_order_id,
+}
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, func
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, Text, func
+from sqlalchemy.orm import relationship
 from app.db.session import Base
 
 
@@ -8,6 +9,12 @@ class Order(Base):
     Per ora è una semplice traccia di cosa è stato chiesto all'OMS.
     """
     __tablename__ = "orders"
+    __table_args__ = (
+        # filtri + paginazione keyset (id) di GET /orders
+        Index("ix_orders_symbol_side_id", "symbol", "side", "id"),
+        Index("ix_orders_status_id", "status", "id"),
+        Index("ix_orders_created_at", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
 
@@ -30,6 +37,11 @@ class Order(Base):
     # Stato ordine: "created", "filled", "canceled", ...
     status = Column(String, default="created", nullable=False)
 
+    # Contesto del segnale che ha generato l'ordine (NULL se assente)
+    exchange = Column(String, nullable=True)       # es. "bitget"
+    timeframe_min = Column(Integer, nullable=True)  # es. 5
+    strategy = Column(String, nullable=True)       # es. "bounce_ema10_strict"
+
     # Timestamp creazione ordine
     created_at = Column(
         DateTime(timezone=True),
@@ -46,9 +58,25 @@ class Position(Base):
     - Chiusa da auto_close_positions (TP/SL) o manualmente
     """
     __tablename__ = "positions"
+    __table_args__ = (
+        # filtri + paginazione keyset (id) di GET /positions
+        Index("ix_positions_status_symbol_id", "status", "symbol", "id"),
+        Index("ix_positions_symbol_side_id", "symbol", "side", "id"),
+        Index("ix_positions_reason_id", "auto_close_reason", "id"),
+        Index("ix_positions_created_at", "created_at"),
+        Index("ix_positions_order_id", "order_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
 
+    # Ordine che ha aperto la posizione. Sui DB creati prima del legame la
+    # colonna arriva da ALTER TABLE (upgrade_schema) SENZA vincolo FOREIGN KEY
+    # (SQLite non lo aggiunge a tabelle esistenti): il legame vale lato ORM e
+    # order_id viene ricostruito una volta dalle righe esistenti; resta NULL
+    # per le posizioni senza un ordine corrispondente
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=True)
+    order = relationship("Order")
+
     symbol = Column(String, index=True, nullable=False)
     side = Column(String, nullable=False)  # "long" / "short"
     qty = Column(Float, nullable=False)
@@ -63,6 +91,11 @@ class Position(Base):
     # Stato posizione: "open" / "closed" / "cancelled" (stringhe usate in oms.py)
     status = Column(String, default="open", index=True, nullable=False)
 
+    # Contesto del segnale (copiato dall'ordine): dimensioni di /stats/breakdown
+    exchange = Column(String, nullable=True)
+    timeframe_min = Column(Integer, nullable=True)
+    strategy = Column(String, nullable=True)
+
     # Timestamp apertura
     created_at = Column(
         DateTime(timezone=True),
@@ -79,3 +112,111 @@ class Position(Base):
 
     # Motivo di chiusura: "tp", "sl", "manual", "timeout", ecc.
     auto_close_reason = Column(String, nullable=True)
+
+
+class SignalReceipt(Base):
+    """
+    Ricevuta di un segnale che ha aperto ordine + posizione.
+
+    La chiave (signal_id del mittente, oppure hash di symbol/side/timestamp/
+    strategy/exchange/timeframe_min) è unica: un segnale ripetuto non può
+    creare una seconda posizione e riceve la risposta originale.
+    """
+    __tablename__ = "signal_receipts"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Chiave di idempotenza del segnale
+    key = Column(String, unique=True, nullable=False)
+
+    # Risposta JSON restituita al primo invio
+    response = Column(Text, nullable=False)
+
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+
+
+class WatcherLease(Base):
+    """
+    Lease del position watcher: con più worker uvicorn sullo stesso DB
+    solo il proprietario (owner) di un lease non scaduto esegue l'auto-close.
+    Gli orari sono UTC naive, come datetime.utcnow().
+    """
+    __tablename__ = "watcher_leases"
+
+    # Nome del lease (es. "position_watcher")
+    name = Column(String, primary_key=True)
+
+    # Worker che lo detiene: "host:pid:token"
+    owner = Column(String, nullable=False)
+
+    # Scadenza: se non rinnovato entro questa data un altro worker subentra
+    expires_at = Column(DateTime, nullable=False)
+
+    acquired_at = Column(DateTime, nullable=False)
+
+
+class PositionEvent(Base):
+    """
+    Apertura o chiusura di una posizione, scritta nella stessa transazione
+    solo con WATCHER_COORDINATION="lease": ogni worker applica al suo stato
+    in memoria quelle degli altri worker leggendo le righe con id maggiore
+    dell'ultimo visto (vedi app.services.position_events).
+    """
+    __tablename__ = "position_events"
+    __table_args__ = (
+        Index("ix_position_events_created_at", "created_at"),
+        # id mai riusati dopo la purge: il cursore dei worker resta valido
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, primary_key=True)
+
+    # Worker che ha scritto l'evento (owner di watcher_lease)
+    owner = Column(String, nullable=False)
+
+    # "open" / "close"
+    kind = Column(String, nullable=False)
+
+    position_id = Column(Integer, nullable=False)
+    symbol = Column(String, nullable=False)
+
+    # Solo per le chiusure
+    pnl = Column(Float, nullable=True)
+    reason = Column(String, nullable=True)
+
+    created_at = Column(DateTime, nullable=False)
+
+
+class PnlRollup(Base):
+    """
+    Rollup del PnL realizzato per bucket temporale (1h / 1d), simbolo e side.
+    Aggiornato in modo incrementale nella stessa transazione di ogni chiusura
+    (vedi app.services.pnl_rollups): /stats/timeseries legge solo da qui.
+    """
+    __tablename__ = "pnl_rollups"
+    __table_args__ = (
+        # chiave del rollup (upsert) + filtri di /stats/timeseries
+        Index("ux_pnl_rollups_key", "bucket", "symbol", "side", "bucket_start", unique=True),
+        Index("ix_pnl_rollups_bucket_start", "bucket", "bucket_start"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # "1h" / "1d"
+    bucket = Column(String, nullable=False)
+
+    # Inizio del bucket (UTC naive, come closed_at)
+    bucket_start = Column(DateTime, nullable=False)
+
+    symbol = Column(String, nullable=False)
+    side = Column(String, nullable=False)  # "long" / "short"
+
+    # Trade chiusi nel bucket, vincenti / perdenti, PnL realizzato
+    trades = Column(Integer, default=0, nullable=False)
+    wins = Column(Integer, default=0, nullable=False)
+    losses = Column(Integer, default=0, nullable=False)
+    pnl = Column(Float, default=0.0, nullable=False)
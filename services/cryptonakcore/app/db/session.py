@@ -1,21 +1,69 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.core.config import settings
 
 # Base per tutti i modelli ORM (models.py la importerà da qui)
 Base = declarative_base()
 
-# Se usi SQLite, serve il flag check_same_thread=False
-connect_args = {}
 
-if settings.DATABASE_URL.startswith("sqlite"):
-    connect_args = {"check_same_thread": False}
+def sqlite_pragmas() -> dict[str, str | int]:
+    """PRAGMA applicati ad ogni connessione SQLite nel profilo "production"."""
+    return {
+        "journal_mode": settings.SQLITE_JOURNAL_MODE,
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        # valore negativo = dimensione in KiB (non in pagine)
+        "cache_size": -abs(settings.SQLITE_CACHE_SIZE_KB),
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+    }
+
+
+def create_db_engine(url: str, profile: str = "default") -> Engine:
+    """
+    Crea l'engine SQLAlchemy per `url` secondo il profilo:
+
+    - "default": come in origine (solo check_same_thread=False su SQLite)
+    - "production": pool dimensionato da Settings e, su SQLite, WAL +
+      synchronous/cache_size/mmap_size/busy_timeout applicati con PRAGMA
+      ad ogni nuova connessione
+    """
+    is_sqlite = url.startswith("sqlite")
+    is_memory = is_sqlite and (url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url)
+
+    # Se usi SQLite, serve il flag check_same_thread=False
+    connect_args = {"check_same_thread": False} if is_sqlite else {}
+
+    if profile != "production":
+        return create_engine(url, connect_args=connect_args)
+
+    kwargs = {"pool_pre_ping": True}
+    if not is_memory:
+        kwargs.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SEC,
+        )
+
+    db_engine = create_engine(url, connect_args=connect_args, **kwargs)
+
+    if is_sqlite and not is_memory:
+        pragmas = sqlite_pragmas()
+
+        @event.listens_for(db_engine, "connect")
+        def _apply_sqlite_pragmas(dbapi_conn, _record):
+            cursor = dbapi_conn.cursor()
+            try:
+                for name, value in pragmas.items():
+                    cursor.execute(f"PRAGMA {name}={value}")
+            finally:
+                cursor.close()
+
+    return db_engine
+
 
 # Crea l'engine collegato al database
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args=connect_args
-)
+engine = create_db_engine(settings.DATABASE_URL, settings.DB_ENGINE_PROFILE)
 
 # Factory delle sessioni
 SessionLocal = sessionmaker(
@@ -23,3 +71,18 @@ SessionLocal = sessionmaker(
     autoflush=False,
     bind=engine
 )
+
+
+def get_db():
+    """
+    Dependency FastAPI condivisa da tutti i router: una Session per request.
+
+    Nota: gli endpoint che usano il DB sono dichiarati con `def` (non
+    `async def`), così FastAPI li esegue nel suo threadpool e le chiamate
+    bloccanti di SQLAlchemy non fermano l'event loop (position watcher incluso).
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -1,10 +1,14 @@
 from fastapi import FastAPI
 
-from app.api import health, signals, orders, positions, market, stats
-from app.core.logging import setup_logging
+from app.api import health, signals, orders, positions, market, stats, metrics
+from app.core.logging import setup_logging, stop_logging
+from app.core.metrics import MetricsMiddleware, register_open_positions_gauge
 from app.core.scheduler import start_scheduler  # ⬅️ nuovo import
-from app.db.models import Base
-from app.db.session import engine
+from app.db.migrations import upgrade_schema
+from app.db.session import engine, SessionLocal
+from app.services.audit import audit_writer
+from app.services.oms import load_in_memory_state
+from app.services.risk_counters import open_position_counters
 
 # inizializza logging JSON
 setup_logging()
@@ -12,11 +16,36 @@ setup_logging()
 # istanza FastAPI
 app = FastAPI(title="CryptoNakCore LOMS", version="0.1.0")
 
+# latenza di ogni richiesta HTTP (esposta su /metrics)
+app.add_middleware(MetricsMiddleware)
+register_open_positions_gauge(open_position_counters.total)
 
-# crea le tabelle al bootstrap dell'app
+
+# crea/aggiorna le tabelle al bootstrap dell'app
 @app.on_event("startup")
 def on_startup():
-    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+
+    # carica in memoria le posizioni aperte (book usato da auto_close_positions),
+    # i contatori usati da check_risk_limits e l'aggregato di /stats
+    db = SessionLocal()
+    try:
+        load_in_memory_state(db)
+    finally:
+        db.close()
+
+    # writer audit JSONL in background
+    audit_writer.start()
+
+
+# allo shutdown svuotiamo la coda audit (nessun segnale accettato va perso)
+# e quella dei log
+@app.on_event("shutdown")
+def on_shutdown():
+    audit_writer.stop()
+
+    # svuota la coda dei log (nessuna riga persa)
+    stop_logging()
 
 
 # avvia lo scheduler per l'auto-close delle posizioni
@@ -30,6 +59,7 @@ app.include_router(orders.router, prefix="/orders", tags=["orders"])
 app.include_router(positions.router, prefix="/positions", tags=["positions"])
 app.include_router(market.router, prefix="/market", tags=["market"])
 app.include_router(stats.router, prefix="/stats", tags=["stats"])
+app.include_router(metrics.router, tags=["metrics"])
 
 
 @app.get("/")
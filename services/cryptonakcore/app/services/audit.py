@@ -1,22 +1,252 @@
+import gzip
 import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
 from app.core.config import settings
+from app.core.metrics import AUDIT_ENTRIES_DROPPED, AUDIT_WRITE_SECONDS
+
+logger = logging.getLogger("audit")
 
 # Path del file JSONL dove salviamo i segnali di bounce
 LOG_PATH = Path(settings.AUDIT_LOG_PATH)
 LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
 
+# Sentinella per chiedere al writer di svuotare la coda e fermarsi
+_STOP = object()
+
+# Numero massimo di righe scritte per batch
+_MAX_BATCH = 1000
+
+# Attesa massima di write() su coda piena prima di ricontrollare il writer
+_PUT_TIMEOUT_SEC = 1.0
+
+
+class AuditWriter:
+    """
+    Writer asincrono del file audit JSONL.
+
+    - le entry arrivano da una coda bounded (write() blocca se è piena,
+      così nessun segnale accettato viene scartato, finché il writer è vivo)
+    - un thread in background le scrive a batch su un file handle che resta aperto
+    - flush ogni `flush_interval` secondi, fsync ogni `fsync_interval`
+      (0 = fsync ad ogni flush)
+    - rotazione "size" (oltre `max_bytes`) o "daily" (cambio di data UTC),
+      con compressione gzip opzionale dei file ruotati
+    - stop() svuota la coda, fa flush + fsync e chiude il file
+    - un errore di I/O (disco pieno, permessi sulla rotazione) fa perdere
+      solo il batch corrente (loms_audit_entries_dropped_total): il thread
+      resta vivo e riapre il file al batch successivo
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_queue: int = 10000,
+        flush_interval: float = 0.2,
+        fsync_interval: float = 1.0,
+        rotate: str = "none",
+        max_bytes: int = 50 * 1024 * 1024,
+        compress: bool = False,
+    ) -> None:
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.rotate = (rotate or "none").lower()
+        self.max_bytes = max_bytes
+        self.compress = compress
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._opened_day: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Svuota la coda e chiude il file (chiamato allo shutdown)."""
+        if not self.running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def write(self, entry: dict) -> None:
+        while True:
+            try:
+                self._queue.put(entry, timeout=_PUT_TIMEOUT_SEC)
+                return
+            except queue.Full:
+                if not self.running:
+                    # nessuno svuota più la coda: non blocchiamo la richiesta
+                    AUDIT_ENTRIES_DROPPED.inc("writer_stopped")
+                    logger.warning({"event": "audit_entry_dropped", "reason": "writer_stopped"})
+                    return
+
+    # ---------- thread writer ----------
+
+    def _run(self) -> None:
+        last_flush = last_fsync = time.monotonic()
+        dirty = False
+        stopping = False
+
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+                batch = [item]
+            except queue.Empty:
+                batch = []
+
+            while len(batch) < _MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            for item in batch:
+                if item is _STOP:
+                    stopping = True
+                else:
+                    lines.append(json.dumps(item) + "\n")
+
+            if lines:
+                try:
+                    with AUDIT_WRITE_SECONDS.time():
+                        if self._file is None:
+                            self._open()
+                        self._maybe_rotate()
+                        self._file.write("".join(lines))
+                    dirty = True
+                except Exception:
+                    # il batch va perso, il thread no: se morisse la coda si
+                    # riempirebbe e write() bloccherebbe ogni richiesta
+                    logger.exception({"event": "audit_write_failed", "dropped": len(lines)})
+                    AUDIT_ENTRIES_DROPPED.inc("write_error", value=len(lines))
+                    self._close_quietly()
+
+            now = time.monotonic()
+            due = stopping or now - last_flush >= self.flush_interval
+            if dirty and due and self._file is not None:
+                try:
+                    self._file.flush()
+                    last_flush = now
+                    if stopping or now - last_fsync >= self.fsync_interval:
+                        os.fsync(self._file.fileno())
+                        last_fsync = now
+                        dirty = False
+                except Exception:
+                    logger.exception({"event": "audit_flush_failed"})
+                    self._close_quietly()
+                    dirty = False
+
+        self._close_quietly()
+
+    def _close_quietly(self) -> None:
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+        except Exception:
+            logger.exception({"event": "audit_close_failed"})
+        self._file = None
+
+    def _open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("a", encoding="utf-8")
+        self._opened_day = _utc_day()
+
+    def _maybe_rotate(self) -> None:
+        if self.rotate == "size":
+            if self._file.tell() < self.max_bytes:
+                return
+            suffix = datetime.utcnow().strftime("%Y%m%d-%H%M%S-%f")
+        elif self.rotate == "daily":
+            if _utc_day() == self._opened_day:
+                return
+            suffix = self._opened_day
+        else:
+            return
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+        rotated = self.path.with_name(f"{self.path.name}.{suffix}")
+        n = 1
+        while rotated.exists() or rotated.with_name(rotated.name + ".gz").exists():
+            rotated = self.path.with_name(f"{self.path.name}.{suffix}.{n}")
+            n += 1
+        self.path.rename(rotated)
+
+        logger.info({"event": "audit_rotated", "rotated": str(rotated)})
+
+        if self.compress:
+            # compressione fuori dal thread writer per non bloccare la coda
+            threading.Thread(
+                target=_gzip_file, args=(rotated,), name="audit-gzip", daemon=True
+            ).start()
+
+        self._open()
+
+
+def _utc_day() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def _gzip_file(path: Path) -> None:
+    # scrive su .tmp e rinomina: il .gz esiste solo quando è completo
+    target = path.with_name(path.name + ".gz")
+    tmp = path.with_name(path.name + ".gz.tmp")
+    with path.open("rb") as src, gzip.open(tmp, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp, target)
+    path.unlink()
+
+
+# Writer condiviso dal processo (avviato/fermato da app.main)
+audit_writer = AuditWriter(
+    LOG_PATH,
+    max_queue=settings.AUDIT_QUEUE_MAX_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL_SEC,
+    fsync_interval=settings.AUDIT_FSYNC_INTERVAL_SEC,
+    rotate=settings.AUDIT_ROTATE,
+    max_bytes=settings.AUDIT_ROTATE_MAX_BYTES,
+    compress=settings.AUDIT_ROTATE_COMPRESS,
+)
+
 
 def log_bounce_signal(signal: dict) -> None:
     """
     Salva un segnale di bounce come riga JSON nel file audit.
+
+    Se il writer in background è attivo la riga viene solo accodata;
+    altrimenti (es. script/tool senza startup dell'app) si scrive subito.
     """
     entry = {
         "type": "bounce_signal",
         "ts": datetime.utcnow().isoformat(),
         "payload": signal,
     }
-    with LOG_PATH.open("a", encoding="utf-8") as f:
+
+    if audit_writer.running:
+        audit_writer.write(entry)
+        return
+
+    with AUDIT_WRITE_SECONDS.time(), LOG_PATH.open("a", encoding="utf-8") as f:
         f.write(json.dumps(entry) + "\n")
@@ -0,0 +1,154 @@
+import csv
+import gzip
+import io
+import json
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from sqlalchemy import Table, select
+
+from app.db.session import SessionLocal
+
+# Righe lette dal DB per ogni giro del cursore server-side
+EXPORT_BATCH_SIZE = 500
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _ndjson_chunk(rows: Iterable[dict]) -> str:
+    return "".join(json.dumps(row, default=_jsonable) + "\n" for row in rows)
+
+
+def _csv_chunk(rows: Iterable[list]) -> str:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerows([[_jsonable(v) for v in row] for row in rows])
+    return buf.getvalue()
+
+
+def stream_table(table: Table, fmt: str, filters: list) -> Iterator[str]:
+    """
+    Esporta le righe di `table` (ordinate per id) in NDJSON o CSV.
+
+    Il generatore apre una propria Session (la dependency get_db viene chiusa
+    prima che lo streaming finisca) e legge con yield_per: in memoria c'è al
+    massimo un batch di righe, e ogni batch viene inviato appena letto.
+    """
+    columns = [col.name for col in table.columns]
+
+    if fmt == "csv":
+        # header subito: il primo byte parte prima della query
+        yield _csv_chunk([columns])
+
+    db = SessionLocal()
+    try:
+        stmt = (
+            select(table)
+            .where(*filters)
+            .order_by(table.c.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        result = db.execute(stmt)
+
+        for partition in result.partitions():
+            if fmt == "csv":
+                yield _csv_chunk([list(row) for row in partition])
+            else:
+                yield _ndjson_chunk(dict(row._mapping) for row in partition)
+    finally:
+        db.close()
+
+
+# ---------- audit JSONL ----------
+
+AUDIT_CSV_COLUMNS = [
+    "ts",
+    "symbol",
+    "side",
+    "price",
+    "timestamp",
+    "exchange",
+    "timeframe_min",
+    "strategy",
+    "tp_pct",
+    "sl_pct",
+    "signal_id",
+]
+
+
+def audit_files(log_path: Path) -> list[Path]:
+    """
+    File audit in ordine cronologico: prima i ruotati (anche .gz), poi quello
+    corrente. Durante la compressione di un ruotato esistono sia il file in
+    chiaro sia il .gz: si esporta solo il .gz, per non duplicare le righe.
+    """
+    rotated = sorted(log_path.parent.glob(log_path.name + ".*"))
+    files = [
+        p
+        for p in rotated
+        if p.is_file()
+        and p.suffix != ".tmp"
+        and not (p.suffix != ".gz" and p.with_name(p.name + ".gz").exists())
+    ]
+    if log_path.exists():
+        files.append(log_path)
+    return files
+
+
+def open_audit_file(path: Path):
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return path.open("r", encoding="utf-8")
+
+
+def stream_audit(log_path: Path, fmt: str, since: datetime | None = None) -> Iterator[str]:
+    """
+    Esporta i segnali salvati nel file audit (e nei file ruotati) riga per riga.
+    `since` filtra sul campo "ts" (UTC) dell'entry.
+    """
+    if since is not None and since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    since_iso = since.isoformat() if since is not None else None
+
+    if fmt == "csv":
+        yield _csv_chunk([AUDIT_CSV_COLUMNS])
+
+    batch: list[str] = []
+    for path in audit_files(log_path):
+        with open_audit_file(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+
+                entry = None
+                if since_iso is not None or fmt == "csv":
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if since_iso is not None and entry.get("ts", "") < since_iso:
+                        continue
+
+                if fmt == "csv":
+                    payload = entry.get("payload") or {}
+                    row = [entry.get("ts")] + [payload.get(c) for c in AUDIT_CSV_COLUMNS[1:]]
+                    batch.append(_csv_chunk([row]))
+                else:
+                    batch.append(line if line.endswith("\n") else line + "\n")
+
+                if len(batch) >= EXPORT_BATCH_SIZE:
+                    yield "".join(batch)
+                    batch = []
+
+    if batch:
+        yield "".join(batch)
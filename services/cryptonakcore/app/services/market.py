@@ -1,15 +1,39 @@
-
 # app/services/market.py
-from typing import Optional
+from app.services.market_simulator import market_engine
+from app.services.price_snapshot import price_snapshot
+from app.services.shard_watcher import sharded_watcher
+
+# Simbolo usato da /market/price quando non viene indicato
+DEFAULT_SYMBOL = "BTCUSDT"
+
+
+def get_market_price(symbol: str = DEFAULT_SYMBOL) -> float:
+    """Ritorna l'ultimo prezzo simulato di `symbol` (senza far avanzare il processo)."""
+    price = sharded_watcher.last_price(symbol)
+    if price is not None:
+        return price
+    return market_engine.last_price(symbol)
+
 
-# Prezzo di mercato simulato (parte da 60000)
-market_price: float = 60000.0
+def get_close_price(symbol: str) -> float:
+    """
+    Prezzo per una chiusura manuale: quello del tick del watcher. In modalità
+    "sharded" è l'ultimo pubblicato dallo shard del simbolo, altrimenti lo
+    snapshot condiviso del processo.
+    """
+    price = sharded_watcher.last_price(symbol)
+    if price is not None:
+        return price
+    return price_snapshot.get(symbol)
 
-def get_market_price() -> float:
-    """Ritorna il prezzo di mercato simulato."""
-    return market_price
 
-def set_market_price(price: float):
-    """Setta manualmente il prezzo simulato (per test)."""
-    global market_price
-    market_price = price
+def set_market_price(price: float, symbol: str = DEFAULT_SYMBOL):
+    """
+    Setta manualmente il prezzo simulato di `symbol` (per test): i tick
+    successivi del simulatore ripartono da qui e il prezzo entra subito
+    nello snapshot, così watcher e chiusure manuali lo vedono al prossimo tick.
+    """
+    market_engine.set_price(symbol, price)
+    price_snapshot.put(symbol, price)
+    # modalità "sharded": il feed del simbolo è nel suo processo shard
+    sharded_watcher.set_price(symbol, price)
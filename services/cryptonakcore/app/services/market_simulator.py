@@ -1,16 +1,187 @@
-import random
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+
+@dataclass
+class _SymbolState:
+    """Processo di prezzo di un simbolo: parametri, RNG e blocco di tick pre-generati."""
+    price: float
+    volatility: float
+    drift: float
+    rng: np.random.Generator
+    block: np.ndarray
+    pos: int = 0
+
+
+class MarketSimulatorEngine:
+    """
+    Simulatore di mercato paper con un processo stocastico per simbolo.
+
+    - modello "gbm" (moto browniano geometrico) o "random_walk" (passi
+      additivi proporzionali al prezzo iniziale); `volatility` e `drift`
+      sono per tick (es. 0.005 = 0.5%)
+    - ogni simbolo ha il suo RNG, derivato da `seed` e dal nome del simbolo:
+      con lo stesso seed la sequenza di un simbolo è sempre la stessa,
+      indipendentemente dall'ordine in cui i simboli vengono chiesti
+    - i tick vengono generati a blocchi NumPy di `block_size` in anticipo:
+      next_price() legge solo il prossimo valore del blocco
+    """
+
+    def __init__(
+        self,
+        model: str = "gbm",
+        initial_price: float = 100.0,
+        volatility: float = 0.005,
+        drift: float = 0.0,
+        seed: Optional[int] = None,
+        block_size: int = 4096,
+    ) -> None:
+        self.model = (model or "gbm").lower()
+        self.initial_price = initial_price
+        self.volatility = volatility
+        self.drift = drift
+        self.block_size = max(1, block_size)
+        self._lock = threading.Lock()
+        self._symbols: dict[str, _SymbolState] = {}
+        self.reset(seed)
+
+    # ---------- configurazione ----------
+
+    def reset(self, seed: Optional[int] = None) -> None:
+        """Riparte da zero (tutti i simboli al prezzo iniziale) con un nuovo seed."""
+        with self._lock:
+            self.seed = seed
+            # senza seed: entropia del sistema, una volta sola per l'engine
+            self._seed_seq = np.random.SeedSequence(seed)
+            self._symbols.clear()
+
+    def configure_symbol(
+        self,
+        symbol: str,
+        price: Optional[float] = None,
+        volatility: Optional[float] = None,
+        drift: Optional[float] = None,
+    ) -> None:
+        """Imposta prezzo e/o parametri del processo di un simbolo."""
+        with self._lock:
+            state = self._state(symbol)
+            if price is not None:
+                state.price = float(price)
+            if volatility is not None:
+                state.volatility = float(volatility)
+            if drift is not None:
+                state.drift = float(drift)
+            # il blocco pre-generato partiva dal vecchio prezzo/parametri
+            state.block = np.empty(0)
+            state.pos = 0
+
+    # ---------- prezzi ----------
+
+    def last_price(self, symbol: str) -> float:
+        """Ultimo prezzo emesso per `symbol` (non fa avanzare il processo)."""
+        with self._lock:
+            return self._state(symbol).price
+
+    def set_price(self, symbol: str, price: float) -> None:
+        """Forza il prezzo corrente: i tick successivi ripartono da qui."""
+        self.configure_symbol(symbol, price=price)
+
+    def next_price(self, symbol: str) -> float:
+        """Prossimo tick di `symbol`."""
+        with self._lock:
+            state = self._state(symbol)
+            if state.pos >= state.block.size:
+                state.block = self._generate(state, self.block_size)
+                state.pos = 0
+            state.price = float(state.block[state.pos])
+            state.pos += 1
+            return state.price
+
+    def ticks(self, symbol: str, n: int) -> np.ndarray:
+        """
+        I prossimi `n` tick di `symbol` come array NumPy (stessa sequenza
+        che si otterrebbe con n chiamate a next_price).
+        """
+        with self._lock:
+            state = self._state(symbol)
+            take = min(n, state.block.size - state.pos)
+            parts = [state.block[state.pos:state.pos + take]]
+            state.pos += take
+            remaining = n - take
+
+            # blocchi interi come farebbe next_price, così l'RNG avanza uguale
+            while remaining > 0:
+                state.block = self._generate(state, self.block_size, start=_last(parts[-1], state.price))
+                take = min(remaining, self.block_size)
+                parts.append(state.block[:take])
+                state.pos = take
+                remaining -= take
+
+            out = np.concatenate(parts)
+            if out.size:
+                state.price = float(out[-1])
+            return out
+
+    # ---------- interni ----------
+
+    def _state(self, symbol: str) -> _SymbolState:
+        state = self._symbols.get(symbol)
+        if state is None:
+            # RNG del simbolo: dipende solo da seed + nome (crc32 è stabile tra processi)
+            seq = np.random.SeedSequence(
+                entropy=self._seed_seq.entropy,
+                spawn_key=(zlib.crc32(symbol.encode("utf-8")),),
+            )
+            state = _SymbolState(
+                price=self.initial_price,
+                volatility=self.volatility,
+                drift=self.drift,
+                rng=np.random.default_rng(seq),
+                block=np.empty(0),
+            )
+            self._symbols[symbol] = state
+        return state
+
+    def _generate(self, state: _SymbolState, n: int, start: Optional[float] = None) -> np.ndarray:
+        p0 = state.price if start is None else start
+        z = state.rng.standard_normal(n)
+
+        if self.model == "random_walk":
+            steps = self.initial_price * (state.drift + state.volatility * z)
+            path = p0 + np.cumsum(steps)
+            # il prezzo non può andare a zero o sotto
+            return np.maximum(path, self.initial_price * 1e-6)
+
+        log_steps = (state.drift - 0.5 * state.volatility ** 2) + state.volatility * z
+        return p0 * np.exp(np.cumsum(log_steps))
+
+
+def _last(values: np.ndarray, default: float) -> float:
+    return float(values[-1]) if values.size else default
+
+
+# Engine condiviso dal processo (watcher, snapshot prezzi, /market)
+market_engine = MarketSimulatorEngine(
+    model=settings.MARKET_SIM_MODEL,
+    initial_price=settings.MARKET_SIM_INITIAL_PRICE,
+    volatility=settings.MARKET_SIM_VOLATILITY,
+    drift=settings.MARKET_SIM_DRIFT,
+    seed=settings.MARKET_SIM_SEED,
+    block_size=settings.MARKET_SIM_BLOCK_SIZE,
+)
 
 
 class MarketSimulator:
     @staticmethod
     def get_price(sym: str) -> float:
         """
-        Simulatore molto semplice:
-        - prezzo base 100
-        - variazione casuale tra -10 e +10
-        Questo rende raggiungibili TP/SL tipo 4.5% / 1.5%
-        (tp=104.5, sl=98.5) in pochi tick.
+        Prossimo tick simulato per `sym` dall'engine condiviso
+        (processo per simbolo, riproducibile con MARKET_SIM_SEED).
         """
-        base = 100.0
-        variation = random.uniform(-10.0, 10.0)
-        return base + variation
+        return market_engine.next_price(sym)
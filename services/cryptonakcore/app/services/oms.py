@@ -1,11 +1,27 @@
+from dataclasses import dataclass
 from datetime import datetime
 import logging
+import time
 from typing import Optional
 
+from sqlalchemy import case, select, update
 from sqlalchemy.orm import Session
 
-from app.db.models import Position
-from app.services.market_simulator import MarketSimulator
+from app.core.metrics import (
+    DB_COMMIT_SECONDS,
+    POSITIONS_CLOSED,
+    POSITIONS_OPENED,
+    RISK_BLOCKS,
+    WATCHER_TICK_SECONDS,
+)
+from app.db.models import Order, Position
+from app.services.pnl_rollups import backfill_if_empty, record_closes
+from app.services.position_book import BookEntry, PositionBook, _entry_from_position, position_book
+from app.services.price_snapshot import price_snapshot
+from app.services.risk_counters import OpenPositionCounters, open_position_counters
+from app.services.stats_aggregator import stats_accumulator
+from app.services.position_events import position_events
+from app.services.watcher_lease import lease_coordination, watcher_lease
 from app.core.config import settings
 
 logger = logging.getLogger("oms")
@@ -25,11 +41,35 @@ def _normalize_side(side: str) -> str:
     return s
 
 
+def compute_tp_sl(
+    side: str,
+    entry_price: float,
+    tp_pct: Optional[float],
+    sl_pct: Optional[float],
+) -> tuple[Optional[float], Optional[float]]:
+    """
+    Calcola i prezzi TP/SL a partire dal prezzo di ingresso e dalle
+    percentuali (es. 4.5 / 1.5), in base al side normalizzato.
+    Ritorna (None, None) se il side non è "long" / "short".
+    """
+    if side == "long":
+        tp_price = entry_price * (1.0 + tp_pct / 100.0) if tp_pct is not None else None
+        sl_price = entry_price * (1.0 - sl_pct / 100.0) if sl_pct is not None else None
+    elif side == "short":
+        tp_price = entry_price * (1.0 - tp_pct / 100.0) if tp_pct is not None else None
+        sl_price = entry_price * (1.0 + sl_pct / 100.0) if sl_pct is not None else None
+    else:
+        return None, None
+    return tp_price, sl_price
+
+
 def check_risk_limits(
-    db: Session,
     symbol: str,
     entry_price: Optional[float] = None,
     qty: Optional[float] = None,
+    counters: Optional[OpenPositionCounters] = None,
+    max_total: Optional[int] = None,
+    max_per_symbol: Optional[int] = None,
 ) -> tuple[bool, str | None]:
     """
     Controlla i limiti di rischio base (paper), letti da Settings/env:
@@ -38,168 +78,503 @@ def check_risk_limits(
     - MAX_OPEN_POSITIONS_PER_SYMBOL: massimo numero di posizioni aperte per simbolo
     - MAX_SIZE_PER_POSITION_USDT: size massima (notional) per posizione in USDT
 
+    I conteggi arrivano dai contatori in memoria (nessun accesso al DB).
+    Se il controllo passa, uno slot per `symbol` viene PRENOTATO nello stesso
+    lock: il chiamante deve poi chiamare counters.confirm(symbol) quando la
+    posizione è committata, oppure counters.release(symbol) se non la crea.
+
     Parametri opzionali:
     - entry_price, qty: se presenti, viene controllato anche il limite di size
       (entry_price * qty <= MAX_SIZE_PER_POSITION_USDT).
+    - counters: contatori da usare (default: open_position_counters del processo)
+    - max_total, max_per_symbol: override dei limiti di Settings (replay / sweep)
 
     Ritorna:
     - (True, None) se si può aprire una nuova posizione
     - (False, reason) se NON si può aprire (con motivo testuale)
     """
 
-    max_total = settings.MAX_OPEN_POSITIONS
-    max_per_symbol = settings.MAX_OPEN_POSITIONS_PER_SYMBOL
-    max_size_usdt = settings.MAX_SIZE_PER_POSITION_USDT
+    if counters is None:
+        counters = open_position_counters
 
-    # Tutte le posizioni aperte
-    base_q = db.query(Position).filter(Position.status == "open")
+    if max_total is None:
+        max_total = settings.MAX_OPEN_POSITIONS
+    if max_per_symbol is None:
+        max_per_symbol = settings.MAX_OPEN_POSITIONS_PER_SYMBOL
+    max_size_usdt = settings.MAX_SIZE_PER_POSITION_USDT
 
-    total_open = base_q.count()
-    open_for_symbol = base_q.filter(Position.symbol == symbol).count()
+    with counters.lock:
+        total_open = counters.total()
+        open_for_symbol = counters.for_symbol(symbol)
 
-    # Controllo limite totale
-    if total_open >= max_total:
-        reason = f"max_total_open_reached (total={total_open}, limit={max_total})"
-        logger.info(
-            {
-                "event": "risk_block",
-                "scope": "total",
-                "symbol": symbol,
-                "total_open": total_open,
-                "limit": max_total,
-                "reason": reason,
-            }
-        )
-        return False, reason
+        # Controllo limite totale
+        if total_open >= max_total:
+            reason = f"max_total_open_reached (total={total_open}, limit={max_total})"
+            RISK_BLOCKS.inc("total")
+            logger.info(
+                {
+                    "event": "risk_block",
+                    "scope": "total",
+                    "symbol": symbol,
+                    "total_open": total_open,
+                    "limit": max_total,
+                    "reason": reason,
+                }
+            )
+            return False, reason
 
-    # Controllo limite per simbolo
-    if open_for_symbol >= max_per_symbol:
-        reason = (
-            f"max_symbol_open_reached (symbol={symbol}, "
-            f"count={open_for_symbol}, limit={max_per_symbol})"
-        )
-        logger.info(
-            {
-                "event": "risk_block",
-                "scope": "symbol",
-                "symbol": symbol,
-                "open_for_symbol": open_for_symbol,
-                "limit": max_per_symbol,
-                "reason": reason,
-            }
-        )
-        return False, reason
-
-    # Controllo limite di size (notional) per posizione, se abbiamo i dati necessari
-    if (
-        max_size_usdt is not None
-        and max_size_usdt > 0
-        and entry_price is not None
-        and qty is not None
-    ):
-        notional = float(entry_price) * float(qty)
-
-        if notional > max_size_usdt:
+        # Controllo limite per simbolo
+        if open_for_symbol >= max_per_symbol:
             reason = (
-                "max_size_per_position_exceeded "
-                f"(notional={notional:.4f}, limit={max_size_usdt:.4f})"
+                f"max_symbol_open_reached (symbol={symbol}, "
+                f"count={open_for_symbol}, limit={max_per_symbol})"
             )
+            RISK_BLOCKS.inc("symbol")
             logger.info(
                 {
                     "event": "risk_block",
-                    "scope": "size",
+                    "scope": "symbol",
                     "symbol": symbol,
-                    "entry_price": float(entry_price),
-                    "qty": float(qty),
-                    "notional": notional,
-                    "limit": float(max_size_usdt),
+                    "open_for_symbol": open_for_symbol,
+                    "limit": max_per_symbol,
                     "reason": reason,
                 }
             )
             return False, reason
 
-    # Tutto ok, si può aprire
+        # Controllo limite di size (notional) per posizione, se abbiamo i dati necessari
+        if (
+            max_size_usdt is not None
+            and max_size_usdt > 0
+            and entry_price is not None
+            and qty is not None
+        ):
+            notional = float(entry_price) * float(qty)
+
+            if notional > max_size_usdt:
+                reason = (
+                    "max_size_per_position_exceeded "
+                    f"(notional={notional:.4f}, limit={max_size_usdt:.4f})"
+                )
+                RISK_BLOCKS.inc("size")
+                logger.info(
+                    {
+                        "event": "risk_block",
+                        "scope": "size",
+                        "symbol": symbol,
+                        "entry_price": float(entry_price),
+                        "qty": float(qty),
+                        "notional": notional,
+                        "limit": float(max_size_usdt),
+                        "reason": reason,
+                    }
+                )
+                return False, reason
+
+        # Tutto ok, si può aprire: prenotiamo lo slot
+        counters.reserve(symbol)
+
     return True, None
 
 
-def auto_close_positions(db: Session) -> None:
+def load_in_memory_state(db: Session) -> None:
+    """
+    Carica dal DB lo stato in memoria dell'OMS (chiamato allo startup):
+    book delle posizioni aperte, contatori di rischio e aggregato di /stats.
+    """
+    if lease_coordination():
+        # da qui in poi sync_in_memory_state applica gli eventi degli altri worker
+        position_events.start(db)
+    position_book.load(db)
+    open_position_counters.reconcile(db)
+    stats_accumulator.rebuild(db)
+    backfill_if_empty(db)
+
+
+def sync_in_memory_state(db: Session) -> Optional[dict]:
+    """
+    Con WATCHER_COORDINATION="lease": applica allo stato in memoria (book,
+    contatori di rischio, /stats) le aperture e chiusure committate dagli
+    altri worker dall'ultimo giro, in modo incrementale come quelle locali.
+    Se nessuno ha scritto nulla costa una query vuota su position_events.
+    Ritorna {"opened": n, "closed": n}, oppure None se non c'era nulla.
+    """
+    events = position_events.poll(db)
+    if not events:
+        return None
+
+    # entry per il book delle aperture ancora aperte (una query per giro)
+    opened_ids = [e.position_id for e in events if e.kind == "open"]
+    entries: dict[int, BookEntry] = {}
+    if opened_ids:
+        rows = db.scalars(
+            select(Position).where(Position.id.in_(opened_ids), Position.status == "open")
+        ).all()
+        entries = {pos.id: _entry_from_position(pos) for pos in rows}
+
+    opened = closed = 0
+    for event in events:
+        if event.kind == "open":
+            open_position_counters.on_open(event.symbol)
+            stats_accumulator.on_open()
+            entry = entries.get(event.position_id)
+            if entry is not None:
+                position_book.add_entry(entry)
+            opened += 1
+        else:
+            position_book.remove(event.position_id)
+            open_position_counters.on_close(event.symbol)
+            stats_accumulator.on_close(event.pnl, event.reason)
+            closed += 1
+
+    return {"opened": opened, "closed": closed}
+
+
+@dataclass
+class OpenedOrder:
+    """
+    Ordine + posizione creati da add_order_with_position: id assegnati dal
+    flush ed entry per il book, letti PRIMA del commit (dopo il commit gli
+    oggetti ORM sono scaduti e rileggerli costerebbe una SELECT ciascuno).
+    """
+    order_id: int
+    position_id: int
+    entry: BookEntry
+
+
+def add_order_with_position(
+    db: Session,
+    symbol: str,
+    side: str,
+    qty: float,
+    entry_price: float,
+    tp_price: Optional[float],
+    sl_price: Optional[float],
+    order_type: str = "market",
+    exchange: Optional[str] = None,
+    timeframe_min: Optional[int] = None,
+    strategy: Optional[str] = None,
+) -> OpenedOrder:
+    """
+    Unit of work di apertura: Order + Position collegata (order_id) nella
+    transazione corrente, con un solo flush (due INSERT, id dal DB).
+    NON committa: il chiamante può aggiungere altro alla stessa transazione
+    (es. ricevuta del segnale) e poi committa una volta sola.
+    exchange / timeframe_min / strategy (contesto del segnale) vanno su
+    entrambe le righe.
+    """
+    now = datetime.utcnow()
+    context = {"exchange": exchange, "timeframe_min": timeframe_min, "strategy": strategy}
+    order = Order(
+        symbol=symbol,
+        side=side,
+        qty=qty,
+        order_type=order_type,
+        tp_price=tp_price,
+        sl_price=sl_price,
+        status="created",
+        created_at=now,
+        **context,
+    )
+    position = Position(
+        order=order,
+        symbol=symbol,
+        side=side,
+        qty=qty,
+        entry_price=entry_price,
+        tp_price=tp_price,
+        sl_price=sl_price,
+        status="open",
+        created_at=now,
+        **context,
+    )
+    db.add(position)
+    db.flush()
+    if lease_coordination():
+        position_events.add_opens(db, [(position.id, symbol)])
+    return OpenedOrder(order.id, position.id, _entry_from_position(position))
+
+
+def create_order_with_position(
+    db: Session,
+    symbol: str,
+    side: str,
+    qty: float,
+    entry_price: float,
+    tp_price: Optional[float],
+    sl_price: Optional[float],
+    order_type: str = "market",
+    exchange: Optional[str] = None,
+    timeframe_min: Optional[int] = None,
+    strategy: Optional[str] = None,
+    reserved: bool = False,
+    op: str = "order",
+) -> OpenedOrder:
+    """
+    add_order_with_position + commit (una transazione, un commit) e
+    aggiornamento dello stato in memoria. In caso di errore fa rollback e,
+    se `reserved`, libera lo slot prenotato da check_risk_limits.
+    """
+    try:
+        opened = add_order_with_position(
+            db,
+            symbol,
+            side,
+            qty,
+            entry_price,
+            tp_price,
+            sl_price,
+            order_type,
+            exchange=exchange,
+            timeframe_min=timeframe_min,
+            strategy=strategy,
+        )
+        with DB_COMMIT_SECONDS.time(op):
+            db.commit()
+    except Exception:
+        db.rollback()
+        if reserved:
+            open_position_counters.release(symbol)
+        raise
+
+    register_opened_position(opened.entry, reserved=reserved)
+    return opened
+
+
+def register_opened_position(entry: BookEntry, reserved: bool = False) -> None:
     """
-    Controlla tutte le posizioni aperte e le chiude in modalità paper
+    Aggiorna lo stato in memoria dopo il commit di una nuova posizione.
+    `reserved=True` se lo slot era stato prenotato da check_risk_limits.
+    """
+    if reserved:
+        open_position_counters.confirm(entry.symbol)
+    else:
+        open_position_counters.on_open(entry.symbol)
+    position_book.add_entry(entry)
+    stats_accumulator.on_open()
+    POSITIONS_OPENED.inc()
+
+
+def register_closed_position(
+    pos_id: int,
+    symbol: str,
+    pnl: Optional[float],
+    reason: Optional[str],
+) -> None:
+    """Aggiorna lo stato in memoria dopo il commit della chiusura di una Position."""
+    position_book.remove(pos_id)
+    open_position_counters.on_close(symbol)
+    stats_accumulator.on_close(pnl, reason)
+    POSITIONS_CLOSED.inc(reason or "unknown")
+
+
+def auto_close_positions(db: Session) -> int:
+    """
+    Controlla le posizioni aperte e le chiude in modalità paper
     quando il prezzo simulato raggiunge TP (tp_price) o SL (sl_price).
     Le posizioni più giovani di 7 secondi NON vengono chiuse.
+
+    Usato dal watcher in modalità "poll": prende dallo snapshot prezzi
+    un prezzo per ogni simbolo presente nel book (tutte le posizioni di
+    un simbolo vedono lo stesso prezzo) e delega a close_triggered_positions.
+    Ritorna il numero di posizioni chiuse.
+    """
+    prices = price_snapshot.get_many(position_book.symbols())
+    return close_triggered_positions(db, prices)
+
+
+def close_triggered_positions(db: Session, prices: dict[str, float]) -> int:
     """
+    Chiude le posizioni aperte dei simboli in `prices` che toccano TP o SL.
+
+    Le posizioni vengono lette dal PositionBook in memoria (non dal DB):
+    per ogni simbolo si toccano solo le posizioni le cui soglie TP/SL
+    sono state attraversate da quel prezzo.
 
-    open_positions = db.query(Position).filter(Position.status == "open").all()
+    Tutte le chiusure decise nel tick vengono applicate con un solo
+    UPDATE (executemany) in un'unica transazione. Ritorna il numero
+    di posizioni chiuse.
+    """
+
+    started = time.perf_counter()
     now = datetime.utcnow()  # momento attuale, usato per calcolare l'età
 
-    for pos in open_positions:
-        # ⏱️ NON chiudere posizioni create da meno di 7 secondi
-        if pos.created_at is not None:
-            age_sec = (now - pos.created_at).total_seconds()
-            if age_sec < 7:
-                continue
+    closes = evaluate_closes(position_book, prices, now)
 
-        # Se non ha né TP né SL non c'è nulla da fare
-        if pos.tp_price is None and pos.sl_price is None:
-            continue
+    if not closes:
+        WATCHER_TICK_SECONDS.observe(time.perf_counter() - started)
+        return 0
 
-        # Prezzo corrente dal market simulator
-        price = MarketSimulator.get_price(pos.symbol)
-        current_price = float(price)
+    closed, commit_ms = _commit_closes(db, closes, now)
 
-        # Converte TP/SL in float se presenti
-        tp: Optional[float] = float(pos.tp_price) if pos.tp_price is not None else None
-        sl: Optional[float] = float(pos.sl_price) if pos.sl_price is not None else None
+    duration = time.perf_counter() - started
+    WATCHER_TICK_SECONDS.observe(duration)
 
-        side = _normalize_side(pos.side)
+    logger.info(
+        {
+            "event": "auto_close_tick",
+            "candidates": len(closes),
+            "closed": len(closed),
+            "commit_ms": round(commit_ms, 3),
+            "duration_ms": round(duration * 1000.0, 3),
+        }
+    )
+    return len(closed)
 
-        hit_tp = False
-        hit_sl = False
 
-        if tp is not None:
-            if side == "long":
-                hit_tp = current_price >= tp
-            elif side == "short":
-                hit_tp = current_price <= tp
+def evaluate_closes(
+    book: PositionBook,
+    prices: dict[str, float],
+    now: datetime,
+) -> list[dict]:
+    """
+    Decide le chiusure TP/SL di un tick su `book` (senza toccare il DB),
+    con l'evaluator scelto da AUTO_CLOSE_EVALUATOR. Usata dal watcher del
+    processo API e dai processi shard (modalità "sharded").
+    """
+    closes: list[dict] = []
 
-        if sl is not None:
-            if side == "long":
-                hit_sl = current_price <= sl
-            elif side == "short":
-                hit_sl = current_price >= sl
+    if settings.AUTO_CLOSE_EVALUATOR == "columnar":
+        # tutte le posizioni del tick in poche operazioni su array NumPy
+        for entry, reason, exit_price, pnl in book.triggered_columnar(prices, now):
+            closes.append(
+                {
+                    "pos_id": entry.id,
+                    "symbol": entry.symbol,
+                    "side": entry.side,
+                    "reason": reason,
+                    "entry": entry.entry_price,
+                    "exit": exit_price,
+                    "pnl": pnl,
+                    "qty": entry.qty,
+                }
+            )
+        return closes
 
-        # Nessun trigger → continua
-        if not (hit_tp or hit_sl):
-            continue
+    for symbol, current_price in prices.items():
+        for entry, reason in book.triggered(symbol, current_price, now):
+            # Calcolo PnL
+            if entry.side == "long":
+                pnl = (current_price - entry.entry_price) * entry.qty
+            else:  # short
+                pnl = (entry.entry_price - current_price) * entry.qty
+
+            closes.append(
+                {
+                    "pos_id": entry.id,
+                    "symbol": symbol,
+                    "side": entry.side,
+                    "reason": reason,
+                    "entry": entry.entry_price,
+                    "exit": current_price,
+                    "pnl": pnl,
+                    "qty": entry.qty,
+                }
+            )
+    return closes
 
-        reason = "tp" if hit_tp else "sl"
 
-        # ✅ NIENTE Order di chiusura per ora, aggiorniamo solo la Position
-        pos.status = "closed"
-        pos.closed_at = now
-        pos.close_price = current_price
-        pos.auto_close_reason = reason
+def apply_shard_closes(db: Session, closes: list[dict]) -> int:
+    """
+    Writer DB della modalità "sharded": applica in una transazione le
+    chiusure decise dai processi shard (già valutate, nell'ordine di arrivo).
+    Ritorna il numero di posizioni chiuse.
+    """
+    closed, commit_ms = _commit_closes(db, closes, datetime.utcnow())
 
-        # Calcolo PnL
-        entry = float(pos.entry_price)
-        qty = float(pos.qty)
+    logger.info(
+        {
+            "event": "shard_closes_applied",
+            "candidates": len(closes),
+            "closed": len(closed),
+            "commit_ms": round(commit_ms, 3),
+        }
+    )
+    return len(closed)
 
-        if side == "long":
-            pos.pnl = (current_price - entry) * qty
-        else:  # short
-            pos.pnl = (entry - current_price) * qty
 
-        db.commit()
+def _commit_closes(db: Session, closes: list[dict], now: datetime) -> tuple[list[dict], float]:
+    commit_started = time.perf_counter()
+    closed = _apply_closes(db, closes, now)
+    commit_ms = (time.perf_counter() - commit_started) * 1000.0
+
+    # Log per-posizione solo dopo il commit
+    for close in closed:
+        logger.info({"event": "position_closed", **close})
+
+    return closed, commit_ms
+
+
+# id per UPDATE: resta ben sotto il limite di parametri di SQLite
+_CLOSE_CHUNK = 500
+
 
-        logger.info(
+def _apply_closes(db: Session, closes: list[dict], now: datetime) -> list[dict]:
+    """
+    Applica in un'unica transazione le chiusure raccolte in un tick.
+
+    Ogni blocco di chiusure è un solo UPDATE ... WHERE id IN (...) AND
+    status = 'open' RETURNING id: controllo e scrittura sono atomici, quindi
+    una posizione chiusa nel frattempo da un altro percorso (es. chiusura
+    manuale) non viene toccata. Rollup, stato in memoria e log solo per le
+    righe davvero aggiornate; le altre escono comunque dal book.
+    Con WATCHER_COORDINATION="lease" la transazione verifica (e blocca) il
+    lease: se questo worker non è più il leader non chiude nulla.
+    Ritorna le chiusure effettive.
+    """
+    if lease_coordination() and not watcher_lease.fence(db):
+        db.rollback()
+        logger.warning(
             {
-                "event": "position_closed",
-                "reason": reason,
-                "symbol": pos.symbol,
-                "entry": entry,
-                "exit": current_price,
-                "pnl": float(pos.pnl),
-                "qty": qty,
-                "pos_id": pos.id,
+                "event": "watcher_lease_fenced",
+                "owner": watcher_lease.owner,
+                "candidates": len(closes),
             }
         )
+        return []
+
+    table = Position.__table__
+    updated: set[int] = set()
+
+    for i in range(0, len(closes), _CLOSE_CHUNK):
+        chunk = closes[i:i + _CLOSE_CHUNK]
+        ids = [c["pos_id"] for c in chunk]
+
+        def _per_id(field: str):
+            return case({c["pos_id"]: c[field] for c in chunk}, value=table.c.id)
+
+        updated.update(
+            db.scalars(
+                update(table)
+                .where(table.c.id.in_(ids), table.c.status == "open")
+                .values(
+                    status="closed",
+                    closed_at=now,
+                    close_price=_per_id("exit"),
+                    pnl=_per_id("pnl"),
+                    auto_close_reason=_per_id("reason"),
+                )
+                .returning(table.c.id)
+            )
+        )
+
+    closed = [c for c in closes if c["pos_id"] in updated]
+
+    # rollup di /stats/timeseries (ed eventi per gli altri worker) nella stessa transazione
+    record_closes(db, [(now, c["symbol"], c["side"], c["pnl"]) for c in closed])
+    if lease_coordination():
+        position_events.add_closes(
+            db, [(c["pos_id"], c["symbol"], c["pnl"], c["reason"]) for c in closed]
+        )
+    with DB_COMMIT_SECONDS.time("auto_close"):
+        db.commit()
+
+    for c in closed:
+        register_closed_position(c["pos_id"], c["symbol"], c["pnl"], c["reason"])
+
+    # quelle già chiuse altrove escono comunque dal book
+    for c in closes:
+        if c["pos_id"] not in updated:
+            position_book.remove(c["pos_id"])
+
+    return closed
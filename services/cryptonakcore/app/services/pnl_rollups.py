@@ -0,0 +1,182 @@
+from datetime import datetime
+import logging
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.models import PnlRollup, Position
+
+logger = logging.getLogger("pnl_rollups")
+
+# Bucket supportati da /stats/timeseries
+BUCKETS = ("1h", "1d")
+
+_KEY = ("bucket", "symbol", "side", "bucket_start")
+
+
+def bucket_start(ts: datetime, bucket: str) -> datetime:
+    """Inizio del bucket che contiene `ts` (ora o giorno, UTC naive)."""
+    if bucket == "1h":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if bucket == "1d":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"bucket non supportato: {bucket}")
+
+
+def _aggregate(
+    closes: Iterable[tuple[datetime, str, str, Optional[float]]],
+) -> list[dict]:
+    """Chiusure (closed_at, symbol, side, pnl) -> righe di rollup, una per chiave."""
+    rows: dict[tuple, dict] = {}
+    for closed_at, symbol, side, pnl in closes:
+        if closed_at is None:
+            continue
+        for bucket in BUCKETS:
+            key = (bucket, symbol, side, bucket_start(closed_at, bucket))
+            row = rows.get(key)
+            if row is None:
+                row = dict(zip(_KEY, key), trades=0, wins=0, losses=0, pnl=0.0)
+                rows[key] = row
+            row["trades"] += 1
+            if pnl is not None:
+                row["pnl"] += pnl
+                if pnl > 0:
+                    row["wins"] += 1
+                elif pnl < 0:
+                    row["losses"] += 1
+    return list(rows.values())
+
+
+def record_closes(
+    db: Session,
+    closes: Iterable[tuple[datetime, str, str, Optional[float]]],
+) -> None:
+    """
+    Aggiunge ai rollup le chiusure (closed_at, symbol, side normalizzato, pnl)
+    nella transazione corrente, senza commit: va chiamata prima del commit
+    che chiude le posizioni. Una riga per (bucket, simbolo, side, inizio
+    bucket), con upsert che somma ai valori esistenti.
+    """
+    rows = _aggregate(closes)
+    if not rows:
+        return
+
+    # ON CONFLICT DO UPDATE: stessa API per SQLite e PostgreSQL
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    table = PnlRollup.__table__
+    stmt = dialect.insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(_KEY),
+        set_={
+            "trades": table.c.trades + stmt.excluded.trades,
+            "wins": table.c.wins + stmt.excluded.wins,
+            "losses": table.c.losses + stmt.excluded.losses,
+            "pnl": table.c.pnl + stmt.excluded.pnl,
+        },
+    )
+    db.execute(stmt, rows)
+
+
+def backfill_if_empty(db: Session) -> int:
+    """
+    Allo startup: se i rollup sono vuoti ma ci sono posizioni chiuse (DB
+    creato prima dei rollup) li ricostruisce da `positions`, una volta sola.
+    Ritorna il numero di righe di rollup scritte.
+    """
+    if db.scalar(select(PnlRollup.id).limit(1)) is not None:
+        return 0
+    if db.scalar(select(Position.id).where(Position.status == "closed").limit(1)) is None:
+        return 0
+
+    rows = db.execute(
+        select(Position.closed_at, Position.symbol, Position.side, Position.pnl).where(
+            Position.status == "closed"
+        )
+    ).yield_per(5000)
+
+    # import locale: app.services.oms importa questo modulo
+    from app.services.oms import _normalize_side
+
+    aggregated = _aggregate(
+        (closed_at, symbol, _normalize_side(side), pnl) for closed_at, symbol, side, pnl in rows
+    )
+
+    db.execute(delete(PnlRollup))
+    if aggregated:
+        db.execute(PnlRollup.__table__.insert(), aggregated)
+    try:
+        db.commit()
+    except IntegrityError:
+        # un altro worker ha fatto lo stesso backfill nel frattempo
+        db.rollback()
+        return 0
+
+    logger.info({"event": "pnl_rollups_backfilled", "rows": len(aggregated)})
+    return len(aggregated)
+
+
+def timeseries(
+    db: Session,
+    bucket: str,
+    symbol: Optional[str] = None,
+    side: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> list[dict]:
+    """
+    Serie per bucket dai rollup: PnL realizzato, trade, vincenti/perdenti,
+    winrate (%) ed equity cumulativa (PnL realizzato totale a fine bucket,
+    anche quello precedente a `since`). Il costo dipende dal numero di
+    bucket/simboli, non dal numero di posizioni.
+    """
+    filters = [PnlRollup.bucket == bucket]
+    if symbol is not None:
+        filters.append(PnlRollup.symbol == symbol)
+    if side is not None:
+        filters.append(PnlRollup.side == side)
+
+    equity = 0.0
+    if since is not None:
+        equity = float(
+            db.scalar(
+                select(func.coalesce(func.sum(PnlRollup.pnl), 0.0)).where(
+                    *filters, PnlRollup.bucket_start < bucket_start(since, bucket)
+                )
+            )
+        )
+        filters.append(PnlRollup.bucket_start >= bucket_start(since, bucket))
+    if until is not None:
+        filters.append(PnlRollup.bucket_start < until)
+
+    rows = db.execute(
+        select(
+            PnlRollup.bucket_start,
+            func.sum(PnlRollup.trades),
+            func.sum(PnlRollup.wins),
+            func.sum(PnlRollup.losses),
+            func.sum(PnlRollup.pnl),
+        )
+        .where(*filters)
+        .group_by(PnlRollup.bucket_start)
+        .order_by(PnlRollup.bucket_start)
+    ).all()
+
+    points: list[dict] = []
+    for start, trades, wins, losses, pnl in rows:
+        equity += float(pnl)
+        points.append(
+            {
+                "bucket_start": start,
+                "trades": int(trades),
+                "wins": int(wins),
+                "losses": int(losses),
+                "pnl": float(pnl),
+                # stessa definizione di /stats: vincenti / trade chiusi
+                "winrate": (int(wins) / int(trades)) * 100.0 if trades else 0.0,
+                "equity": equity,
+            }
+        )
+    return points
@@ -0,0 +1,309 @@
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass
+from datetime import datetime
+import math
+import threading
+from typing import Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db.models import Position
+from app.services.position_columns import REASON_NAMES, PositionColumns
+
+# Età minima (secondi) prima che una posizione possa essere chiusa in automatico
+MIN_AGE_SEC = 7
+
+
+@dataclass
+class BookEntry:
+    """
+    Copia "leggera" di una Position aperta, tenuta in memoria dal PositionBook.
+    Contiene solo i campi necessari per valutare TP/SL e calcolare il PnL.
+    """
+    id: int
+    symbol: str
+    side: str  # già normalizzato: "long" / "short"
+    qty: float
+    entry_price: float
+    tp_price: Optional[float]
+    sl_price: Optional[float]
+    created_at: Optional[datetime]
+
+
+class _SideIndex:
+    """
+    Soglie TP/SL ordinate per una coppia (symbol, side).
+    Le liste contengono tuple (soglia, position_id), ordinate per soglia.
+    """
+
+    def __init__(self) -> None:
+        self.tp: list[tuple[float, int]] = []
+        self.sl: list[tuple[float, int]] = []
+
+    def __bool__(self) -> bool:
+        return bool(self.tp or self.sl)
+
+
+def _discard(levels: list[tuple[float, int]], key: tuple[float, int]) -> None:
+    i = bisect_left(levels, key)
+    if i < len(levels) and levels[i] == key:
+        del levels[i]
+
+
+def _below(levels: list[tuple[float, int]], price: float) -> list[tuple[float, int]]:
+    """Soglie <= price."""
+    return levels[: bisect_right(levels, (price, math.inf))]
+
+
+def _above(levels: list[tuple[float, int]], price: float) -> list[tuple[float, int]]:
+    """Soglie >= price."""
+    return levels[bisect_left(levels, (price, -math.inf)):]
+
+
+class PositionBook:
+    """
+    Book in memoria delle posizioni aperte.
+
+    - caricato una volta allo startup (load) dal DB
+    - aggiornato da /signals/bounce, POST /orders e /positions/{id}/close
+      (aperture sempre via add_entry, chiusure via remove)
+    - per ogni (symbol, side) mantiene le soglie TP/SL ordinate, così un
+      aggiornamento di prezzo su un simbolo tocca solo le posizioni
+      le cui soglie sono state effettivamente attraversate.
+    - tiene anche una copia colonnare (PositionColumns) per la valutazione
+      vettoriale di tutto il book in un tick (triggered_columnar).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: dict[int, BookEntry] = {}
+        self._index: dict[tuple[str, str], _SideIndex] = {}
+        self._columns = PositionColumns()
+        # opzionale: riceve on_add(entry) / on_remove(entry) (es. ShardedWatcher)
+        self._listener = None
+
+    def set_listener(self, listener) -> None:
+        """
+        Registra (o toglie, con None) un listener notificato ad ogni
+        aggiunta/rimozione. I callback sono chiamati sotto il lock del
+        book: devono essere veloci e non usare il book.
+        """
+        with self._lock:
+            self._listener = listener
+
+    # ---------- caricamento / aggiornamento ----------
+
+    def load(self, db: Session) -> int:
+        """Ricarica il book da zero con tutte le posizioni aperte nel DB."""
+        rows = db.query(Position).filter(Position.status == "open").all()
+        with self._lock:
+            if self._listener is not None:
+                # il listener deve vedere anche le rimozioni
+                for pos_id in list(self._entries):
+                    self._remove(pos_id)
+            self._entries.clear()
+            self._index.clear()
+            self._columns.clear()
+            for pos in rows:
+                self._add(_entry_from_position(pos))
+        return len(rows)
+
+    def sync(self, db: Session) -> tuple[int, int]:
+        """
+        Riallinea il book con le posizioni aperte nel DB (con più worker le
+        posizioni vengono aperte/chiuse anche da altri processi): aggiunge
+        quelle mancanti e toglie quelle non più aperte.
+        Ritorna (aggiunte, rimosse).
+        """
+        # snapshot PRIMA della query: una posizione aggiunta nel frattempo
+        # (già committata ma non vista dalla query) non va tolta
+        with self._lock:
+            known_before = set(self._entries)
+
+        open_ids = set(db.scalars(select(Position.id).where(Position.status == "open")))
+
+        with self._lock:
+            missing = open_ids - set(self._entries)
+        stale = known_before - open_ids
+
+        rows = []
+        if missing:
+            rows = db.scalars(
+                select(Position).where(Position.id.in_(missing), Position.status == "open")
+            ).all()
+
+        with self._lock:
+            for pos in rows:
+                if pos.id not in self._entries:
+                    self._add(_entry_from_position(pos))
+            for pos_id in stale:
+                self._remove(pos_id)
+
+        return len(rows), len(stale)
+
+    def add_entry(self, entry: BookEntry) -> None:
+        """
+        Aggiunge la posizione di un'entry già pronta: posizione appena
+        committata (register_opened_position) o ricevuta da un altro processo.
+        """
+        with self._lock:
+            self._add(entry)
+
+    def remove(self, position_id: int) -> Optional[BookEntry]:
+        """Rimuove una posizione dal book (chiusa). Ritorna l'entry, se c'era."""
+        with self._lock:
+            return self._remove(position_id)
+
+    def _add(self, entry: BookEntry) -> None:
+        if entry.id in self._entries:
+            self._remove(entry.id)
+        self._entries[entry.id] = entry
+        self._columns.add(
+            entry.id,
+            entry.symbol,
+            entry.side,
+            entry.qty,
+            entry.entry_price,
+            entry.tp_price,
+            entry.sl_price,
+            entry.created_at,
+        )
+
+        if self._listener is not None:
+            self._listener.on_add(entry)
+
+        if entry.side not in ("long", "short"):
+            # side non valido: non potrà mai toccare TP/SL
+            return
+
+        idx = self._index.setdefault((entry.symbol, entry.side), _SideIndex())
+        if entry.tp_price is not None:
+            insort(idx.tp, (entry.tp_price, entry.id))
+        if entry.sl_price is not None:
+            insort(idx.sl, (entry.sl_price, entry.id))
+
+    def _remove(self, position_id: int) -> Optional[BookEntry]:
+        entry = self._entries.pop(position_id, None)
+        if entry is None:
+            return None
+        self._columns.remove(position_id)
+        if self._listener is not None:
+            self._listener.on_remove(entry)
+
+        key = (entry.symbol, entry.side)
+        idx = self._index.get(key)
+        if idx is not None:
+            if entry.tp_price is not None:
+                _discard(idx.tp, (entry.tp_price, entry.id))
+            if entry.sl_price is not None:
+                _discard(idx.sl, (entry.sl_price, entry.id))
+            if not idx:
+                del self._index[key]
+        return entry
+
+    # ---------- lettura ----------
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, position_id: int) -> Optional[BookEntry]:
+        return self._entries.get(position_id)
+
+    def entries(self) -> list[BookEntry]:
+        """Snapshot di tutte le entry del book."""
+        with self._lock:
+            return list(self._entries.values())
+
+    def symbols(self) -> list[str]:
+        """Simboli che hanno almeno una posizione con TP o SL da monitorare."""
+        with self._lock:
+            return sorted({symbol for symbol, _ in self._index})
+
+    def triggered(
+        self,
+        symbol: str,
+        price: float,
+        now: datetime,
+    ) -> list[tuple[BookEntry, str]]:
+        """
+        Ritorna le posizioni di `symbol` che a `price` toccano TP o SL,
+        come lista di (entry, reason) con reason "tp" / "sl".
+
+        Come nella logica originale, se sono attraversati sia TP che SL
+        vince il TP; le posizioni più giovani di MIN_AGE_SEC sono saltate.
+        """
+        with self._lock:
+            hits: dict[int, str] = {}
+
+            long_idx = self._index.get((symbol, "long"))
+            if long_idx is not None:
+                # long: TP se price >= tp, SL se price <= sl
+                _collect(hits, _above(long_idx.sl, price), "sl")
+                _collect(hits, _below(long_idx.tp, price), "tp")
+
+            short_idx = self._index.get((symbol, "short"))
+            if short_idx is not None:
+                # short: TP se price <= tp, SL se price >= sl
+                _collect(hits, _below(short_idx.sl, price), "sl")
+                _collect(hits, _above(short_idx.tp, price), "tp")
+
+            result: list[tuple[BookEntry, str]] = []
+            for pos_id, reason in hits.items():
+                entry = self._entries[pos_id]
+                if entry.created_at is not None:
+                    age_sec = (now - entry.created_at).total_seconds()
+                    if age_sec < MIN_AGE_SEC:
+                        continue
+                result.append((entry, reason))
+
+        result.sort(key=lambda item: item[0].id)
+        return result
+
+    def triggered_columnar(
+        self,
+        prices: dict[str, float],
+        now: datetime,
+    ) -> list[tuple[BookEntry, str, float, float]]:
+        """
+        Variante vettoriale di `triggered` per tutti i simboli di un tick:
+        ritorna (entry, reason, exit_price, pnl) nello stesso ordine della
+        valutazione simbolo per simbolo (ordine di `prices`, poi id).
+        """
+        with self._lock:
+            hits = self._columns.evaluate(prices, now, MIN_AGE_SEC)
+            return [
+                (self._entries[pos_id], REASON_NAMES[reason], exit_price, pnl)
+                for pos_id, reason, exit_price, pnl in zip(
+                    hits.ids.tolist(),
+                    hits.reasons.tolist(),
+                    hits.exit_prices.tolist(),
+                    hits.pnl.tolist(),
+                )
+            ]
+
+
+def _collect(hits: dict[int, str], levels: Iterable[tuple[float, int]], reason: str) -> None:
+    # chiamato prima per SL e poi per TP, così il TP sovrascrive
+    for _, pos_id in levels:
+        hits[pos_id] = reason
+
+
+def _entry_from_position(pos: Position) -> BookEntry:
+    # import locale: app.services.oms importa già questo modulo
+    from app.services.oms import _normalize_side
+
+    return BookEntry(
+        id=pos.id,
+        symbol=pos.symbol,
+        side=_normalize_side(pos.side),
+        qty=float(pos.qty),
+        entry_price=float(pos.entry_price),
+        tp_price=float(pos.tp_price) if pos.tp_price is not None else None,
+        sl_price=float(pos.sl_price) if pos.sl_price is not None else None,
+        created_at=pos.created_at,
+    )
+
+
+# Istanza condivisa dal processo (API + scheduler)
+position_book = PositionBook()
@@ -0,0 +1,189 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+
+# Codifica del side nella colonna int8
+SIDE_NONE = 0
+SIDE_LONG = 1
+SIDE_SHORT = -1
+
+# Codifica del motivo di chiusura
+REASON_TP = 1
+REASON_SL = 2
+REASON_NAMES = {REASON_TP: "tp", REASON_SL: "sl"}
+
+# created_at mancante (posizione senza età: sempre valutabile)
+NO_CREATED_AT = np.iinfo(np.int64).min
+
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+
+_SIDE_CODES = {"long": SIDE_LONG, "short": SIDE_SHORT}
+
+
+def epoch_us(dt: datetime) -> int:
+    """
+    datetime naive UTC (come Position.created_at / utcnow) → microsecondi epoch.
+    Intero esatto: l'età si confronta senza errori di arrotondamento float.
+    """
+    return (dt - _EPOCH) // _US
+
+
+@dataclass
+class ColumnarHits:
+    """Posizioni toccate in un tick: un array per campo, ordinate per (simbolo, id)."""
+    ids: np.ndarray
+    reasons: np.ndarray  # REASON_TP / REASON_SL
+    exit_prices: np.ndarray
+    pnl: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.ids.size)
+
+
+class PositionColumns:
+    """
+    Le posizioni aperte in formato colonnare (un array NumPy per campo).
+
+    Le righe sono dense [0, n): una rimozione sposta l'ultima riga nel buco.
+    TP/SL mancanti sono NaN (ogni confronto con NaN è falso, come il
+    `is not None` della logica scalare). Non è thread-safe: la usa il
+    PositionBook sotto il proprio lock.
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self._alloc(capacity)
+        self.n = 0
+        self._row: dict[int, int] = {}
+        self._symbol_codes: dict[str, int] = {}
+
+    def _alloc(self, capacity: int) -> None:
+        self.id = np.zeros(capacity, dtype=np.int64)
+        self.symbol = np.zeros(capacity, dtype=np.int32)
+        self.side = np.zeros(capacity, dtype=np.int8)
+        self.qty = np.zeros(capacity, dtype=np.float64)
+        self.entry = np.zeros(capacity, dtype=np.float64)
+        self.tp = np.full(capacity, np.nan, dtype=np.float64)
+        self.sl = np.full(capacity, np.nan, dtype=np.float64)
+        self.created_us = np.full(capacity, NO_CREATED_AT, dtype=np.int64)
+
+    def _grow(self) -> None:
+        old = {
+            name: getattr(self, name)
+            for name in ("id", "symbol", "side", "qty", "entry", "tp", "sl", "created_us")
+        }
+        self._alloc(max(16, 2 * old["id"].size))
+        for name, values in old.items():
+            getattr(self, name)[: self.n] = values[: self.n]
+
+    def __len__(self) -> int:
+        return self.n
+
+    def clear(self) -> None:
+        self.n = 0
+        self._row.clear()
+
+    def add(
+        self,
+        position_id: int,
+        symbol: str,
+        side: str,
+        qty: float,
+        entry_price: float,
+        tp_price: Optional[float],
+        sl_price: Optional[float],
+        created_at: Optional[datetime],
+    ) -> None:
+        if position_id in self._row:
+            self.remove(position_id)
+        if self.n == self.id.size:
+            self._grow()
+
+        i = self.n
+        self.id[i] = position_id
+        self.symbol[i] = self._symbol_codes.setdefault(symbol, len(self._symbol_codes))
+        self.side[i] = _SIDE_CODES.get(side, SIDE_NONE)
+        self.qty[i] = qty
+        self.entry[i] = entry_price
+        self.tp[i] = tp_price if tp_price is not None else np.nan
+        self.sl[i] = sl_price if sl_price is not None else np.nan
+        self.created_us[i] = epoch_us(created_at) if created_at is not None else NO_CREATED_AT
+
+        self._row[position_id] = i
+        self.n += 1
+
+    def remove(self, position_id: int) -> None:
+        i = self._row.pop(position_id, None)
+        if i is None:
+            return
+
+        last = self.n - 1
+        if i != last:
+            for arr in (
+                self.id, self.symbol, self.side, self.qty,
+                self.entry, self.tp, self.sl, self.created_us,
+            ):
+                arr[i] = arr[last]
+            self._row[int(self.id[i])] = i
+        self.n = last
+
+    def evaluate(
+        self,
+        prices: dict[str, float],
+        now: datetime,
+        min_age_sec: float,
+    ) -> ColumnarHits:
+        """
+        Valuta TP/SL di tutte le posizioni con un prezzo in `prices`.
+
+        Stesse regole di PositionBook.triggered + close_triggered_positions:
+        long TP se price >= tp, SL se price <= sl; short il contrario;
+        se toccati entrambi vince il TP; le posizioni più giovani di
+        min_age_sec sono saltate; PnL = (price - entry) * qty per i long,
+        (entry - price) * qty per gli short.
+        """
+        n = self.n
+
+        # prezzo per codice simbolo (NaN = simbolo senza prezzo nel tick)
+        # e rango del simbolo nell'ordine di `prices`, per l'ordinamento finale
+        price_by_code = np.full(len(self._symbol_codes), np.nan)
+        rank_by_code = np.zeros(len(self._symbol_codes), dtype=np.int64)
+        for rank, (symbol, price) in enumerate(prices.items()):
+            code = self._symbol_codes.get(symbol)
+            if code is not None:
+                price_by_code[code] = price
+                rank_by_code[code] = rank
+
+        codes = self.symbol[:n]
+        px = price_by_code[codes]
+        side = self.side[:n]
+        tp = self.tp[:n]
+        sl = self.sl[:n]
+
+        is_long = side == SIDE_LONG
+        is_short = side == SIDE_SHORT
+
+        tp_hit = (is_long & (px >= tp)) | (is_short & (px <= tp))
+        sl_hit = (is_long & (px <= sl)) | (is_short & (px >= sl))
+
+        created = self.created_us[:n]
+        old_enough = (created == NO_CREATED_AT) | (
+            epoch_us(now) - created >= int(min_age_sec * 1_000_000)
+        )
+
+        rows = np.flatnonzero((tp_hit | sl_hit) & old_enough)
+        rows = rows[np.lexsort((self.id[rows], rank_by_code[codes[rows]]))]
+
+        hit_px = px[rows]
+        entry = self.entry[rows]
+        qty = self.qty[rows]
+        pnl = np.where(is_long[rows], (hit_px - entry) * qty, (entry - hit_px) * qty)
+
+        return ColumnarHits(
+            ids=self.id[rows],
+            reasons=np.where(tp_hit[rows], REASON_TP, REASON_SL),
+            exit_prices=hit_px,
+            pnl=pnl,
+        )
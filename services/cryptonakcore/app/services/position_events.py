@@ -0,0 +1,90 @@
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.db.models import PositionEvent
+from app.services.watcher_lease import watcher_lease
+
+
+class PositionEventFeed:
+    """
+    Aperture/chiusure tra worker uvicorn (WATCHER_COORDINATION="lease").
+
+    - add_opens() / add_closes(): nella transazione di chi apre/chiude,
+      senza commit (l'evento esiste solo se la posizione è committata)
+    - poll(): eventi degli altri worker con id > cursore, in ordine di id;
+      una query sulla PK, senza righe se nessuno ha scritto nulla
+    - gli id seguono l'ordine dei commit: SQLite ha un solo writer alla
+      volta e l'evento è scritto dentro la sua transazione
+    """
+
+    def __init__(self, owner: str) -> None:
+        self.owner = owner
+        self._cursor = 0
+
+    def start(self, db: Session) -> None:
+        """Porta il cursore all'ultimo evento (allo startup, prima di caricare lo stato)."""
+        self._cursor = db.scalar(select(func.max(PositionEvent.id))) or 0
+
+    def add_opens(self, db: Session, opened: Iterable[tuple[int, str]]) -> None:
+        """Aperture (position_id, symbol) nella transazione corrente."""
+        self._insert(
+            db,
+            [{"kind": "open", "position_id": pos_id, "symbol": symbol} for pos_id, symbol in opened],
+        )
+
+    def add_closes(
+        self,
+        db: Session,
+        closes: Iterable[tuple[int, str, Optional[float], Optional[str]]],
+    ) -> None:
+        """Chiusure (position_id, symbol, pnl, reason) nella transazione corrente."""
+        self._insert(
+            db,
+            [
+                {"kind": "close", "position_id": pos_id, "symbol": symbol, "pnl": pnl, "reason": reason}
+                for pos_id, symbol, pnl, reason in closes
+            ],
+        )
+
+    def _insert(self, db: Session, rows: list[dict]) -> None:
+        if not rows:
+            return
+        now = datetime.utcnow()
+        for row in rows:
+            row.setdefault("pnl", None)
+            row.setdefault("reason", None)
+            row["owner"] = self.owner
+            row["created_at"] = now
+        db.execute(insert(PositionEvent), rows)
+
+    def poll(self, db: Session) -> list:
+        """Eventi degli altri worker dall'ultimo poll (righe con kind, position_id, symbol, pnl, reason)."""
+        rows = db.execute(
+            select(
+                PositionEvent.id,
+                PositionEvent.owner,
+                PositionEvent.kind,
+                PositionEvent.position_id,
+                PositionEvent.symbol,
+                PositionEvent.pnl,
+                PositionEvent.reason,
+            )
+            .where(PositionEvent.id > self._cursor)
+            .order_by(PositionEvent.id)
+        ).all()
+        if rows:
+            self._cursor = rows[-1].id
+        return [row for row in rows if row.owner != self.owner]
+
+    def purge(self, db: Session, older_than: datetime) -> int:
+        """Cancella gli eventi creati prima di `older_than` (UTC naive). Ritorna quanti."""
+        result = db.execute(delete(PositionEvent).where(PositionEvent.created_at < older_than))
+        db.commit()
+        return result.rowcount
+
+
+# Feed di questo processo (stesso owner del lease)
+position_events = PositionEventFeed(watcher_lease.owner)
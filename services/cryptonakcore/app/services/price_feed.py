@@ -0,0 +1,66 @@
+import asyncio
+import threading
+from typing import Optional
+
+
+class PriceTickBus:
+    """
+    Coda asyncio di tick di prezzo per il position watcher in modalità "push".
+
+    - publish(symbol, price) può essere chiamato da qualsiasi thread
+    - i tick dello stesso simbolo vengono coalescati: finché il simbolo è in
+      coda si tiene solo l'ultimo prezzo, e il consumer lo vede una volta sola
+    - next_batch() attende il primo tick e restituisce tutti i simboli in
+      attesa in quel momento, come dict {symbol: ultimo prezzo}
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._latest: dict[str, float] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Collega il bus all'event loop del consumer (chiamato allo startup)."""
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        with self._lock:
+            self._latest.clear()
+
+    @property
+    def is_bound(self) -> bool:
+        return self._queue is not None
+
+    def publish(self, symbol: str, price: float) -> None:
+        """Pubblica un tick di prezzo. Ignorato se il bus non è attivo."""
+        if self._loop is None or self._queue is None:
+            return
+
+        with self._lock:
+            already_pending = symbol in self._latest
+            self._latest[symbol] = float(price)
+
+        if already_pending:
+            # il consumer non ha ancora visto il tick precedente: coalesciamo
+            return
+
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, symbol)
+
+    async def next_batch(self) -> dict[str, float]:
+        """Attende almeno un tick e ritorna l'ultimo prezzo di ogni simbolo in coda."""
+        assert self._queue is not None, "PriceTickBus non collegato (bind)"
+
+        symbols = [await self._queue.get()]
+        while not self._queue.empty():
+            symbols.append(self._queue.get_nowait())
+
+        with self._lock:
+            return {
+                symbol: self._latest.pop(symbol)
+                for symbol in symbols
+                if symbol in self._latest
+            }
+
+
+# Istanza condivisa dal processo
+price_tick_bus = PriceTickBus()
@@ -0,0 +1,67 @@
+import threading
+import time
+from typing import Callable, Iterable
+
+from app.core.config import settings
+from app.services.market_simulator import MarketSimulator
+
+
+class PriceSnapshot:
+    """
+    Snapshot dei prezzi per simbolo, condiviso da watcher e chiusure manuali.
+
+    - ogni simbolo viene chiesto alla sorgente al massimo una volta ogni
+      `ttl_sec`: tutte le valutazioni dentro quella finestra vedono lo
+      stesso prezzo
+    - get_many() prende i simboli di un tick in un colpo solo, quindi le
+      chiamate alla sorgente per tick sono al massimo una per simbolo
+    - `source_calls` conta le chiamate effettive alla sorgente
+    """
+
+    def __init__(self, source: Callable[[str], float], ttl_sec: float = 1.0) -> None:
+        self._source = source
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._prices: dict[str, tuple[float, float]] = {}  # symbol -> (prezzo, fetched_at)
+        self.source_calls = 0
+
+    def _fresh(self, symbol: str, now: float):
+        cached = self._prices.get(symbol)
+        if cached is not None and now - cached[1] < self.ttl_sec:
+            return cached[0]
+        return None
+
+    def _fetch(self, symbol: str, now: float) -> float:
+        price = float(self._source(symbol))
+        self.source_calls += 1
+        self._prices[symbol] = (price, now)
+        return price
+
+    def get(self, symbol: str) -> float:
+        """Prezzo corrente di `symbol` (dallo snapshot, se ancora valido)."""
+        return self.get_many([symbol])[symbol]
+
+    def get_many(self, symbols: Iterable[str]) -> dict[str, float]:
+        """Prezzi di un tick: {symbol: prezzo}, un fetch per simbolo scaduto."""
+        now = time.monotonic()
+        prices: dict[str, float] = {}
+        with self._lock:
+            for symbol in symbols:
+                if symbol in prices:
+                    continue
+                price = self._fresh(symbol, now)
+                prices[symbol] = price if price is not None else self._fetch(symbol, now)
+        return prices
+
+    def put(self, symbol: str, price: float) -> None:
+        """Registra un prezzo noto (es. forzato da /market/price) come snapshot corrente."""
+        with self._lock:
+            self._prices[symbol] = (float(price), time.monotonic())
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._prices.clear()
+
+
+# Snapshot condiviso dal processo: sorgente paper = MarketSimulator
+price_snapshot = PriceSnapshot(MarketSimulator.get_price, ttl_sec=settings.PRICE_SNAPSHOT_TTL_SEC)
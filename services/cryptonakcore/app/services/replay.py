@@ -0,0 +1,334 @@
+# Replay / backtest offline dei segnali salvati nel file audit JSONL.
+#
+# I segnali ripassano nella stessa pipeline di /signals/bounce
+# (_normalize_side, check_risk_limits, compute_tp_sl) e l'auto-close viene
+# simulato su una serie storica di prezzi (CSV o Parquet): per ogni posizione
+# il primo punto che tocca TP o SL si trova con uno scan vettoriale NumPy del
+# path di prezzo, invece di simulare tick per tick. Il risultato ha le stesse
+# metriche di StatsResponse (/stats).
+#
+# Per il Parquet serve l'extra "backtest" (pandas + pyarrow).
+
+import csv
+import heapq
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from app.services.export import audit_files, open_audit_file
+from app.services.oms import _normalize_side, check_risk_limits, compute_tp_sl
+from app.services.position_book import MIN_AGE_SEC
+from app.services.risk_counters import OpenPositionCounters
+from app.services.stats_aggregator import StatsAccumulator
+
+# ---------- dati in ingresso ----------
+
+
+@dataclass
+class ReplaySignal:
+    ts: float  # epoch secondi UTC
+    symbol: str
+    side: str  # side grezzo, come inviato da RickyBot
+    price: float
+    tp_pct: Optional[float] = None
+    sl_pct: Optional[float] = None
+
+
+@dataclass
+class PriceSeries:
+    """
+    Serie di prezzi di un simbolo, ordinata per ts.
+
+    Per una serie di tick/close `high` e `low` sono lo stesso array dei prezzi
+    e il prezzo di uscita è quello osservato (come fa il watcher). Per le
+    candele OHLC TP/SL si valutano su high/low e l'uscita è al livello toccato.
+    """
+    ts: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+
+    @property
+    def is_ohlc(self) -> bool:
+        return self.high is not self.low
+
+
+def _parse_ts(value) -> float:
+    """ISO 8601 (anche con Z) o epoch in secondi/millisecondi → epoch secondi UTC."""
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        v = float(value)
+        return v / 1000.0 if v > 1e11 else v
+
+    text = str(value).strip()
+    try:
+        v = float(text)
+        return v / 1000.0 if v > 1e11 else v
+    except ValueError:
+        pass
+
+    dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def load_signals(audit_path: Path) -> list[ReplaySignal]:
+    """Legge i segnali bounce dal file audit (+ file ruotati), ordinati per timestamp."""
+    signals: list[ReplaySignal] = []
+
+    for path in audit_files(Path(audit_path)):
+        with open_audit_file(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("type") != "bounce_signal":
+                    continue
+
+                p = entry.get("payload") or {}
+                signals.append(
+                    ReplaySignal(
+                        ts=_parse_ts(p.get("timestamp") or entry["ts"]),
+                        symbol=p["symbol"],
+                        side=p.get("side", ""),
+                        price=float(p["price"]),
+                        tp_pct=p.get("tp_pct"),
+                        sl_pct=p.get("sl_pct"),
+                    )
+                )
+
+    signals.sort(key=lambda s: s.ts)
+    return signals
+
+
+def _build_series(ts: np.ndarray, high: np.ndarray, low: np.ndarray) -> PriceSeries:
+    order = np.argsort(ts, kind="stable")
+    sorted_high = high[order]
+    sorted_low = sorted_high if low is high else low[order]
+    return PriceSeries(ts=ts[order], high=sorted_high, low=sorted_low)
+
+
+def load_prices(path: Path) -> dict[str, PriceSeries]:
+    """
+    Carica la serie storica da CSV o Parquet.
+
+    Colonne attese: `timestamp`, `symbol` e `price` (oppure `close`);
+    se ci sono `high` e `low` TP/SL vengono valutati sulle candele.
+    """
+    path = Path(path)
+
+    if path.suffix.lower() in (".parquet", ".pq"):
+        import pandas as pd  # opzionale, solo per il Parquet
+
+        df = pd.read_parquet(path)
+        columns = {c: df[c].to_numpy() for c in df.columns}
+    else:
+        with path.open("r", encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            rows = list(reader)
+        columns = {
+            c: np.array([r[c] for r in rows], dtype=object)
+            for c in (reader.fieldnames or [])
+        }
+
+    price_col = "price" if "price" in columns else "close"
+    has_ohlc = "high" in columns and "low" in columns
+
+    ts_all = np.array([_parse_ts(v) for v in columns["timestamp"]], dtype=np.float64)
+    symbols_all = np.asarray(columns["symbol"]).astype(str)
+    if has_ohlc:
+        high_all = np.asarray(columns["high"], dtype=np.float64)
+        low_all = np.asarray(columns["low"], dtype=np.float64)
+    else:
+        high_all = low_all = np.asarray(columns[price_col], dtype=np.float64)
+
+    series: dict[str, PriceSeries] = {}
+    for symbol in np.unique(symbols_all):
+        mask = symbols_all == symbol
+        high = high_all[mask]
+        low = high if low_all is high_all else low_all[mask]
+        series[str(symbol)] = _build_series(ts_all[mask], high, low)
+    return series
+
+
+# ---------- motore ----------
+
+
+def first_hit(
+    series: PriceSeries,
+    start_ts: float,
+    side: str,
+    tp: Optional[float],
+    sl: Optional[float],
+) -> Optional[tuple[float, float, str]]:
+    """
+    Primo punto della serie (da start_ts in poi) che tocca TP o SL.
+
+    Stesse regole di auto_close_positions: long TP se prezzo >= tp,
+    SL se <= sl; short il contrario; se nello stesso punto sono toccati
+    entrambi vince il TP. Ritorna (ts, prezzo_uscita, reason) o None.
+    """
+    i0 = int(np.searchsorted(series.ts, start_ts, side="left"))
+    high = series.high[i0:]
+    low = series.low[i0:]
+    if high.size == 0:
+        return None
+
+    no_hit = np.zeros(high.size, dtype=bool)
+    if side == "long":
+        tp_mask = high >= tp if tp is not None else no_hit
+        sl_mask = low <= sl if sl is not None else no_hit
+    elif side == "short":
+        tp_mask = low <= tp if tp is not None else no_hit
+        sl_mask = high >= sl if sl is not None else no_hit
+    else:
+        return None
+
+    hit = tp_mask | sl_mask
+    if not hit.any():
+        return None
+
+    j = int(np.argmax(hit))
+    reason = "tp" if tp_mask[j] else "sl"
+
+    if series.is_ohlc:
+        exit_price = tp if reason == "tp" else sl
+    else:
+        exit_price = float(high[j])
+
+    return float(series.ts[i0 + j]), float(exit_price), reason
+
+
+@dataclass
+class ReplayConfig:
+    default_tp_pct: float
+    default_sl_pct: float
+    qty: float = 1.0
+    max_open_positions: Optional[int] = None
+    max_open_positions_per_symbol: Optional[int] = None
+    # Override dei TP/SL dei segnali (usato dallo sweep); None = come live
+    force_tp_pct: Optional[float] = None
+    force_sl_pct: Optional[float] = None
+
+
+@dataclass
+class ReplayResult:
+    stats: dict
+    signals: int = 0
+    accepted: int = 0
+    invalid_side: int = 0
+    no_prices: int = 0
+    still_open: int = 0
+    risk_blocks: Counter = field(default_factory=Counter)
+
+    def as_dict(self) -> dict:
+        return {
+            "stats": self.stats,
+            "signals": self.signals,
+            "accepted": self.accepted,
+            "invalid_side": self.invalid_side,
+            "no_prices": self.no_prices,
+            "still_open": self.still_open,
+            "risk_blocks": dict(self.risk_blocks),
+        }
+
+
+def _risk_scope(reason: str) -> str:
+    if reason.startswith("max_total_open"):
+        return "total"
+    if reason.startswith("max_symbol_open"):
+        return "symbol"
+    if reason.startswith("max_size"):
+        return "size"
+    return "other"
+
+
+def replay(
+    signals: Iterable[ReplaySignal],
+    prices: dict[str, PriceSeries],
+    config: ReplayConfig,
+) -> ReplayResult:
+    """
+    Ripassa i segnali (ordinati per ts) nella pipeline dell'OMS.
+
+    I contatori di rischio sono locali al replay: una posizione libera il
+    suo slot al timestamp di chiusura trovato da first_hit. Le posizioni
+    senza TP/SL toccati entro la fine della serie restano aperte.
+    """
+    counters = OpenPositionCounters()
+    stats = StatsAccumulator()
+    result = ReplayResult(stats={})
+
+    # (ts chiusura, symbol) delle posizioni aperte che si chiuderanno
+    closing: list[tuple[float, str]] = []
+
+    for sig in signals:
+        result.signals += 1
+
+        # libera gli slot delle posizioni chiuse prima di questo segnale
+        while closing and closing[0][0] <= sig.ts:
+            _, symbol = heapq.heappop(closing)
+            counters.on_close(symbol)
+
+        side = _normalize_side(sig.side)
+        if side not in ("long", "short"):
+            result.invalid_side += 1
+            continue
+
+        entry_price = float(sig.price)
+        ok, reason = check_risk_limits(
+            symbol=sig.symbol,
+            entry_price=entry_price,
+            qty=config.qty,
+            counters=counters,
+            max_total=config.max_open_positions,
+            max_per_symbol=config.max_open_positions_per_symbol,
+        )
+        if not ok:
+            result.risk_blocks[_risk_scope(reason)] += 1
+            continue
+
+        counters.confirm(sig.symbol)
+        stats.on_open()
+        result.accepted += 1
+
+        if config.force_tp_pct is not None:
+            tp_pct = config.force_tp_pct
+        else:
+            tp_pct = sig.tp_pct if sig.tp_pct is not None else config.default_tp_pct
+        if config.force_sl_pct is not None:
+            sl_pct = config.force_sl_pct
+        else:
+            sl_pct = sig.sl_pct if sig.sl_pct is not None else config.default_sl_pct
+
+        tp, sl = compute_tp_sl(side, entry_price, tp_pct, sl_pct)
+
+        series = prices.get(sig.symbol)
+        if series is None:
+            result.no_prices += 1
+            result.still_open += 1
+            continue
+
+        hit = first_hit(series, sig.ts + MIN_AGE_SEC, side, tp, sl)
+        if hit is None:
+            result.still_open += 1
+            continue
+
+        close_ts, exit_price, close_reason = hit
+        if side == "long":
+            pnl = (exit_price - entry_price) * config.qty
+        else:
+            pnl = (entry_price - exit_price) * config.qty
+
+        stats.on_close(pnl, close_reason)
+        heapq.heappush(closing, (close_ts, sig.symbol))
+
+    result.stats = stats.snapshot()
+    return result
@@ -0,0 +1,111 @@
+import threading
+from collections import Counter
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.db.models import Position
+
+
+class OpenPositionCounters:
+    """
+    Contatori in memoria delle posizioni aperte (totale e per simbolo),
+    usati da check_risk_limits al posto delle COUNT(*) sul DB.
+
+    - reserve(): prenota uno slot per una posizione che sta per essere creata
+      (chiamato sotto lock insieme al controllo dei limiti → niente race
+      fra due segnali concorrenti sullo stesso simbolo)
+    - confirm() / release(): la posizione è stata creata / non verrà creata
+    - on_open() / on_close(): aperture senza prenotazione e chiusure
+    - reconcile(): riallinea i contatori con il DB (startup + periodico)
+
+    Gli slot prenotati contano come aperti per i limiti.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.RLock()
+        self._open: Counter[str] = Counter()
+        self._pending: Counter[str] = Counter()
+        # incrementato ad ogni confirm/on_open/on_close (usato da reconcile)
+        self._version = 0
+
+    # ---------- lettura (chiamare sotto lock per decisioni atomiche) ----------
+
+    def total(self) -> int:
+        with self.lock:
+            return sum(self._open.values()) + sum(self._pending.values())
+
+    def for_symbol(self, symbol: str) -> int:
+        with self.lock:
+            return self._open[symbol] + self._pending[symbol]
+
+    # ---------- aggiornamenti ----------
+
+    def reserve(self, symbol: str) -> None:
+        with self.lock:
+            self._pending[symbol] += 1
+
+    def release(self, symbol: str) -> None:
+        with self.lock:
+            if self._pending[symbol] > 0:
+                self._pending[symbol] -= 1
+            if self._pending[symbol] == 0:
+                del self._pending[symbol]
+
+    def confirm(self, symbol: str) -> None:
+        with self.lock:
+            self.release(symbol)
+            self._open[symbol] += 1
+            self._version += 1
+
+    def on_open(self, symbol: str) -> None:
+        with self.lock:
+            self._open[symbol] += 1
+            self._version += 1
+
+    def on_close(self, symbol: str) -> None:
+        with self.lock:
+            if self._open[symbol] > 0:
+                self._open[symbol] -= 1
+            if self._open[symbol] == 0:
+                del self._open[symbol]
+            self._version += 1
+
+    # ---------- riallineamento con il DB ----------
+
+    def reconcile(self, db: Session) -> dict | None:
+        """
+        Ricarica i conteggi dal DB con una sola query GROUP BY.
+
+        Se durante la query ci sono prenotazioni in volo o aperture/chiusure
+        concorrenti il risultato non è affidabile: non si applica nulla e si
+        ritorna None (ci riprova il prossimo giro). Altrimenti ritorna il
+        drift {symbol: (in_memoria, db)} per i simboli non allineati.
+        """
+        with self.lock:
+            if self._pending:
+                return None
+            version = self._version
+
+        rows = db.execute(
+            select(Position.symbol, func.count(Position.id))
+            .where(Position.status == "open")
+            .group_by(Position.symbol)
+        ).all()
+        db_counts = Counter({symbol: int(n) for symbol, n in rows})
+
+        with self.lock:
+            if self._pending or self._version != version:
+                return None
+
+            drift = {
+                symbol: (self._open[symbol], db_counts[symbol])
+                for symbol in set(self._open) | set(db_counts)
+                if self._open[symbol] != db_counts[symbol]
+            }
+            self._open = db_counts
+            return drift
+
+
+# Istanza condivisa dal processo (API + scheduler)
+open_position_counters = OpenPositionCounters()
@@ -0,0 +1,283 @@
+from datetime import datetime
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import zlib
+from typing import Optional
+
+from app.core.config import settings
+from app.core.metrics import WATCHER_TICK_SECONDS
+from app.services.position_book import BookEntry, PositionBook
+
+logger = logging.getLogger("shard_watcher")
+
+# spawn: i processi shard non ereditano thread, lock ed event loop del processo API
+_MP_CONTEXT = "spawn"
+
+# Comandi dell'inbox applicati al massimo tra due tick: un flusso continuo di
+# aperture/rimozioni non deve rimandare all'infinito la valutazione TP/SL
+_MAX_COMMANDS_PER_TICK = 1000
+
+
+def shard_of(symbol: str, n_shards: int) -> int:
+    """Shard proprietario di `symbol` (crc32: stabile tra processi e riavvii)."""
+    return zlib.crc32(symbol.encode("utf-8")) % n_shards
+
+
+def _shard_main(shard_id: int, inbox, outbox, interval_sec: float) -> None:
+    """
+    Loop di un processo shard.
+
+    Tiene un PositionBook con le sole posizioni dei suoi simboli e il suo
+    engine di prezzi (stesso seed del processo API: la sequenza di un simbolo
+    dipende solo da seed + nome). Ad ogni tick valuta TP/SL e manda su
+    `outbox` le chiusure decise e i prezzi usati; i comandi in `inbox`
+    vengono applicati tra un tick e l'altro, nell'ordine in cui sono stati
+    inviati, al massimo _MAX_COMMANDS_PER_TICK per volta (gli altri al giro
+    dopo il tick).
+    """
+    # import qui: nel processo figlio (spawn) app.* viene importato da zero
+    from app.services.market_simulator import MarketSimulatorEngine
+    from app.services.oms import evaluate_closes
+
+    engine = MarketSimulatorEngine(
+        model=settings.MARKET_SIM_MODEL,
+        initial_price=settings.MARKET_SIM_INITIAL_PRICE,
+        volatility=settings.MARKET_SIM_VOLATILITY,
+        drift=settings.MARKET_SIM_DRIFT,
+        seed=settings.MARKET_SIM_SEED,
+        block_size=settings.MARKET_SIM_BLOCK_SIZE,
+    )
+    book = PositionBook()
+    forced: dict[str, float] = {}
+    next_tick = time.monotonic()
+    applied = 0
+
+    while True:
+        msg = None
+        if applied < _MAX_COMMANDS_PER_TICK:
+            timeout = next_tick - time.monotonic()
+            try:
+                msg = inbox.get(timeout=timeout) if timeout > 0 else inbox.get_nowait()
+            except queue.Empty:
+                pass
+
+        if msg is not None:
+            applied += 1
+            kind = msg[0]
+            if kind == "stop":
+                return
+            if kind == "open":
+                book.add_entry(msg[1])
+            elif kind == "remove":
+                book.remove(msg[1])
+            elif kind == "price":
+                # prezzo forzato (/market/price): vale per il prossimo tick
+                engine.set_price(msg[1], msg[2])
+                forced[msg[1]] = msg[2]
+            continue
+
+        # ---------- tick ----------
+        applied = 0
+        started = time.perf_counter()
+        symbols = book.symbols()
+        prices = {
+            symbol: forced[symbol] if symbol in forced else engine.next_price(symbol)
+            for symbol in symbols
+        }
+        forced.clear()
+
+        closes = evaluate_closes(book, prices, datetime.utcnow())
+        # fuori dal book subito: non vanno riproposte al tick successivo
+        for close in closes:
+            book.remove(close["pos_id"])
+
+        outbox.put((shard_id, closes, prices, time.perf_counter() - started, len(symbols)))
+        next_tick = max(next_tick + interval_sec, time.monotonic())
+
+
+class ShardedWatcher:
+    """
+    Watcher TP/SL multi-processo (POSITION_WATCHER_MODE="sharded").
+
+    - i simboli sono partizionati per hash su `n_shards` processi: tutte
+      le posizioni e tutti i tick di un simbolo stanno in un solo shard,
+      quindi l'ordine per simbolo è quello del suo processo
+    - il processo API resta l'unico writer del DB: collect() raccoglie le
+      chiusure dalla coda comune e oms.apply_shard_closes le committa
+    - il PositionBook del processo API resta la fonte: come listener del
+      book, ogni aggiunta/rimozione viene inoltrata allo shard del simbolo
+    - il feed prezzi dei simboli è negli shard: collect() tiene l'ultimo
+      prezzo pubblicato da ogni shard, che chiusure manuali e /market/price
+      leggono con last_price() (stesso prezzo del tick del watcher)
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._ctx = multiprocessing.get_context(_MP_CONTEXT)
+        self._inboxes: list = []
+        self._processes: list = []
+        self._outbox = None
+        self._book: Optional[PositionBook] = None
+        self._interval_sec = 0.0
+        # ultimo prezzo per simbolo pubblicato dagli shard (o forzato)
+        self._last_prices: dict[str, float] = {}
+        # contatori dei risultati raccolti (tick degli shard, simboli valutati)
+        self.ticks = 0
+        self.symbols_evaluated = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._processes)
+
+    @property
+    def n_shards(self) -> int:
+        return len(self._processes)
+
+    def start(self, book: PositionBook, n_shards: int, interval_sec: float) -> None:
+        """Avvia i processi shard e distribuisce le posizioni aperte di `book`."""
+        if self.running:
+            return
+
+        n_shards = max(1, n_shards)
+        self._book = book
+        self._interval_sec = interval_sec
+        self._outbox = self._ctx.Queue()
+        with self._lock:
+            self._inboxes = [None] * n_shards
+            self._processes = [None] * n_shards
+            for shard_id in range(n_shards):
+                self._spawn(shard_id)
+
+        # listener PRIMA dello snapshot: un'aggiunta nel mezzo arriva al
+        # massimo due volte (idempotente), mai zero
+        book.set_listener(self)
+        for entry in book.entries():
+            self.on_add(entry)
+
+        logger.info({"event": "shard_watcher_started", "shards": n_shards})
+
+    def stop(self, timeout: float = 2.0) -> None:
+        """Ferma i processi shard (le chiusure non ancora raccolte vanno perse)."""
+        if not self.running:
+            return
+        if self._book is not None:
+            self._book.set_listener(None)
+
+        with self._lock:
+            processes, inboxes = self._processes, self._inboxes
+            self._processes, self._inboxes = [], []
+        self._last_prices = {}
+
+        for inbox in inboxes:
+            inbox.put(("stop",))
+        for process in processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        logger.info({"event": "shard_watcher_stopped", "shards": len(processes)})
+
+    def ensure_alive(self) -> list[int]:
+        """Riavvia gli shard morti e gli ridà le loro posizioni. Ritorna gli id riavviati."""
+        with self._lock:
+            dead = [i for i, p in enumerate(self._processes) if not p.is_alive()]
+            for shard_id in dead:
+                logger.warning(
+                    {
+                        "event": "shard_restarted",
+                        "shard": shard_id,
+                        "exitcode": self._processes[shard_id].exitcode,
+                    }
+                )
+                self._spawn(shard_id)
+
+        if dead and self._book is not None:
+            # dopo lo swap dell'inbox: nessuna aggiunta va persa
+            n = self.n_shards
+            for entry in self._book.entries():
+                if shard_of(entry.symbol, n) in dead:
+                    self.on_add(entry)
+        return dead
+
+    def _spawn(self, shard_id: int) -> None:
+        inbox = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_shard_main,
+            args=(shard_id, inbox, self._outbox, self._interval_sec),
+            name=f"loms-shard-{shard_id}",
+            daemon=True,
+        )
+        process.start()
+        self._inboxes[shard_id] = inbox
+        self._processes[shard_id] = process
+
+    # ---------- comandi verso gli shard ----------
+
+    def _send(self, symbol: str, msg: tuple) -> None:
+        inboxes = self._inboxes
+        if inboxes:
+            inboxes[shard_of(symbol, len(inboxes))].put(msg)
+
+    def on_add(self, entry: BookEntry) -> None:
+        self._send(entry.symbol, ("open", entry))
+
+    def on_remove(self, entry: BookEntry) -> None:
+        self._send(entry.symbol, ("remove", entry.id))
+
+    def requeue(self, position_ids: list[int]) -> int:
+        """
+        Rimanda agli shard le posizioni di chiusure non committate (ancora
+        aperte nel book del processo API). Ritorna quante ne ha rimandate.
+        """
+        count = 0
+        if self._book is None:
+            return count
+        for pos_id in position_ids:
+            entry = self._book.get(pos_id)
+            if entry is not None:
+                self.on_add(entry)
+                count += 1
+        return count
+
+    def set_price(self, symbol: str, price: float) -> None:
+        """Inoltra un prezzo forzato allo shard del simbolo."""
+        if self.running:
+            self._last_prices[symbol] = float(price)
+        self._send(symbol, ("price", symbol, float(price)))
+
+    def last_price(self, symbol: str) -> Optional[float]:
+        """Ultimo prezzo di `symbol` usato da uno shard (None se non ancora tickato)."""
+        return self._last_prices.get(symbol)
+
+    # ---------- risultati ----------
+
+    def collect(self, timeout: float) -> list[dict]:
+        """
+        Attende fino a `timeout` il primo risultato e ritorna tutte le
+        chiusure in coda in quel momento, nell'ordine di arrivo.
+        """
+        closes: list[dict] = []
+        if self._outbox is None:
+            return closes
+        try:
+            msg = self._outbox.get(timeout=timeout)
+        except queue.Empty:
+            return closes
+
+        while True:
+            _, shard_closes, prices, duration, n_symbols = msg
+            self._last_prices.update(prices)
+            WATCHER_TICK_SECONDS.observe(duration)
+            self.ticks += 1
+            self.symbols_evaluated += n_symbols
+            closes.extend(shard_closes)
+            try:
+                msg = self._outbox.get_nowait()
+            except queue.Empty:
+                return closes
+
+
+# Istanza del processo API (avviata solo in modalità "sharded")
+sharded_watcher = ShardedWatcher()
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import hashlib
+import json
+import threading
+import time
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import SignalReceipt
+from app.services.oms import _normalize_side
+
+
+class ResponseCache:
+    """
+    Cache LRU con TTL delle risposte di /signals/bounce, per chiave di idempotenza.
+    Un segnale ripetuto trovato qui non tocca né il DB né il file audit.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_sec: float = 3600.0) -> None:
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._items: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            response, stored_at = item
+            if now - stored_at >= self.ttl_sec:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return response
+
+    def put(self, key: str, response: dict) -> None:
+        with self._lock:
+            self._items[key] = (response, time.monotonic())
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+# Cache condivisa dal processo
+signal_response_cache = ResponseCache(
+    max_size=settings.SIGNAL_DEDUP_CACHE_SIZE,
+    ttl_sec=settings.SIGNAL_DEDUP_TTL_SEC,
+)
+
+
+class KeyLocks:
+    """
+    Un lock per chiave di idempotenza, creato al primo uso e tolto quando
+    nessuno lo tiene più. Serializza nel processo gli invii concorrenti
+    dello stesso segnale: il secondo aspetta il primo e trova la sua
+    risposta in cache, invece di prenotare un altro slot di rischio.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # chiave -> [lock, quanti lo tengono o lo aspettano]
+        self._locks: dict[str, list] = {}
+
+    @contextmanager
+    def hold(self, key: str) -> Iterator[None]:
+        with self._lock:
+            item = self._locks.get(key)
+            if item is None:
+                item = self._locks[key] = [threading.Lock(), 0]
+            item[1] += 1
+        try:
+            with item[0]:
+                yield
+        finally:
+            with self._lock:
+                item[1] -= 1
+                if item[1] == 0:
+                    del self._locks[key]
+
+
+# Lock per chiave condivisi dal processo
+signal_key_locks = KeyLocks()
+
+
+def signal_key(
+    symbol: str,
+    side: str,
+    timestamp: datetime,
+    strategy: str,
+    exchange: str,
+    timeframe_min: int,
+    signal_id: Optional[str] = None,
+) -> str:
+    """
+    Chiave di idempotenza di un segnale: il signal_id del mittente se c'è,
+    altrimenti un hash dei campi che identificano la candela/strategia.
+    """
+    if signal_id:
+        return f"id:{signal_id}"
+
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+    raw = "|".join(
+        [symbol, _normalize_side(side), timestamp.isoformat(), strategy, exchange, str(timeframe_min)]
+    )
+    return "sig:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def find_responses(db: Session, keys: Iterable[str]) -> dict[str, dict]:
+    """
+    Risposte già date per le chiavi indicate: prima dalla cache, poi (solo
+    per le chiavi mancanti) dalla tabella signal_receipts con una query.
+    """
+    found: dict[str, dict] = {}
+    missing: list[str] = []
+
+    for key in dict.fromkeys(keys):
+        response = signal_response_cache.get(key)
+        if response is not None:
+            found[key] = response
+        else:
+            missing.append(key)
+
+    if missing:
+        rows = db.execute(
+            select(SignalReceipt.key, SignalReceipt.response).where(SignalReceipt.key.in_(missing))
+        )
+        for key, raw in rows:
+            response = json.loads(raw)
+            signal_response_cache.put(key, response)
+            found[key] = response
+
+    return found
+
+
+def new_receipt(key: str, response: dict) -> SignalReceipt:
+    return SignalReceipt(key=key, response=json.dumps(response))
+
+
+def purge_receipts(db: Session, older_than: datetime) -> int:
+    """
+    Cancella le ricevute create prima di `older_than` (UTC naive) e ritorna
+    quante ne ha cancellate. Un segnale ripetuto dopo la purge viene trattato
+    come nuovo.
+    """
+    result = db.execute(delete(SignalReceipt).where(SignalReceipt.created_at < older_than))
+    db.commit()
+    return result.rowcount
@@ -0,0 +1,235 @@
+import threading
+from typing import Optional
+
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.orm import Session
+
+from app.db.models import Position
+
+
+class StatsAccumulator:
+    """
+    Aggregato "running" delle statistiche esposte da /stats.
+
+    Ricostruito dal DB allo startup (rebuild) e poi aggiornato in memoria
+    ad ogni apertura / chiusura di posizione, così /stats è O(1).
+    snapshot() ritorna un dict con gli stessi campi di StatsResponse.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # incrementata ad ogni apertura/chiusura/rebuild: invalida la cache
+        # di /stats/breakdown (BreakdownCache)
+        self.version = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self.total_positions = 0
+        self.open_positions = 0
+        self.closed_positions = 0
+        self.total_pnl = 0.0
+        self.winning_trades = 0
+        self.losing_trades = 0
+        self.tp_count = 0
+        self.sl_count = 0
+        self.win_pnl_sum = 0.0
+        self.loss_pnl_sum = 0.0
+
+    # ---------- aggiornamenti incrementali ----------
+
+    def on_open(self) -> None:
+        with self._lock:
+            self.version += 1
+            self.total_positions += 1
+            self.open_positions += 1
+
+    def on_close(self, pnl: Optional[float], reason: Optional[str]) -> None:
+        with self._lock:
+            self.version += 1
+            self.open_positions -= 1
+            self.closed_positions += 1
+
+            if pnl is not None:
+                self.total_pnl += pnl
+                if pnl > 0:
+                    self.winning_trades += 1
+                    self.win_pnl_sum += pnl
+                elif pnl < 0:
+                    self.losing_trades += 1
+                    self.loss_pnl_sum += pnl
+
+            if reason == "tp":
+                self.tp_count += 1
+            elif reason == "sl":
+                self.sl_count += 1
+
+    # ---------- ricostruzione dal DB ----------
+
+    def rebuild(self, db: Session) -> dict:
+        """Ricalcola tutto dal DB (una sola query) e ritorna il nuovo snapshot."""
+        row = compute_totals(db)
+        with self._lock:
+            self.version += 1
+            self._reset()
+            for key, value in row.items():
+                setattr(self, key, value)
+            return self._snapshot()
+
+    # ---------- lettura ----------
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self) -> dict:
+        return build_stats(
+            total_positions=self.total_positions,
+            open_positions=self.open_positions,
+            closed_positions=self.closed_positions,
+            total_pnl=self.total_pnl,
+            winning_trades=self.winning_trades,
+            losing_trades=self.losing_trades,
+            tp_count=self.tp_count,
+            sl_count=self.sl_count,
+            win_pnl_sum=self.win_pnl_sum,
+            loss_pnl_sum=self.loss_pnl_sum,
+        )
+
+
+def build_stats(
+    total_positions: int,
+    open_positions: int,
+    closed_positions: int,
+    total_pnl: float,
+    winning_trades: int,
+    losing_trades: int,
+    tp_count: int,
+    sl_count: int,
+    win_pnl_sum: float,
+    loss_pnl_sum: float,
+) -> dict:
+    """Costruisce il dict di StatsResponse (metriche derivate incluse) dai totali."""
+
+    # Winrate in percentuale (solo sui trade chiusi)
+    if closed_positions > 0:
+        winrate = (winning_trades / closed_positions) * 100.0
+        avg_pnl_per_trade = total_pnl / closed_positions
+    else:
+        winrate = 0.0
+        avg_pnl_per_trade = 0.0
+
+    return {
+        "total_positions": total_positions,
+        "open_positions": open_positions,
+        "closed_positions": closed_positions,
+        "total_pnl": float(total_pnl),
+        "winning_trades": winning_trades,
+        "losing_trades": losing_trades,
+        "tp_count": tp_count,
+        "sl_count": sl_count,
+        "winrate": winrate,
+        "avg_pnl_per_trade": avg_pnl_per_trade,
+        "avg_pnl_win": win_pnl_sum / winning_trades if winning_trades else None,
+        "avg_pnl_loss": loss_pnl_sum / losing_trades if losing_trades else None,
+    }
+
+
+def _totals_columns() -> list:
+    """Espressioni SQL dei totali grezzi (stesso ordine di _totals_from_row)."""
+    is_closed = Position.status == "closed"
+    is_win = and_(is_closed, Position.pnl > 0)
+    is_loss = and_(is_closed, Position.pnl < 0)
+
+    def _count_if(cond):
+        return func.coalesce(func.sum(case((cond, 1), else_=0)), 0)
+
+    return [
+        func.count(Position.id),
+        _count_if(Position.status == "open"),
+        _count_if(is_closed),
+        func.coalesce(func.sum(Position.pnl), 0.0),
+        _count_if(is_win),
+        _count_if(is_loss),
+        _count_if(Position.auto_close_reason == "tp"),
+        _count_if(Position.auto_close_reason == "sl"),
+        func.coalesce(func.sum(case((is_win, Position.pnl), else_=0.0)), 0.0),
+        func.coalesce(func.sum(case((is_loss, Position.pnl), else_=0.0)), 0.0),
+    ]
+
+
+def _totals_from_row(row) -> dict:
+    return {
+        "total_positions": int(row[0]),
+        "open_positions": int(row[1]),
+        "closed_positions": int(row[2]),
+        "total_pnl": float(row[3]),
+        "winning_trades": int(row[4]),
+        "losing_trades": int(row[5]),
+        "tp_count": int(row[6]),
+        "sl_count": int(row[7]),
+        "win_pnl_sum": float(row[8]),
+        "loss_pnl_sum": float(row[9]),
+    }
+
+
+def compute_totals(db: Session) -> dict:
+    """
+    Totali grezzi delle statistiche calcolati sul DB con una sola query
+    (stessa semantica delle vecchie query separate di /stats).
+    """
+    return _totals_from_row(db.execute(select(*_totals_columns())).one())
+
+
+# Dimensioni ammesse per /stats/breakdown (colonne di Position)
+BREAKDOWN_DIMENSIONS = ("symbol", "side", "strategy", "exchange", "timeframe_min")
+
+
+def compute_breakdown(db: Session, by: tuple[str, ...]) -> list[dict]:
+    """
+    Statistiche di /stats per ogni gruppo delle dimensioni `by`, con una
+    sola query GROUP BY. Ogni elemento è {"group": {dim: valore}, ...campi
+    di StatsResponse}; gruppi ordinati per valore delle dimensioni.
+    """
+    columns = [getattr(Position, dim) for dim in by]
+    rows = db.execute(
+        select(*columns, *_totals_columns()).group_by(*columns).order_by(*columns)
+    ).all()
+
+    n = len(columns)
+    return [
+        {"group": dict(zip(by, row[:n])), **build_stats(**_totals_from_row(row[n:]))}
+        for row in rows
+    ]
+
+
+class BreakdownCache:
+    """
+    Cache dei risultati di compute_breakdown per combinazione di dimensioni.
+    Un risultato vale finché la `version` dello StatsAccumulator non cambia,
+    cioè fino alla prossima apertura/chiusura di posizione nel processo (o,
+    con più worker, di un altro worker applicata da sync_in_memory_state).
+    """
+
+    def __init__(self, accumulator: StatsAccumulator) -> None:
+        self._accumulator = accumulator
+        self._lock = threading.Lock()
+        self._entries: dict[tuple[str, ...], tuple[int, list[dict]]] = {}
+
+    def get(self, db: Session, by: tuple[str, ...]) -> list[dict]:
+        version = self._accumulator.version
+        with self._lock:
+            cached = self._entries.get(by)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        # versione letta PRIMA della query: un'apertura concorrente la rende
+        # subito vecchia, al massimo si ricalcola una volta in più
+        result = compute_breakdown(db, by)
+        with self._lock:
+            self._entries[by] = (version, result)
+        return result
+
+
+# Istanza condivisa dal processo (API + scheduler)
+stats_accumulator = StatsAccumulator()
+stats_breakdown_cache = BreakdownCache(stats_accumulator)
@@ -0,0 +1,221 @@
+# Sweep parallelo di parametri TP% / SL% (e limiti di rischio) sul replay.
+#
+# Ogni combinazione della griglia è un replay completo (app.services.replay)
+# eseguito in un pool di processi. Le serie di prezzi vengono copiate UNA volta
+# in blocchi di shared memory: i worker le vedono come array NumPy read-only
+# invece di riceverle in pickle ad ogni job.
+
+import csv
+import itertools
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from app.services.replay import PriceSeries, ReplayConfig, ReplaySignal, replay
+
+# Colonne del file risultati (oltre ai parametri)
+RESULT_METRICS = [
+    "total_pnl",
+    "winrate",
+    "avg_pnl_per_trade",
+    "closed_positions",
+    "winning_trades",
+    "losing_trades",
+    "tp_count",
+    "sl_count",
+    "open_positions",
+    "accepted",
+    "risk_blocked",
+]
+
+PARAM_COLUMNS = ["tp_pct", "sl_pct", "max_open_positions", "max_open_positions_per_symbol"]
+
+
+@dataclass(frozen=True)
+class SweepPoint:
+    tp_pct: float
+    sl_pct: float
+    max_open_positions: Optional[int] = None
+    max_open_positions_per_symbol: Optional[int] = None
+
+
+def build_grid(
+    tp_values: Iterable[float],
+    sl_values: Iterable[float],
+    max_open_values: Iterable[Optional[int]] = (None,),
+    max_per_symbol_values: Iterable[Optional[int]] = (None,),
+) -> list[SweepPoint]:
+    return [
+        SweepPoint(tp, sl, mo, mps)
+        for tp, sl, mo, mps in itertools.product(
+            tp_values, sl_values, max_open_values, max_per_symbol_values
+        )
+    ]
+
+
+# ---------- prezzi in shared memory ----------
+
+
+@dataclass
+class _SharedPrices:
+    """Descrittore picklabile delle serie in shared memory."""
+    ts_name: str
+    high_name: str
+    low_name: Optional[str]  # None = serie tick/close (low == high)
+    length: int
+    index: dict[str, tuple[int, int]]  # symbol -> (start, stop)
+
+
+def _to_shared(array: np.ndarray) -> shared_memory.SharedMemory:
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=np.float64, buffer=shm.buf)
+    view[:] = array
+    return shm
+
+
+def share_prices(
+    prices: dict[str, PriceSeries],
+) -> tuple[_SharedPrices, list[shared_memory.SharedMemory]]:
+    """Concatena le serie in tre array (ts/high/low) e li copia in shared memory."""
+    index: dict[str, tuple[int, int]] = {}
+    pos = 0
+    for symbol, series in prices.items():
+        index[symbol] = (pos, pos + series.ts.size)
+        pos += series.ts.size
+
+    ohlc = any(series.is_ohlc for series in prices.values())
+
+    def concat(attr: str) -> np.ndarray:
+        parts = [np.asarray(getattr(s, attr), dtype=np.float64) for s in prices.values()]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.float64)
+
+    blocks = [_to_shared(concat("ts")), _to_shared(concat("high"))]
+    if ohlc:
+        blocks.append(_to_shared(concat("low")))
+
+    desc = _SharedPrices(
+        ts_name=blocks[0].name,
+        high_name=blocks[1].name,
+        low_name=blocks[2].name if ohlc else None,
+        length=pos,
+        index=index,
+    )
+    return desc, blocks
+
+
+def _attach(desc: _SharedPrices):
+    """Ricostruisce le PriceSeries come viste read-only sulla shared memory."""
+    blocks = []
+
+    def view(name: str) -> np.ndarray:
+        shm = shared_memory.SharedMemory(name=name)
+        blocks.append(shm)
+        arr = np.ndarray((desc.length,), dtype=np.float64, buffer=shm.buf)
+        arr.flags.writeable = False
+        return arr
+
+    ts = view(desc.ts_name)
+    high = view(desc.high_name)
+    low = view(desc.low_name) if desc.low_name is not None else high
+
+    prices = {}
+    for symbol, (start, stop) in desc.index.items():
+        h = high[start:stop]
+        prices[symbol] = PriceSeries(
+            ts=ts[start:stop],
+            high=h,
+            low=h if low is high else low[start:stop],
+        )
+    return prices, blocks
+
+
+# ---------- worker ----------
+
+_worker_state: dict = {}
+
+
+def _init_worker(desc: _SharedPrices, signals: list[ReplaySignal], base: ReplayConfig) -> None:
+    logging.getLogger("oms").setLevel(logging.WARNING)
+    prices, blocks = _attach(desc)
+    _worker_state.update(prices=prices, blocks=blocks, signals=signals, base=base)
+
+
+def _run_point(point: SweepPoint) -> dict:
+    base: ReplayConfig = _worker_state["base"]
+    config = replace(
+        base,
+        force_tp_pct=point.tp_pct,
+        force_sl_pct=point.sl_pct,
+        max_open_positions=(
+            point.max_open_positions
+            if point.max_open_positions is not None
+            else base.max_open_positions
+        ),
+        max_open_positions_per_symbol=(
+            point.max_open_positions_per_symbol
+            if point.max_open_positions_per_symbol is not None
+            else base.max_open_positions_per_symbol
+        ),
+    )
+    result = replay(_worker_state["signals"], _worker_state["prices"], config)
+
+    row = {
+        "tp_pct": point.tp_pct,
+        "sl_pct": point.sl_pct,
+        "max_open_positions": config.max_open_positions,
+        "max_open_positions_per_symbol": config.max_open_positions_per_symbol,
+        "accepted": result.accepted,
+        "risk_blocked": sum(result.risk_blocks.values()),
+    }
+    for key in RESULT_METRICS:
+        if key in result.stats:
+            row[key] = result.stats[key]
+    return row
+
+
+# ---------- API ----------
+
+
+def run_sweep(
+    signals: list[ReplaySignal],
+    prices: dict[str, PriceSeries],
+    grid: list[SweepPoint],
+    base: ReplayConfig,
+    workers: Optional[int] = None,
+    rank_by: str = "total_pnl",
+) -> list[dict]:
+    """
+    Esegue un replay per ogni punto della griglia su un pool di processi
+    e ritorna le righe ordinate per `rank_by` (decrescente), con il rank.
+    """
+    desc, blocks = share_prices(prices)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(desc, signals, base),
+        ) as pool:
+            chunksize = max(1, len(grid) // ((workers or 1) * 4))
+            rows = list(pool.map(_run_point, grid, chunksize=chunksize))
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    rows.sort(key=lambda r: r.get(rank_by) or 0.0, reverse=True)
+    for rank, row in enumerate(rows, start=1):
+        row["rank"] = rank
+    return rows
+
+
+def write_results(rows: list[dict], path: Path) -> None:
+    columns = ["rank"] + PARAM_COLUMNS + RESULT_METRICS
+    with Path(path).open("w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
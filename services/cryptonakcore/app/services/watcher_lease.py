@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+import os
+import socket
+import uuid
+
+from sqlalchemy import case, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import WatcherLease
+
+WATCHER_LEASE_NAME = "position_watcher"
+
+
+def lease_coordination() -> bool:
+    """True con WATCHER_COORDINATION="lease" (più worker sullo stesso DB)."""
+    return settings.WATCHER_COORDINATION.lower() == "lease"
+
+
+class DbLease:
+    """
+    Lease su una riga del DB per avere un solo watcher attivo per database.
+
+    - try_acquire() prende o rinnova il lease con un UPDATE condizionale
+      (owner == me OPPURE scaduto): è atomico anche con più processi
+      sullo stesso file SQLite, quindi al massimo un worker vince
+    - se il proprietario muore smette di rinnovare: dopo `ttl_sec`
+      il lease è scaduto e il primo worker che ci prova subentra
+    - release() lo fa scadere subito (shutdown pulito = failover immediato)
+    - fence() nella transazione di chi scrive per conto del leader: verifica
+      il lease e blocca la riga fino al commit, quindi un leader che l'ha
+      perso non committa più nulla
+    """
+
+    def __init__(self, name: str, ttl_sec: float) -> None:
+        self.name = name
+        self.ttl_sec = ttl_sec
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def try_acquire(self, db: Session) -> bool:
+        """Prende o rinnova il lease. True se questo worker è il proprietario."""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl_sec)
+
+        table = WatcherLease.__table__
+        result = db.execute(
+            update(table)
+            .where(
+                table.c.name == self.name,
+                or_(table.c.owner == self.owner, table.c.expires_at < now),
+            )
+            .values(
+                owner=self.owner,
+                expires_at=expires_at,
+                acquired_at=case((table.c.owner == self.owner, table.c.acquired_at), else_=now),
+            )
+        )
+        if result.rowcount == 1:
+            db.commit()
+            return True
+
+        # nessuna riga aggiornata: lease di un altro worker, oppure non esiste ancora
+        db.rollback()
+        if db.get(WatcherLease, self.name) is not None:
+            return False
+
+        db.add(
+            WatcherLease(
+                name=self.name,
+                owner=self.owner,
+                expires_at=expires_at,
+                acquired_at=now,
+            )
+        )
+        try:
+            db.commit()
+        except IntegrityError:
+            # creato nello stesso istante da un altro worker
+            db.rollback()
+            return False
+        return True
+
+    def fence(self, db: Session) -> bool:
+        """
+        Nella transazione corrente, senza commit: True se il lease è ancora di
+        questo worker e non scaduto. L'UPDATE (no-op) tiene il lock sulla riga
+        fino al commit: nel frattempo nessun altro worker può prenderlo.
+        """
+        table = WatcherLease.__table__
+        result = db.execute(
+            update(table)
+            .where(
+                table.c.name == self.name,
+                table.c.owner == self.owner,
+                table.c.expires_at > datetime.utcnow(),
+            )
+            .values(owner=self.owner)
+        )
+        return result.rowcount == 1
+
+    def release(self, db: Session) -> None:
+        table = WatcherLease.__table__
+        db.execute(
+            update(table)
+            .where(table.c.name == self.name, table.c.owner == self.owner)
+            .values(expires_at=datetime.utcnow())
+        )
+        db.commit()
+
+
+# Lease del position watcher di questo processo
+watcher_lease = DbLease(WATCHER_LEASE_NAME, ttl_sec=settings.WATCHER_LEASE_TTL_SEC)
@@ -0,0 +1,69 @@
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Settings ed engine vengono letti all'import di app.*: DB SQLite e file di
+# audit temporanei vanno impostati prima di qualunque import dell'app.
+_TMP_DIR = Path(tempfile.mkdtemp(prefix="loms-tests-"))
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP_DIR / 'loms_test.db'}"
+os.environ["AUDIT_LOG_PATH"] = str(_TMP_DIR / "bounce_signals.jsonl")
+os.environ.setdefault("WATCHER_COORDINATION", "none")
+
+
+def reset_database() -> None:
+    """DB vuoto con lo schema corrente e stato in memoria dell'OMS ricaricato."""
+    from app.db import models  # noqa: F401  (registra i modelli su Base)
+    from app.db.migrations import upgrade_schema
+    from app.db.session import Base, SessionLocal, engine
+    from app.services.oms import load_in_memory_state
+    from app.services.signal_dedup import signal_response_cache
+
+    Base.metadata.drop_all(bind=engine)
+    upgrade_schema(engine)
+    signal_response_cache.clear()
+
+    db = SessionLocal()
+    try:
+        load_in_memory_state(db)
+    finally:
+        db.close()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _stop_logging():
+    # il listener dei log scrive sullo stdout catturato da pytest: va fermato
+    # prima che pytest lo chiuda (altrimenti fallisce l'atexit di stop_logging)
+    yield
+    from app.core.logging import stop_logging
+
+    stop_logging()
+
+
+@pytest.fixture
+def fresh_db():
+    """Resetta DB e stato in memoria; ritorna la funzione per rifarlo nel test."""
+    reset_database()
+    return reset_database
+
+
+@pytest.fixture
+def db(fresh_db):
+    from app.db.session import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client(fresh_db):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    # senza `with`: niente startup, quindi niente watcher/scheduler in background
+    return TestClient(app)
@@ -0,0 +1,102 @@
+"""
+Chiusura manuale e chiusura automatica (watcher) della stessa posizione:
+l'UPDATE condizionale (status = 'open') fa vincere solo la prima, senza
+doppio conteggio in /stats, nei rollup di /stats/timeseries e nei contatori.
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from app.api import positions as positions_api
+from app.db.models import PnlRollup, Position
+from app.db.session import SessionLocal
+from app.services.oms import _apply_closes
+from app.services.position_book import position_book
+from app.services.risk_counters import open_position_counters
+from app.services.stats_aggregator import StatsAccumulator, stats_accumulator
+
+
+def _open_position(client) -> dict:
+    resp = client.post(
+        "/signals/bounce",
+        json={"symbol": "BTCUSDT", "side": "long", "price": 2.0, "timestamp": "2025-01-01T12:00:00"},
+    )
+    body = resp.json()
+    assert body["risk_ok"] is True
+    return body
+
+
+def _tp_close(opened: dict) -> dict:
+    exit_price = opened["tp_price"]
+    return {
+        "pos_id": opened["position_id"],
+        "symbol": "BTCUSDT",
+        "side": "long",
+        "reason": "tp",
+        "entry": 2.0,
+        "exit": exit_price,
+        "pnl": exit_price - 2.0,
+        "qty": 1.0,
+    }
+
+
+def _watcher_close(close: dict) -> list[dict]:
+    with SessionLocal() as db:
+        return _apply_closes(db, [close], datetime.utcnow())
+
+
+def _assert_counted_once(reason: str, pnl: float) -> None:
+    with SessionLocal() as db:
+        pos = db.scalars(select(Position)).one()
+        rollup_trades = db.scalar(
+            select(func.sum(PnlRollup.trades)).where(PnlRollup.bucket == "1h")
+        )
+        rollup_pnl = db.scalar(select(func.sum(PnlRollup.pnl)).where(PnlRollup.bucket == "1h"))
+        from_db = StatsAccumulator().rebuild(db)
+
+    assert pos.status == "closed"
+    assert pos.auto_close_reason == reason
+    assert pos.pnl == pytest.approx(pnl)
+
+    assert rollup_trades == 1
+    assert rollup_pnl == pytest.approx(pnl)
+
+    # l'aggregato in memoria coincide con un ricalcolo completo dal DB
+    assert stats_accumulator.snapshot() == from_db
+    assert from_db["closed_positions"] == 1
+
+    assert open_position_counters.for_symbol("BTCUSDT") == 0
+    assert position_book.get(pos.id) is None
+
+
+def test_manual_close_after_watcher_close_keeps_tp(client, monkeypatch):
+    opened = _open_position(client)
+    close = _tp_close(opened)
+
+    def price_after_watcher_close(symbol: str) -> float:
+        # l'endpoint ha già letto la posizione come aperta: il watcher la
+        # chiude proprio ora, prima dell'UPDATE della chiusura manuale
+        assert _watcher_close(close) == [close]
+        return 1.5
+
+    monkeypatch.setattr(positions_api, "get_close_price", price_after_watcher_close)
+
+    resp = client.post(f"/positions/{opened['position_id']}/close")
+
+    assert resp.status_code == 200
+    assert resp.json()["auto_close_reason"] == "tp"
+    _assert_counted_once("tp", close["pnl"])
+
+
+def test_watcher_close_after_manual_close_is_skipped(client, monkeypatch):
+    opened = _open_position(client)
+    monkeypatch.setattr(positions_api, "get_close_price", lambda symbol: 1.5)
+
+    resp = client.post(f"/positions/{opened['position_id']}/close")
+    assert resp.json()["auto_close_reason"] == "manual"
+
+    # tick del watcher che aveva valutato il TP prima della chiusura manuale
+    assert _watcher_close(_tp_close(opened)) == []
+
+    _assert_counted_once("manual", 1.5 - 2.0)
@@ -0,0 +1,101 @@
+"""
+L'evaluator colonnare (position_columns) deve decidere esattamente come
+quello scalare del PositionBook: stesse posizioni, stesso motivo (TP vince
+su SL), stesso prezzo di uscita e PnL, stessa soglia di età MIN_AGE_SEC.
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.services.oms import evaluate_closes
+from app.services.position_book import MIN_AGE_SEC, BookEntry, PositionBook
+
+SYMBOLS = ("BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT")
+
+
+def _random_book(rng: random.Random, now: datetime, n: int) -> PositionBook:
+    book = PositionBook()
+    for pos_id in range(1, n + 1):
+        side = rng.choice(("long", "short"))
+        entry = round(rng.uniform(50, 150), 2)
+        sign = 1 if side == "long" else -1
+
+        tp = round(entry * (1 + sign * rng.uniform(0.0, 0.1)), 2)
+        sl = round(entry * (1 - sign * rng.uniform(0.0, 0.1)), 2)
+        if rng.random() < 0.15:
+            # soglie "incrociate": un prezzo può toccare TP e SL insieme
+            tp, sl = sl, tp
+
+        # età attorno a MIN_AGE_SEC, al microsecondo (e qualche created_at assente)
+        age = timedelta(seconds=MIN_AGE_SEC, microseconds=rng.randint(-3, 3))
+        if rng.random() < 0.5:
+            age = timedelta(seconds=rng.uniform(0, 3 * MIN_AGE_SEC))
+        created_at = None if rng.random() < 0.05 else now - age
+
+        book.add_entry(
+            BookEntry(
+                id=pos_id,
+                symbol=rng.choice(SYMBOLS),
+                side=side,
+                qty=round(rng.uniform(0.001, 5), 4),
+                entry_price=entry,
+                tp_price=None if rng.random() < 0.15 else tp,
+                sl_price=None if rng.random() < 0.15 else sl,
+                created_at=created_at,
+            )
+        )
+    return book
+
+
+def _random_prices(rng: random.Random, book: PositionBook) -> dict[str, float]:
+    levels = [
+        level
+        for entry in book.entries()
+        for level in (entry.tp_price, entry.sl_price, entry.entry_price)
+        if level is not None
+    ]
+    prices = {}
+    for symbol in rng.sample(SYMBOLS, rng.randint(1, len(SYMBOLS))):
+        # spesso esattamente su una soglia, per provare i confronti >= / <=
+        prices[symbol] = rng.choice(levels) if rng.random() < 0.5 else round(rng.uniform(40, 160), 2)
+    return prices
+
+
+def _closes(book, prices, now, evaluator, monkeypatch):
+    monkeypatch.setattr(settings, "AUTO_CLOSE_EVALUATOR", evaluator)
+    return evaluate_closes(book, prices, now)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_columnar_matches_book(seed, monkeypatch):
+    rng = random.Random(seed)
+    now = datetime(2025, 1, 1, 12, 0, 0) + timedelta(microseconds=rng.randint(0, 999_999))
+    book = _random_book(rng, now, rng.randint(1, 300))
+
+    for _ in range(5):
+        prices = _random_prices(rng, book)
+
+        expected = _closes(book, prices, now, "book", monkeypatch)
+        actual = _closes(book, prices, now, "columnar", monkeypatch)
+
+        assert [(c["pos_id"], c["reason"], c["exit"]) for c in actual] == [
+            (c["pos_id"], c["reason"], c["exit"]) for c in expected
+        ]
+        assert [c["pnl"] for c in actual] == pytest.approx([c["pnl"] for c in expected])
+
+
+def test_tp_wins_and_age_boundary_in_microseconds(monkeypatch):
+    now = datetime(2025, 1, 1, 12, 0, 0, 500_000)
+    book = PositionBook()
+    exactly_min_age = now - timedelta(seconds=MIN_AGE_SEC)
+    one_us_too_young = exactly_min_age + timedelta(microseconds=1)
+
+    # long con TP sotto lo SL: a 100 sono toccati entrambi, vince il TP
+    book.add_entry(BookEntry(1, "BTCUSDT", "long", 1.0, 100.0, 99.0, 101.0, exactly_min_age))
+    book.add_entry(BookEntry(2, "BTCUSDT", "long", 1.0, 100.0, 99.0, 101.0, one_us_too_young))
+
+    for evaluator in ("book", "columnar"):
+        closes = _closes(book, {"BTCUSDT": 100.0}, now, evaluator, monkeypatch)
+        assert [(c["pos_id"], c["reason"]) for c in closes] == [(1, "tp")]
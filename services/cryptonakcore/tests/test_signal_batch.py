@@ -0,0 +1,100 @@
+"""
+/signals/bounce/batch deve comportarsi come l'invio uno alla volta degli
+stessi segnali su /signals/bounce: stesse risposte (id compresi) e stesso
+stato finale del DB, con ripetuti (nel batch o già ricevuti) e blocchi
+di rischio.
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.db.models import Order, Position, SignalReceipt
+from app.db.session import SessionLocal
+from app.services.risk_counters import open_position_counters
+
+SYMBOLS = ("BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT")
+
+
+def _random_signals(rng: random.Random, n: int) -> list[dict]:
+    base_ts = datetime(2025, 1, 1, 12, 0, 0)
+    signals: list[dict] = []
+    for i in range(n):
+        if signals and rng.random() < 0.2:
+            # ripetuto di un segnale già inviato (nel batch o prima)
+            signals.append(dict(rng.choice(signals)))
+            continue
+        signal = {
+            "symbol": rng.choice(SYMBOLS),
+            # "hold" = side non valido; prezzi > 10 superano MAX_SIZE_PER_POSITION_USDT
+            "side": rng.choice(("long", "short", "buy", "sell", "hold")),
+            "price": rng.choice((1.5, 2.25, 4.0, 9.5, 12.0)),
+            "timestamp": (base_ts + timedelta(minutes=5 * i)).isoformat(),
+        }
+        if rng.random() < 0.3:
+            signal["signal_id"] = f"sig-{i}"
+        if rng.random() < 0.3:
+            signal["tp_pct"] = 3.0
+            signal["sl_pct"] = 1.0
+        signals.append(signal)
+    return signals
+
+
+def _db_state() -> dict:
+    def rows(model, skip=("created_at",)):
+        cols = [c.name for c in model.__table__.columns if c.name not in skip]
+        with SessionLocal() as db:
+            return [
+                tuple(getattr(obj, c) for c in cols)
+                for obj in db.scalars(select(model).order_by(model.id))
+            ]
+
+    return {
+        "orders": rows(Order),
+        "positions": rows(Position),
+        "receipts": rows(SignalReceipt),
+        "open_total": open_position_counters.total(),
+        "open_per_symbol": {s: open_position_counters.for_symbol(s) for s in SYMBOLS},
+    }
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_batch_matches_one_by_one(seed, client, fresh_db):
+    rng = random.Random(seed)
+    signals = _random_signals(rng, 40)
+    # una parte arriva prima, singolarmente: nel batch sono "già ricevuti"
+    split = rng.randint(0, 10)
+    before, rest = signals[:split], signals[split:]
+
+    def send_before():
+        return [client.post("/signals/bounce", json=s).json() for s in before]
+
+    sent_before = send_before()
+    one_by_one = [client.post("/signals/bounce", json=s).json() for s in rest]
+    expected_state = _db_state()
+
+    fresh_db()
+    assert send_before() == sent_before
+    resp = client.post("/signals/bounce/batch", json=rest)
+    assert resp.status_code == 200
+
+    assert resp.json() == one_by_one
+    assert _db_state() == expected_state
+
+    # rinviando lo stesso batch tornano le risposte originali, senza aprire nulla
+    assert client.post("/signals/bounce/batch", json=rest).json() == one_by_one
+    assert _db_state() == expected_state
+
+
+def test_batch_risk_limits_see_earlier_signals(client):
+    ts = datetime(2025, 1, 1, 12, 0, 0)
+    batch = [
+        {"symbol": "BTCUSDT", "side": "long", "price": 1.0, "timestamp": (ts + timedelta(minutes=i)).isoformat()}
+        for i in range(5)
+    ]
+
+    results = client.post("/signals/bounce/batch", json=batch).json()
+
+    assert [r["risk_ok"] for r in results] == [True, True, True, False, False]
+    assert open_position_counters.for_symbol("BTCUSDT") == 3
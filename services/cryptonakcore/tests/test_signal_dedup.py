@@ -0,0 +1,69 @@
+"""
+Idempotenza di /signals/bounce con invii concorrenti dello stesso segnale:
+una sola posizione e una sola ricevuta, e tutti ricevono la stessa risposta.
+"""
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from app.api.signals import BounceSignal, receive_bounce_signal
+from app.db.models import Order, Position, SignalReceipt
+from app.db.session import SessionLocal
+from app.services.risk_counters import open_position_counters
+from app.services.signal_dedup import signal_response_cache
+
+CONCURRENCY = 8
+
+
+def _post_concurrently(signal: BounceSignal, n: int = CONCURRENCY) -> list:
+    barrier = threading.Barrier(n)
+    results: list = [None] * n
+
+    def worker(i: int) -> None:
+        with SessionLocal() as db:
+            barrier.wait()
+            try:
+                results[i] = receive_bounce_signal(signal, db=db)
+            except Exception as exc:  # pragma: no cover - finisce nell'assert sotto
+                results[i] = exc
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def _count(model) -> int:
+    with SessionLocal() as db:
+        return db.scalar(select(func.count()).select_from(model))
+
+
+@pytest.mark.parametrize("signal_id", [None, "sig-concurrent-1"])
+def test_concurrent_duplicates_open_one_position(fresh_db, signal_id):
+    signal = BounceSignal(
+        symbol="BTCUSDT",
+        side="long",
+        price=2.0,
+        timestamp=datetime(2025, 1, 1, 12, 0, 0),
+        signal_id=signal_id,
+    )
+
+    for _ in range(5):
+        results = _post_concurrently(signal)
+
+        assert not [r for r in results if isinstance(r, Exception)]
+        assert all(r == results[0] for r in results), results
+        assert results[0]["risk_ok"] is True
+
+        assert _count(Position) == 1
+        assert _count(Order) == 1
+        assert _count(SignalReceipt) == 1
+        # gli slot prenotati dai ripetuti sono stati rilasciati
+        assert open_position_counters.for_symbol("BTCUSDT") == 1
+
+        # al giro successivo la risposta arriva dal DB (ricevuta), non dalla cache
+        signal_response_cache.clear()
@@ -0,0 +1,123 @@
+# tools/bench_auto_close_eval.py
+#
+# Benchmark della valutazione TP/SL di un tick: percorso "book" (soglie ordinate,
+# simbolo per simbolo) vs "columnar" (array NumPy, tutto il book insieme).
+#
+# Il book viene riempito con posizioni sintetiche (niente DB); per ogni tick si
+# genera un prezzo per simbolo e si confrontano le chiusure dei due percorsi
+# (id, reason, prezzo di uscita e PnL devono coincidere esattamente).
+#
+# Uso (dalla root della repo):
+#   python tools/bench_auto_close_eval.py --sizes 10,1000,100000 --ticks 50
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parents[1] / "services" / "cryptonakcore"
+sys.path.insert(0, str(SERVICE_DIR))
+
+from app.services.oms import compute_tp_sl  # noqa: E402
+from app.services.position_book import BookEntry, PositionBook  # noqa: E402
+
+
+def build_book(n: int, symbols: list[str], now: datetime, rng: random.Random) -> PositionBook:
+    book = PositionBook()
+    with book._lock:
+        for i in range(1, n + 1):
+            side = rng.choice(["long", "short", "long", "short", "flat"])
+            entry_price = rng.uniform(99.5, 100.5)
+            tp, sl = compute_tp_sl(side, entry_price, rng.uniform(1.0, 8.0), rng.uniform(0.5, 4.0))
+            if rng.random() < 0.05:
+                tp = None
+            if rng.random() < 0.05:
+                sl = None
+            created_at = now - timedelta(seconds=rng.uniform(0.0, 30.0))
+            book._add(
+                BookEntry(
+                    id=i,
+                    symbol=rng.choice(symbols),
+                    side=side,
+                    qty=rng.choice([0.5, 1.0, 2.0]),
+                    entry_price=entry_price,
+                    tp_price=tp,
+                    sl_price=sl,
+                    created_at=None if rng.random() < 0.02 else created_at,
+                )
+            )
+    return book
+
+
+def scalar_tick(book: PositionBook, prices: dict[str, float], now: datetime) -> list[tuple]:
+    out = []
+    for symbol, price in prices.items():
+        for entry, reason in book.triggered(symbol, price, now):
+            if entry.side == "long":
+                pnl = (price - entry.entry_price) * entry.qty
+            else:
+                pnl = (entry.entry_price - price) * entry.qty
+            out.append((entry.id, reason, price, pnl))
+    return out
+
+
+def columnar_tick(book: PositionBook, prices: dict[str, float], now: datetime) -> list[tuple]:
+    return [
+        (entry.id, reason, exit_price, pnl)
+        for entry, reason, exit_price, pnl in book.triggered_columnar(prices, now)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark valutazione auto-close")
+    parser.add_argument("--sizes", default="10,1000,100000")
+    parser.add_argument("--symbols", type=int, default=20)
+    parser.add_argument("--ticks", type=int, default=50)
+    parser.add_argument("--move", type=float, default=1.0, help="movimento max del prezzo (%%) per tick")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    symbols = [f"SYM{i}USDT" for i in range(args.symbols)]
+    now = datetime.utcnow()
+
+    print("===================================")
+    print(" CryptoNakCore LOMS - auto-close eval")
+    print("===================================\n")
+    print(f"{'positions':>10} {'book ms':>10} {'columnar ms':>12} {'speedup':>8} {'hits/tick':>10}")
+
+    for n in (int(x) for x in args.sizes.split(",")):
+        book = build_book(n, symbols, now, rng)
+        t_scalar, t_columnar, hits = [], [], []
+
+        for _ in range(args.ticks):
+            prices = {s: 100.0 * (1.0 + rng.uniform(-args.move, args.move) / 100.0) for s in symbols}
+
+            t0 = time.perf_counter()
+            expected = scalar_tick(book, prices, now)
+            t1 = time.perf_counter()
+            got = columnar_tick(book, prices, now)
+            t2 = time.perf_counter()
+
+            if got != expected:
+                raise SystemExit(f"MISMATCH con {n} posizioni: {len(got)} vs {len(expected)} chiusure")
+
+            t_scalar.append((t1 - t0) * 1000.0)
+            t_columnar.append((t2 - t1) * 1000.0)
+            hits.append(len(expected))
+
+        s_ms = statistics.median(t_scalar)
+        c_ms = statistics.median(t_columnar)
+        print(
+            f"{n:>10} {s_ms:>10.3f} {c_ms:>12.3f} {s_ms / c_ms if c_ms else 0.0:>7.1f}x "
+            f"{statistics.mean(hits):>10.1f}"
+        )
+
+    print("\nRisultati identici tra book e columnar su tutti i tick.")
+
+
+if __name__ == "__main__":
+    main()
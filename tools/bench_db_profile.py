@@ -0,0 +1,147 @@
+# tools/bench_db_profile.py
+#
+# Benchmark dell'ingest segnali con il profilo engine DB "default" vs "production".
+#
+# Per ogni profilo crea un DB SQLite scratch e simula l'ingest di /signals/bounce
+# (Order + Position, stesse operazioni ORM dell'endpoint) da più thread, mentre un
+# thread "watcher" legge le posizioni aperte in loop come farebbe l'auto-close.
+#
+# Uso (dalla root della repo):
+#   python tools/bench_db_profile.py --signals 2000 --writers 4
+
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parents[1] / "services" / "cryptonakcore"
+sys.path.insert(0, str(SERVICE_DIR))
+
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.db.models import Base, Order, Position  # noqa: E402
+from app.db.session import create_db_engine  # noqa: E402
+
+
+def ingest_one(Session, i: int) -> float:
+    started = time.perf_counter()
+    db = Session()
+    try:
+        entry = 5.0
+        order = Order(
+            symbol=f"SYM{i % 50}USDT",
+            side="long",
+            qty=1.0,
+            order_type="market",
+            tp_price=entry * 1.045,
+            sl_price=entry * 0.985,
+            status="created",
+        )
+        db.add(order)
+        db.commit()
+        db.refresh(order)
+
+        position = Position(
+            symbol=order.symbol,
+            side="long",
+            qty=1.0,
+            entry_price=entry,
+            tp_price=order.tp_price,
+            sl_price=order.sl_price,
+            status="open",
+        )
+        db.add(position)
+        db.commit()
+        db.refresh(position)
+    finally:
+        db.close()
+    return time.perf_counter() - started
+
+
+def run_profile(profile: str, n_signals: int, n_writers: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        engine = create_db_engine(url, profile)
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        latencies: list[float] = []
+        lock = threading.Lock()
+        counter = iter(range(n_signals))
+        stop = threading.Event()
+        reads = 0
+
+        def writer():
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                elapsed = ingest_one(Session, i)
+                with lock:
+                    latencies.append(elapsed)
+
+        def watcher():
+            nonlocal reads
+            while not stop.is_set():
+                db = Session()
+                try:
+                    db.query(Position).filter(Position.status == "open").all()
+                    reads += 1
+                finally:
+                    db.close()
+                time.sleep(0.01)
+
+        watcher_thread = threading.Thread(target=watcher)
+        watcher_thread.start()
+
+        started = time.perf_counter()
+        writers = [threading.Thread(target=writer) for _ in range(n_writers)]
+        for t in writers:
+            t.start()
+        for t in writers:
+            t.join()
+        wall = time.perf_counter() - started
+
+        stop.set()
+        watcher_thread.join()
+        engine.dispose()
+
+    latencies.sort()
+    return {
+        "profile": profile,
+        "signals": n_signals,
+        "writers": n_writers,
+        "wall_sec": wall,
+        "signals_per_sec": n_signals / wall,
+        "p50_ms": statistics.median(latencies) * 1000.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000.0,
+        "watcher_reads": reads,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark profili engine DB")
+    parser.add_argument("--signals", type=int, default=2000)
+    parser.add_argument("--writers", type=int, default=4)
+    args = parser.parse_args()
+
+    print("===================================")
+    print(" CryptoNakCore LOMS - DB profile bench")
+    print("===================================\n")
+
+    for profile in ("default", "production"):
+        r = run_profile(profile, args.signals, args.writers)
+        print(f"Profile        : {r['profile']}")
+        print(f"Signals/sec    : {r['signals_per_sec']:.1f}")
+        print(f"Latency p50    : {r['p50_ms']:.2f} ms")
+        print(f"Latency p99    : {r['p99_ms']:.2f} ms")
+        print(f"Watcher reads  : {r['watcher_reads']}")
+        print(f"Wall time      : {r['wall_sec']:.2f} s\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# tools/bench_ingest.py
+#
+# Load generator / benchmark di latenza dell'ingest segnali.
+#
+# Avvia l'app LOMS in-process (uvicorn in un thread) su un DB SQLite scratch e un
+# file audit temporaneo, poi invia BounceSignal a /signals/bounce al rate indicato
+# (open loop: l'invio i-esimo parte a t0 + i/rate, con al massimo --concurrency
+# richieste in volo). In parallelo legge /positions e /stats come farebbero una
+# dashboard o un bot. I segnali sono sintetici oppure presi da un file audit JSONL.
+#
+# Uso (dalla root della repo, con l'extra "bench" installato):
+#   python tools/bench_ingest.py --signals 2000 --rate 200 --concurrency 16
+#   python tools/bench_ingest.py --audit services/cryptonakcore/data/bounce_signals.jsonl \
+#       --rate 0 --json bench_ingest.json
+#
+# Output: throughput e latenze p50/p95/p99 per endpoint; con --json anche in
+# formato machine-readable (file o "-" per stdout).
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parents[1] / "services" / "cryptonakcore"
+sys.path.insert(0, str(SERVICE_DIR))
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+
+
+def percentile(sorted_values: list[float], pct: float) -> float | None:
+    """Percentile nearest-rank su una lista già ordinata."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+
+def summarize(name: str, latencies: list[float], errors: int, wall_sec: float) -> dict:
+    values = sorted(latencies)
+
+    def ms(v):
+        return round(v * 1000.0, 3) if v is not None else None
+
+    return {
+        "endpoint": name,
+        "requests": len(values) + errors,
+        "ok": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / wall_sec, 2) if wall_sec > 0 else None,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1] if values else None),
+    }
+
+
+# ---------- segnali ----------
+
+
+def synthetic_signals(n: int, n_symbols: int) -> list[dict]:
+    now = datetime.now(timezone.utc).isoformat()
+    return [
+        {
+            "symbol": f"SYM{i % n_symbols}USDT",
+            "side": "long" if i % 2 == 0 else "short",
+            # sotto MAX_SIZE_PER_POSITION_USDT (default 10) con qty 1
+            "price": 5.0,
+            "timestamp": now,
+            # id distinti: altrimenti l'idempotenza li tratterebbe come ripetuti
+            "signal_id": f"bench-{i}",
+        }
+        for i in range(n)
+    ]
+
+
+def recorded_signals(audit_path: Path, limit: int | None) -> list[dict]:
+    from app.services.export import audit_files, open_audit_file
+
+    out: list[dict] = []
+    for path in audit_files(audit_path):
+        with open_audit_file(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("type") == "bounce_signal" and entry.get("payload"):
+                    out.append(entry["payload"])
+                    if limit is not None and len(out) >= limit:
+                        return out
+    return out
+
+
+# ---------- server in-process ----------
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int) -> uvicorn.Server:
+    from app.main import app
+
+    # i log per richiesta dell'app falserebbero le latenze
+    logging.getLogger().setLevel(logging.WARNING)
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, name="bench-uvicorn", daemon=True)
+    thread.start()
+
+    deadline = time.monotonic() + 30.0
+    while not server.started:
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise SystemExit("server non avviato")
+        time.sleep(0.05)
+    server.bench_thread = thread
+    return server
+
+
+# ---------- carico ----------
+
+
+async def run_load(
+    base_url: str,
+    signals: list[dict],
+    rate: float,
+    concurrency: int,
+    read_rate: float,
+) -> dict:
+    results = {
+        "/signals/bounce": ([], [0]),
+        "/positions": ([], [0]),
+        "/stats": ([], [0]),
+    }
+    limits = httpx.Limits(max_connections=concurrency + 2, max_keepalive_connections=concurrency + 2)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+
+        async def call(endpoint: str, method: str, url: str, **kwargs) -> None:
+            latencies, errors = results[endpoint]
+            started = time.perf_counter()
+            try:
+                r = await client.request(method, url, **kwargs)
+                ok = r.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors[0] += 1
+
+        sem = asyncio.Semaphore(concurrency)
+
+        async def send(payload: dict) -> None:
+            try:
+                await call("/signals/bounce", "POST", "/signals/bounce", json=payload)
+            finally:
+                sem.release()
+
+        async def reader(endpoint: str, url: str, stop: asyncio.Event) -> None:
+            interval = 1.0 / read_rate
+            while not stop.is_set():
+                await call(endpoint, "GET", url)
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+
+        stop = asyncio.Event()
+        readers = []
+        if read_rate > 0:
+            readers = [
+                asyncio.create_task(reader("/positions", "/positions?limit=100", stop)),
+                asyncio.create_task(reader("/stats", "/stats", stop)),
+            ]
+
+        started = time.perf_counter()
+        tasks = []
+        for i, payload in enumerate(signals):
+            if rate > 0:
+                delay = started + i / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await sem.acquire()
+            tasks.append(asyncio.create_task(send(payload)))
+
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - started
+
+        stop.set()
+        await asyncio.gather(*readers)
+
+    return {
+        "wall_sec": round(wall, 3),
+        "endpoints": [
+            summarize(name, latencies, errors[0], wall)
+            for name, (latencies, errors) in results.items()
+        ],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark ingest segnali LOMS")
+    parser.add_argument("--signals", type=int, default=2000, help="numero di segnali (sintetici o max dall'audit)")
+    parser.add_argument("--audit", default=None, help="file audit JSONL da cui prendere i segnali")
+    parser.add_argument("--symbols", type=int, default=50, help="simboli dei segnali sintetici")
+    parser.add_argument("--rate", type=float, default=200.0, help="segnali/s (0 = il più veloce possibile)")
+    parser.add_argument("--concurrency", type=int, default=16, help="richieste /signals/bounce in volo")
+    parser.add_argument("--read-rate", type=float, default=5.0, help="GET/s su /positions e /stats (0 = no)")
+    parser.add_argument("--profile", default="production", help="DB_ENGINE_PROFILE (default / production)")
+    parser.add_argument("--max-open", type=int, default=1_000_000, help="MAX_OPEN_POSITIONS(_PER_SYMBOL)")
+    parser.add_argument("--json", default=None, help="scrive il risultato in JSON (file o '-')")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+
+    # env PRIMA di importare app.*: Settings, engine e audit li leggono all'import
+    os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmp.name) / 'bench.db'}"
+    os.environ["AUDIT_LOG_PATH"] = str(Path(tmp.name) / "audit.jsonl")
+    os.environ["DB_ENGINE_PROFILE"] = args.profile
+    os.environ["MAX_OPEN_POSITIONS"] = str(args.max_open)
+    os.environ["MAX_OPEN_POSITIONS_PER_SYMBOL"] = str(args.max_open)
+
+    if args.audit:
+        signals = recorded_signals(Path(args.audit), args.signals)
+    else:
+        signals = synthetic_signals(args.signals, args.symbols)
+
+    server = start_server(free_port())
+
+    try:
+        result = asyncio.run(
+            run_load(
+                f"http://127.0.0.1:{server.config.port}",
+                signals,
+                args.rate,
+                args.concurrency,
+                args.read_rate,
+            )
+        )
+    finally:
+        server.should_exit = True
+        server.bench_thread.join(timeout=10.0)
+        tmp.cleanup()
+
+    result["config"] = {
+        "signals": len(signals),
+        "source": args.audit or "synthetic",
+        "target_rate": args.rate,
+        "concurrency": args.concurrency,
+        "read_rate": args.read_rate,
+        "db_engine_profile": args.profile,
+    }
+
+    if args.json:
+        text = json.dumps(result, indent=2)
+        if args.json == "-":
+            print(text)
+            return
+        Path(args.json).write_text(text + "\n", encoding="utf-8")
+
+    print("===================================")
+    print(" CryptoNakCore LOMS - ingest bench")
+    print("===================================\n")
+    print(f"Signals    : {len(signals)} ({result['config']['source']})")
+    print(f"Target rate: {args.rate or 'max'} /s   concurrency={args.concurrency}")
+    print(f"Wall time  : {result['wall_sec']:.2f} s\n")
+    print(f"{'endpoint':<16} {'ok':>7} {'err':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for r in result["endpoints"]:
+        print(
+            f"{r['endpoint']:<16} {r['ok']:>7} {r['errors']:>5} {r['throughput_rps'] or 0:>9.1f} "
+            f"{r['p50_ms'] or 0:>9.2f} {r['p95_ms'] or 0:>9.2f} {r['p99_ms'] or 0:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# tools/bench_sharded_watcher.py
+#
+# Benchmark del watcher TP/SL in modalità "sharded" (POSITION_WATCHER_MODE=sharded).
+#
+# Riempie un PositionBook con posizioni sintetiche su molti simboli (niente DB),
+# poi misura quanti "simboli valutati al secondo" (tick di prezzo + valutazione
+# TP/SL) si ottengono:
+#   - nel processo corrente, come il watcher classico (riga "in-process")
+#   - con 1, 2, 4, ... processi shard che girano senza pausa tra i tick
+# TP/SL sono molto lontani dall'entry: si misura la valutazione, non le chiusure.
+# Lo speedup atteso è ~lineare nei core finché ci sono abbastanza simboli per shard.
+#
+# Uso (dalla root della repo):
+#   python tools/bench_sharded_watcher.py --symbols 500 --per-symbol 20 --shards 1,2,4
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parents[1] / "services" / "cryptonakcore"
+sys.path.insert(0, str(SERVICE_DIR))
+
+from app.services.market_simulator import MarketSimulatorEngine  # noqa: E402
+from app.services.oms import compute_tp_sl, evaluate_closes  # noqa: E402
+from app.services.position_book import BookEntry, PositionBook  # noqa: E402
+from app.services.shard_watcher import ShardedWatcher  # noqa: E402
+
+
+def build_book(n_symbols: int, per_symbol: int) -> PositionBook:
+    book = PositionBook()
+    pos_id = 0
+    for s in range(n_symbols):
+        for k in range(per_symbol):
+            pos_id += 1
+            side = "long" if k % 2 == 0 else "short"
+            tp, sl = compute_tp_sl(side, 100.0, 1000.0, 99.0)
+            book.add_entry(
+                BookEntry(
+                    id=pos_id,
+                    symbol=f"SYM{s}USDT",
+                    side=side,
+                    qty=1.0,
+                    entry_price=100.0,
+                    tp_price=tp,
+                    sl_price=sl,
+                    created_at=None,
+                )
+            )
+    return book
+
+
+def run_in_process(book: PositionBook, duration: float) -> float:
+    engine = MarketSimulatorEngine(seed=1)
+    symbols = book.symbols()
+    evaluated = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        prices = {symbol: engine.next_price(symbol) for symbol in symbols}
+        evaluate_closes(book, prices, datetime.utcnow())
+        evaluated += len(symbols)
+    return evaluated / (time.perf_counter() - started)
+
+
+def run_sharded(book: PositionBook, n_shards: int, duration: float, warmup: float) -> float:
+    watcher = ShardedWatcher()
+    watcher.start(book, n_shards, interval_sec=0.0)
+    try:
+        # warmup: avvio dei processi (spawn + import) e distribuzione del book
+        deadline = time.perf_counter() + warmup
+        while time.perf_counter() < deadline:
+            watcher.collect(0.1)
+
+        watcher.ticks = watcher.symbols_evaluated = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < duration:
+            watcher.collect(0.1)
+        return watcher.symbols_evaluated / (time.perf_counter() - started)
+    finally:
+        watcher.stop()
+        book.set_listener(None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark watcher TP/SL sharded")
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--per-symbol", type=int, default=20, help="posizioni aperte per simbolo")
+    parser.add_argument("--shards", default="1,2,4")
+    parser.add_argument("--duration", type=float, default=5.0, help="secondi di misura per riga")
+    parser.add_argument("--warmup", type=float, default=3.0, help="secondi di avvio shard esclusi")
+    args = parser.parse_args()
+
+    book = build_book(args.symbols, args.per_symbol)
+
+    print("===================================")
+    print(" CryptoNakCore LOMS - sharded watcher")
+    print("===================================\n")
+    print(f"Symbols: {args.symbols}  positions: {len(book)}  cores: {os.cpu_count()}\n")
+    print(f"{'mode':<12} {'symbols/s':>12} {'speedup':>8}")
+
+    base = run_in_process(book, args.duration)
+    print(f"{'in-process':<12} {base:>12.0f} {1.0:>7.2f}x")
+
+    for n in (int(x) for x in args.shards.split(",")):
+        rate = run_sharded(book, n, args.duration, args.warmup)
+        print(f"{f'{n} shard(s)':<12} {rate:>12.0f} {rate / base if base else 0.0:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# tools/replay_signals.py
+#
+# Replay offline dei segnali salvati nel file audit JSONL su una serie storica
+# di prezzi (CSV o Parquet), con le stesse regole di rischio / TP / SL del LOMS.
+# Stampa le stesse metriche di /stats.
+#
+# Uso (dalla root della repo, con l'extra "backtest" installato):
+#   python tools/replay_signals.py \
+#       --audit services/cryptonakcore/data/bounce_signals_paper.jsonl \
+#       --prices data/prices_5m.csv
+#
+# Il CSV prezzi deve avere le colonne timestamp, symbol, price (o close),
+# opzionalmente high/low per valutare TP/SL sulle candele.
+
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parents[1] / "services" / "cryptonakcore"
+sys.path.insert(0, str(SERVICE_DIR))
+
+from app.api.signals import DEFAULT_QTY, DEFAULT_SL_PCT, DEFAULT_TP_PCT  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.services.replay import (  # noqa: E402
+    ReplayConfig,
+    load_prices,
+    load_signals,
+    replay,
+)
+
+
+def format_float(x) -> str:
+    if x is None:
+        return "-"
+    return f"{x:.4f}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay segnali LOMS su prezzi storici")
+    parser.add_argument("--audit", default=settings.AUDIT_LOG_PATH, help="file audit JSONL")
+    parser.add_argument("--prices", required=True, help="CSV o Parquet con i prezzi")
+    parser.add_argument("--tp-pct", type=float, default=DEFAULT_TP_PCT)
+    parser.add_argument("--sl-pct", type=float, default=DEFAULT_SL_PCT)
+    parser.add_argument("--max-open", type=int, default=settings.MAX_OPEN_POSITIONS)
+    parser.add_argument(
+        "--max-open-per-symbol", type=int, default=settings.MAX_OPEN_POSITIONS_PER_SYMBOL
+    )
+    parser.add_argument("--json", action="store_true", help="output JSON")
+    args = parser.parse_args()
+
+    # i risk_block per singolo segnale non interessano qui
+    logging.getLogger("oms").setLevel(logging.WARNING)
+
+    t0 = time.perf_counter()
+    signals = load_signals(Path(args.audit))
+    prices = load_prices(Path(args.prices))
+    t1 = time.perf_counter()
+
+    result = replay(
+        signals,
+        prices,
+        ReplayConfig(
+            default_tp_pct=args.tp_pct,
+            default_sl_pct=args.sl_pct,
+            qty=DEFAULT_QTY,
+            max_open_positions=args.max_open,
+            max_open_positions_per_symbol=args.max_open_per_symbol,
+        ),
+    )
+    t2 = time.perf_counter()
+
+    if args.json:
+        print(json.dumps(result.as_dict(), indent=2))
+        return
+
+    stats = result.stats
+
+    print("===================================")
+    print(" CryptoNakCore LOMS - Replay")
+    print("===================================\n")
+
+    print(f"Signals         : {result.signals}")
+    print(f"Accepted        : {result.accepted}")
+    print(f"Risk blocks     : {dict(result.risk_blocks)}")
+    print(f"Invalid side    : {result.invalid_side}")
+    print(f"No prices       : {result.no_prices}")
+    print(f"Still open      : {result.still_open}\n")
+
+    print(f"Total positions : {stats['total_positions']}")
+    print(f"Closed positions: {stats['closed_positions']}")
+    print(f"Winning trades  : {stats['winning_trades']}")
+    print(f"Losing trades   : {stats['losing_trades']}")
+    print(f"TP count        : {stats['tp_count']}")
+    print(f"SL count        : {stats['sl_count']}\n")
+
+    print(f"Total PnL       : {format_float(stats['total_pnl'])}")
+    print(f"Winrate (%)     : {format_float(stats['winrate'])}")
+    print(f"Avg PnL/trade   : {format_float(stats['avg_pnl_per_trade'])}")
+    print(f"Avg PnL win     : {format_float(stats['avg_pnl_win'])}")
+    print(f"Avg PnL loss    : {format_float(stats['avg_pnl_loss'])}\n")
+
+    print(f"Load time       : {t1 - t0:.2f} s")
+    print(f"Replay time     : {t2 - t1:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# tools/sweep_tp_sl.py
+#
+# Sweep di TP% / SL% (e opzionalmente MAX_OPEN_POSITIONS / _PER_SYMBOL) sui segnali
+# registrati nel file audit, con replay su prezzi storici in un pool di processi.
+# Scrive una tabella CSV ordinata per la metrica scelta.
+#
+# Uso (dalla root della repo, con l'extra "backtest" installato):
+#   python tools/sweep_tp_sl.py --prices data/prices_5m.csv \
+#       --tp 1:10:0.5 --sl 0.5:5:0.25 --out sweep_results.csv
+#
+# Le griglie accettano "start:stop:step" (stop incluso) oppure una lista "1,2,3".
+
+import argparse
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parents[1] / "services" / "cryptonakcore"
+sys.path.insert(0, str(SERVICE_DIR))
+
+from app.api.signals import DEFAULT_QTY, DEFAULT_SL_PCT, DEFAULT_TP_PCT  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.services.replay import ReplayConfig, load_prices, load_signals  # noqa: E402
+from app.services.sweep import build_grid, run_sweep, write_results  # noqa: E402
+
+
+def parse_grid(text: str, cast=float) -> list:
+    if ":" in text:
+        start, stop, step = (float(x) for x in text.split(":"))
+        n = int(round((stop - start) / step)) + 1
+        return [cast(round(start + i * step, 10)) for i in range(n)]
+    return [cast(x) for x in text.split(",") if x.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sweep TP/SL sui segnali LOMS")
+    parser.add_argument("--audit", default=settings.AUDIT_LOG_PATH, help="file audit JSONL")
+    parser.add_argument("--prices", required=True, help="CSV o Parquet con i prezzi")
+    parser.add_argument("--tp", default=str(DEFAULT_TP_PCT), help="griglia TP%%")
+    parser.add_argument("--sl", default=str(DEFAULT_SL_PCT), help="griglia SL%%")
+    parser.add_argument("--max-open", default=str(settings.MAX_OPEN_POSITIONS))
+    parser.add_argument(
+        "--max-open-per-symbol", default=str(settings.MAX_OPEN_POSITIONS_PER_SYMBOL)
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--rank-by", default="total_pnl")
+    parser.add_argument("--out", default="sweep_results.csv")
+    parser.add_argument("--top", type=int, default=10, help="righe da stampare")
+    args = parser.parse_args()
+
+    logging.getLogger("oms").setLevel(logging.WARNING)
+
+    t0 = time.perf_counter()
+    signals = load_signals(Path(args.audit))
+    prices = load_prices(Path(args.prices))
+    t1 = time.perf_counter()
+
+    grid = build_grid(
+        parse_grid(args.tp),
+        parse_grid(args.sl),
+        parse_grid(args.max_open, int),
+        parse_grid(args.max_open_per_symbol, int),
+    )
+    base = ReplayConfig(
+        default_tp_pct=DEFAULT_TP_PCT,
+        default_sl_pct=DEFAULT_SL_PCT,
+        qty=DEFAULT_QTY,
+    )
+
+    rows = run_sweep(signals, prices, grid, base, workers=args.workers, rank_by=args.rank_by)
+    t2 = time.perf_counter()
+
+    write_results(rows, Path(args.out))
+
+    print("===================================")
+    print(" CryptoNakCore LOMS - TP/SL sweep")
+    print("===================================\n")
+    print(f"Signals    : {len(signals)}")
+    print(f"Grid points: {len(grid)}  (workers={args.workers})")
+    print(f"Load time  : {t1 - t0:.2f} s")
+    print(f"Sweep time : {t2 - t1:.2f} s")
+    print(f"Results    : {args.out}\n")
+
+    print(f"Top {args.top} by {args.rank_by}:")
+    for row in rows[: args.top]:
+        print(
+            f"  #{row['rank']:<3} tp={row['tp_pct']:<6} sl={row['sl_pct']:<6} "
+            f"max_open={row['max_open_positions']} per_symbol={row['max_open_positions_per_symbol']}  "
+            f"pnl={row.get('total_pnl', 0.0):.4f} winrate={row.get('winrate', 0.0):.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()